@@ -0,0 +1,124 @@
+"""Agent 池持久化任务存储：用 SQLite（WAL）保存待执行任务描述（任务名 + JSON 参数），重启后重放。"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import time
+from typing import Any
+import json
+import os
+import sqlite3
+import threading
+
+
+class AgentJobStore:
+    """
+    只保存可序列化的任务描述，不保存 callable：
+    - job_key：主键（池任务为 task_id；工作流自己的待发送状态用业务键，如 `auto_reply:pending:group:123`）
+    - job_name：register_durable_job 注册的处理函数名
+    - args：处理函数的关键字参数（JSON）
+    enqueue_save / enqueue_delete 只在调用线程里做 JSON 编码，SQLite 写入交给单个写线程按提交顺序执行：
+    事件循环（以及持有工作流状态锁的调用方）不等磁盘 I/O，同一 job_key 的写入 / 删除也不会乱序。
+    save / delete / load_all 为同步版本，只在启动重放等非热路径使用。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AgentJobStoreWriter")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS agent_jobs (
+                job_key TEXT PRIMARY KEY,
+                job_name TEXT NOT NULL,
+                args TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 7,
+                agent_name TEXT NOT NULL DEFAULT 'default',
+                created_at REAL NOT NULL
+            )
+            """
+        )
+
+    def save(
+        self,
+        job_key: str,
+        job_name: str,
+        args: dict[str, Any],
+        *,
+        priority: int = 7,
+        agent_name: str = "default",
+    ) -> None:
+        self._insert(job_key, job_name, json.dumps(args, ensure_ascii=False), int(priority), agent_name, time())
+
+    def _insert(self, job_key: str, job_name: str, encoded: str, priority: int, agent_name: str, created_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO agent_jobs (job_key, job_name, args, priority, agent_name, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_key, job_name, encoded, priority, agent_name, created_at),
+            )
+
+    def enqueue_save(
+        self,
+        job_key: str,
+        job_name: str,
+        args: dict[str, Any],
+        *,
+        priority: int = 7,
+        agent_name: str = "default",
+    ) -> Future:
+        """save 的非阻塞版本：args 无法 JSON 序列化时立即抛出 TypeError / ValueError，写入结果见返回的 Future。"""
+        encoded = json.dumps(args, ensure_ascii=False)
+        return self._writer.submit(self._insert, job_key, job_name, encoded, int(priority), agent_name, time())
+
+    def delete(self, job_key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM agent_jobs WHERE job_key = ?", (job_key,))
+
+    def enqueue_delete(self, job_key: str) -> Future:
+        """delete 的非阻塞版本，与之前提交的 enqueue_save 按顺序执行。"""
+        return self._writer.submit(self.delete, job_key)
+
+    def load_all(self) -> list[dict[str, Any]]:
+        """按 priority -> 创建时间返回全部任务描述（args 已解码；无法解码的行直接删除）。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_key, job_name, args, priority, agent_name, created_at "
+                "FROM agent_jobs ORDER BY priority, created_at"
+            ).fetchall()
+        jobs: list[dict[str, Any]] = []
+        for job_key, job_name, args, priority, agent_name, created_at in rows:
+            try:
+                decoded = json.loads(args)
+            except json.JSONDecodeError:
+                self.delete(job_key)
+                continue
+            if not isinstance(decoded, dict):
+                self.delete(job_key)
+                continue
+            jobs.append(
+                {
+                    "job_key": job_key,
+                    "job_name": job_name,
+                    "args": decoded,
+                    "priority": priority,
+                    "agent_name": agent_name,
+                    "created_at": created_at,
+                }
+            )
+        return jobs
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM agent_jobs").fetchone()[0])
+
+    def close(self) -> None:
+        """等写线程把已提交的写入执行完再关闭连接。"""
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
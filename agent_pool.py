@@ -1,68 +1,397 @@
 import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import contextvars
+from dataclasses import dataclass
+import functools
 import heapq
 import inspect
+import io
+import itertools
 import logging
-from time import time
-from typing import Any, Callable, List, Optional
+import math
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import threading
+from time import perf_counter, time
+import traceback
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Sequence
+import json
 import uuid
 
+from agent_job_store import AgentJobStore
+from workflows.agent_config_loader import load_agent_config_from_dir
+from workflows.agent_observe import observe_agent_event
+
 logger = logging.getLogger(__name__)
+
+AGENT_POOL_CONFIG = load_agent_config_from_dir(
+    os.path.basename(__file__),
+    config_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflows"),
+)
+
+DEFAULT_AGENT_NAME = "default"
+_CONTROL_AGENT_NAME = "__pool__"
+# task_id：进程内单调递增计数 + 启动时生成的前缀（避免与上次运行遗留的持久化记录重名）
+_TASK_ID_PREFIX = uuid.uuid4().hex[:4]
+_task_ids = itertools.count(1)
 
 # ----------------------------------------------------------------------
 # 优先级队列核心（线程安全）
 # ----------------------------------------------------------------------
 class Task:
-    __slots__ = ('priority', 'data', 'timestamp', 'order', 'task_id', 'future')
+    __slots__ = (
+        'priority', 'effective_priority', 'data', 'timestamp', 'order', 'task_id', 'future', 'agent_name',
+        'deadline', 'cancelled', 'lane', 'attempt', 'retry', 'run_id',
+        'dequeued_at', 'started_at', 'thread_started_at', 'thread_ident', 'worker_id', 'spans', 'hung',
+    )
 
-    def __init__(self, priority: int, data: Any, future: Optional[asyncio.Future] = None):
+    def __init__(
+        self,
+        priority: int,
+        data: Any,
+        future: Optional[asyncio.Future] = None,
+        agent_name: str = DEFAULT_AGENT_NAME,
+        deadline: Optional[float] = None,
+        lane: str = "",
+    ):
         if not 0 <= priority <= 15:
             raise ValueError("priority must be 0-15")
         self.priority = priority
+        self.effective_priority = priority
         self.data = data
         self.timestamp = time()
         self.order = 0
-        self.task_id = uuid.uuid4().hex[:8]
+        self.task_id = f"{_TASK_ID_PREFIX}-{next(_task_ids)}"
         self.future = future
+        self.agent_name = str(agent_name or DEFAULT_AGENT_NAME)
+        self.deadline = deadline
+        self.cancelled = False
+        self.lane = lane
+        self.attempt = 1
+        self.retry: Optional[AgentRetryPolicy] = None
+        self.run_id = ""
+        self.hung = False
+        self.reset_spans()
+
+    def reset_spans(self) -> None:
+        """清空本次尝试的执行时间点与节点 span（重试重新入队时调用）。"""
+        self.dequeued_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.thread_started_at: Optional[float] = None
+        self.thread_ident: Optional[int] = None
+        self.worker_id = -1
+        self.spans: list[tuple[str, float, float, str]] = []
+
+    def abandon_reason(self) -> str:
+        """调用方已不再等待结果时返回原因（hung / cancelled / expired），否则返回空串。"""
+        if self.hung:
+            return "hung"
+        if self.cancelled or (self.future is not None and self.future.cancelled()):
+            return "cancelled"
+        if self.deadline is not None and time() >= self.deadline:
+            return "expired"
+        return ""
 
     def __lt__(self, other: 'Task') -> bool:
-        if self.priority != other.priority:
-            return self.priority < other.priority
+        if self.effective_priority != other.effective_priority:
+            return self.effective_priority < other.effective_priority
         return self.order < other.order
 
 
 class PriorityScheduler:
-    def __init__(self, maxsize: int = 0):
+    """
+    impl=heap：每个调度类一个二叉堆，所有操作在 asyncio.Condition 下进行
+    - strict：所有任务共用一个堆，严格按 priority -> 入队顺序出队
+    - fair_share：按 task.agent_name 分类，类间按权重做 deficit round robin，
+      类内仍按 priority -> 入队顺序出队
+    - aging_steps：长度 16，第 i 项为 priority=i 的任务每等待多少秒有效优先级提升 1 级（0 表示不老化），
+      堆按 effective_priority 排序，出队前按 aging_refresh_seconds 周期重算并重建堆
+    - shed_policy：队列满时的处理方式
+        - reject：拒绝新任务（抛 QueueFull）
+        - priority：先淘汰已过期/已取消的任务（最早入队的优先），否则淘汰有效优先级最低（同级取最新入队）
+          且低于新任务的排队任务；都不满足时仍拒绝新任务。被淘汰的任务由 put 返回给调用方处理
+    - lane：任务带车道时调度类按 (lane, 类名) 区分，pop(allowed) 只取 allowed(lane) 为真的任务
+      （车道的预留/上限由 Agent 池判断，调度器只负责按谓词过滤）
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        *,
+        mode: str = "strict",
+        weights: Optional[dict[str, float]] = None,
+        default_weight: float = 1.0,
+        aging_steps: Optional[list[float]] = None,
+        aging_refresh_seconds: float = 1.0,
+        shed_policy: str = "reject",
+    ):
+        self.impl = "heap"
+        if mode not in {"strict", "fair_share"}:
+            raise ValueError("mode must be 'strict' or 'fair_share'")
+        if shed_policy not in {"reject", "priority"}:
+            raise ValueError("shed_policy must be 'reject' or 'priority'")
+        if default_weight <= 0:
+            raise ValueError("default_weight must be > 0")
         self.maxsize = maxsize
-        self._queue: list[Task] = []
+        self.mode = mode
+        self.shed_policy = shed_policy
+        self.weights = {str(name): float(weight) for name, weight in (weights or {}).items() if float(weight) > 0}
+        self.default_weight = float(default_weight)
+        steps = list(aging_steps or [])
+        if steps and len(steps) != 16:
+            raise ValueError("aging_steps must have 16 entries")
+        self.aging_steps = [max(float(step), 0.0) for step in steps] if steps else [0.0] * 16
+        self.aging_enabled = any(step > 0 for step in self.aging_steps)
+        self.aging_refresh_seconds = max(float(aging_refresh_seconds), 0.0)
+        self._last_aging_refresh = 0.0
+        self._aged_pops = 0
+        self._max_aging_boost = 0
+        self._max_wait_seconds = 0.0
+        self._queues: dict[str, list[Task]] = {}
+        self._active: deque[str] = deque()
+        self._deficits: dict[str, float] = {}
+        self._served: dict[str, int] = {}
+        self._control: deque[Task] = deque()
+        self._class_lanes: dict[str, str] = {}
+        self._class_weight_names: dict[str, str] = {}
+        self._lane_sizes: dict[str, int] = {}
+        self._selective_waiters = 0
+        self._kicks: set[asyncio.Task] = set()
+        self._size = 0
         self._counter = 0
         self._lock = asyncio.Lock()
         self._not_empty = asyncio.Condition(self._lock)
         self._closed = False
 
-    async def put(self, task: Task) -> None:
-        async with self._not_empty:
-            if self._closed:
-                raise RuntimeError("scheduler is closed")
-            if self.maxsize > 0 and len(self._queue) >= self.maxsize:
+    def _class_of(self, task: Task) -> str:
+        name = task.agent_name if self.mode == "fair_share" else DEFAULT_AGENT_NAME
+        return f"{task.lane}/{name}" if task.lane else name
+
+    def _weight_of(self, class_name: str) -> float:
+        return self.weights.get(self._class_weight_names.get(class_name, class_name), self.default_weight)
+
+    # 每个调度类内部的队列结构（子类可替换）：这里是按 (effective_priority, order) 排序的堆
+    def _new_queue(self) -> Any:
+        return []
+
+    def _queue_push(self, queue: Any, task: Task) -> None:
+        heapq.heappush(queue, task)
+
+    def _queue_pop(self, queue: Any) -> Task:
+        return heapq.heappop(queue)
+
+    def _queue_peek(self, queue: Any) -> Task:
+        return queue[0]
+
+    def _queue_remove(self, queue: Any, task: Task) -> None:
+        queue.remove(task)
+        heapq.heapify(queue)
+
+    def _queue_reorder(self, queue: Any) -> None:
+        heapq.heapify(queue)
+
+    def _push(self, task: Task) -> None:
+        if task.agent_name == _CONTROL_AGENT_NAME:
+            self._control.append(task)
+            return
+        class_name = self._class_of(task)
+        queue = self._queues.get(class_name)
+        if queue is None:
+            queue = self._queues[class_name] = self._new_queue()
+            self._class_lanes[class_name] = task.lane
+            self._class_weight_names[class_name] = task.agent_name
+        self._lane_sizes[task.lane] = self._lane_sizes.get(task.lane, 0) + 1
+        if not queue:
+            self._active.append(class_name)
+            self._deficits[class_name] = 0.0
+        self._queue_push(queue, task)
+        self._size += 1
+
+    def _refresh_aging(self, now: float) -> None:
+        if not self.aging_enabled or now - self._last_aging_refresh < self.aging_refresh_seconds:
+            return
+        self._last_aging_refresh = now
+        for queue in self._queues.values():
+            changed = False
+            for task in queue:
+                step = self.aging_steps[task.priority]
+                if step <= 0:
+                    continue
+                aged = max(task.priority - int((now - task.timestamp) // step), 0)
+                if aged != task.effective_priority:
+                    task.effective_priority = aged
+                    changed = True
+            if changed:
+                self._queue_reorder(queue)
+
+    def _record_pop(self, task: Task, now: float) -> None:
+        self._max_wait_seconds = max(self._max_wait_seconds, now - task.timestamp)
+        boost = task.priority - task.effective_priority
+        if boost > 0:
+            self._aged_pops += 1
+            self._max_aging_boost = max(self._max_aging_boost, boost)
+
+    def _has_ready(self, allowed: Optional[Callable[[str], bool]]) -> bool:
+        if self._control:
+            return True
+        if allowed is None:
+            return self._size > 0
+        return any(size > 0 and allowed(lane) for lane, size in self._lane_sizes.items())
+
+    def _take(self, class_name: str, now: float) -> Task:
+        queue = self._queues[class_name]
+        task = self._queue_pop(queue)
+        if not queue:
+            if self._active[0] == class_name:
+                self._active.popleft()
+            else:
+                self._active.remove(class_name)
+            self._deficits[class_name] = 0.0
+        self._size -= 1
+        self._lane_sizes[task.lane] -= 1
+        self._served[class_name] = self._served.get(class_name, 0) + 1
+        self._record_pop(task, now)
+        if self._closed and not self._size and self._selective_waiters:
+            # 已关闭且取空：让还在按车道等待的 Worker 退出
+            self._wake_waiters()
+        return task
+
+    def _wake_waiters(self) -> None:
+        self._not_empty.notify_all()
+
+    def _pop_next(self, allowed: Optional[Callable[[str], bool]] = None) -> Task:
+        """调用方须保证 _has_ready(allowed) 为真。"""
+        if self._control:
+            return self._control.popleft()
+        now = time()
+        self._refresh_aging(now)
+        if self.mode == "strict" and len(self._active) > 1:
+            # 多个车道各有一个类：在允许的类里取队首最优的任务
+            candidates = [
+                name for name in self._active if allowed is None or allowed(self._class_lanes[name])
+            ]
+            best = min(candidates, key=lambda name: self._queue_peek(self._queues[name]))
+            return self._take(best, now)
+        while True:
+            class_name = self._active[0]
+            if allowed is not None and not allowed(self._class_lanes[class_name]):
+                self._active.rotate(-1)
+                continue
+            if self.mode == "strict" or self._deficits[class_name] >= 1.0:
+                if self.mode == "fair_share":
+                    self._deficits[class_name] -= 1.0
+                return self._take(class_name, now)
+            self._deficits[class_name] += self._weight_of(class_name)
+            self._active.rotate(-1)
+
+    def _pick_victim(self, incoming: Task) -> Optional[Task]:
+        expired: Optional[Task] = None
+        lowest: Optional[Task] = None
+        for queue in self._queues.values():
+            for task in queue:
+                if task.abandon_reason():
+                    if expired is None or task.order < expired.order:
+                        expired = task
+                elif lowest is None or (task.effective_priority, task.order) > (lowest.effective_priority, lowest.order):
+                    lowest = task
+        if expired is not None:
+            return expired
+        if lowest is not None and lowest.effective_priority > incoming.priority:
+            return lowest
+        return None
+
+    def _remove(self, task: Task) -> None:
+        class_name = self._class_of(task)
+        queue = self._queues[class_name]
+        self._queue_remove(queue, task)
+        if not queue:
+            self._active.remove(class_name)
+            self._deficits[class_name] = 0.0
+        self._size -= 1
+        self._lane_sizes[task.lane] -= 1
+
+    def _enqueue(self, task: Task) -> Optional[Task]:
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        victim: Optional[Task] = None
+        if self.maxsize > 0 and self._size >= self.maxsize and task.agent_name != _CONTROL_AGENT_NAME:
+            if self.shed_policy == "priority":
+                victim = self._pick_victim(task)
+            if victim is None:
                 raise asyncio.QueueFull()
+            self._remove(victim)
+        task.order = self._counter
+        self._counter += 1
+        self._push(task)
+        return victim
+
+    def _enqueue_many(self, tasks: Sequence[Task]) -> None:
+        """批量入队：容量不足时整体拒绝（不淘汰其它任务），保证一批任务要么全部入队要么都不入队。"""
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        if self.maxsize > 0 and self._size + len(tasks) > self.maxsize:
+            raise asyncio.QueueFull()
+        for task in tasks:
             task.order = self._counter
             self._counter += 1
-            heapq.heappush(self._queue, task)
-            self._not_empty.notify()
+            self._push(task)
+
+    async def put(self, task: Task) -> Optional[Task]:
+        """入队；shed_policy=priority 且队列已满时返回被淘汰的任务（由调用方通知其 future）。"""
+        async with self._not_empty:
+            victim = self._enqueue(task)
+            self._notify(1)
+            return victim
+
+    async def put_many(self, tasks: Sequence[Task]) -> None:
+        async with self._not_empty:
+            self._enqueue_many(tasks)
+            self._notify(len(tasks))
 
-    async def pop(self) -> Task | None:
+    def _notify(self, count: int) -> None:
+        # 有按车道过滤的等待者时，被唤醒的那个未必能取这个任务，只能全部唤醒各自重新判断
+        if self._selective_waiters:
+            self._not_empty.notify_all()
+        else:
+            self._not_empty.notify(count)
+
+    async def pop(self, allowed: Optional[Callable[[str], bool]] = None) -> Task | None:
+        """出队；allowed 为车道谓词（None 表示不过滤）。关闭后队列取空才返回 None。"""
         async with self._not_empty:
-            while not self._queue:
-                if self._closed:
+            while not self._has_ready(allowed):
+                if self._closed and not self._size:
                     return None
-                await self._not_empty.wait()
-            return heapq.heappop(self._queue)
+                if allowed is not None:
+                    self._selective_waiters += 1
+                try:
+                    await self._not_empty.wait()
+                finally:
+                    if allowed is not None:
+                        self._selective_waiters -= 1
+            return self._pop_next(allowed)
+
+    async def _notify_all(self) -> None:
+        async with self._not_empty:
+            self._not_empty.notify_all()
+
+    def kick(self) -> None:
+        """车道容量释放（任务完成）时唤醒按车道过滤的等待者重新判断；可在同步回调中调用。"""
+        if not self._selective_waiters:
+            return
+        kick = asyncio.get_running_loop().create_task(self._notify_all())
+        self._kicks.add(kick)
+        kick.add_done_callback(self._kicks.discard)
 
     async def drain(self) -> list[Task]:
         async with self._not_empty:
             drained: list[Task] = []
-            while self._queue:
-                drained.append(heapq.heappop(self._queue))
+            while self._size or self._control:
+                drained.append(self._pop_next())
             return drained
 
     async def close(self) -> None:
@@ -70,47 +399,1130 @@ class PriorityScheduler:
             self._closed = True
             self._not_empty.notify_all()
 
-    def qsize(self): return len(self._queue)
-    def empty(self): return len(self._queue) == 0
-    def full(self): return self.maxsize > 0 and len(self._queue) >= self.maxsize
+    def stats(self) -> dict[str, Any]:
+        classes = set(self._queues) | set(self._served)
+        return {
+            "impl": self.impl,
+            "mode": self.mode,
+            "qsize": self._size,
+            "maxsize": self.maxsize,
+            "shed_policy": self.shed_policy,
+            "classes": {
+                name: {
+                    "queued": len(self._queues.get(name, [])),
+                    "served": self._served.get(name, 0),
+                    "weight": self._weight_of(name),
+                    "deficit": round(self._deficits.get(name, 0.0), 3),
+                }
+                for name in sorted(classes)
+            },
+            "aging": {
+                "enabled": self.aging_enabled,
+                "steps": {str(priority): step for priority, step in enumerate(self.aging_steps) if step > 0},
+                "aged_pops": self._aged_pops,
+                "max_boost": self._max_aging_boost,
+                "max_wait_seconds": round(self._max_wait_seconds, 3),
+            },
+        }
+
+    def lane_size(self, lane: str) -> int:
+        return self._lane_sizes.get(lane, 0)
+
+    def qsize(self): return self._size
+    def empty(self): return self._size == 0
+    def full(self): return self.maxsize > 0 and self._size >= self.maxsize
+
+
+class _PriorityBuckets:
+    """16 个 FIFO deque + 非空位图：push/pop 均为 O(1)（最低置位即当前最高优先级）。"""
+
+    __slots__ = ("buckets", "mask", "size")
+
+    def __init__(self):
+        self.buckets: list[deque[Task]] = [deque() for _ in range(16)]
+        self.mask = 0
+        self.size = 0
+
+    def push(self, task: Task) -> None:
+        priority = task.effective_priority
+        self.buckets[priority].append(task)
+        self.mask |= 1 << priority
+        self.size += 1
+
+    def peek(self) -> Task:
+        return self.buckets[(self.mask & -self.mask).bit_length() - 1][0]
+
+    def pop(self) -> Task:
+        priority = (self.mask & -self.mask).bit_length() - 1
+        bucket = self.buckets[priority]
+        task = bucket.popleft()
+        if not bucket:
+            self.mask &= ~(1 << priority)
+        self.size -= 1
+        return task
+
+    def remove(self, task: Task) -> None:
+        for priority, bucket in enumerate(self.buckets):
+            if task in bucket:
+                bucket.remove(task)
+                if not bucket:
+                    self.mask &= ~(1 << priority)
+                self.size -= 1
+                return
+        raise ValueError("task not in queue")
+
+    def rebuild(self) -> None:
+        """老化改变了 effective_priority：按入队顺序重新分桶（只在老化刷新时发生）。"""
+        tasks = sorted(self, key=lambda task: task.order)
+        for bucket in self.buckets:
+            bucket.clear()
+        self.mask = 0
+        self.size = 0
+        for task in tasks:
+            self.push(task)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+
+class BucketPriorityScheduler(PriorityScheduler):
+    """
+    impl=bucket：priority 只有 0-15，调度类内部用 16 个 FIFO 桶 + 位图代替堆，put/pop 为 O(1)。
+    不再使用 asyncio.Lock/Condition：事件循环单线程，入队出队本身不会交错，
+    空队列时 pop 挂在等待 Future 上（同 asyncio.Queue 的做法）。
+    调度模式、老化、淘汰策略与 stats 与 heap 实现一致；老化刷新时按入队顺序整体重新分桶。
+    """
+
+    def __init__(self, maxsize: int = 0, **kwargs: Any):
+        super().__init__(maxsize, **kwargs)
+        self.impl = "bucket"
+        self._getters: deque[asyncio.Future] = deque()
+
+    def _new_queue(self) -> Any:
+        return _PriorityBuckets()
+
+    def _queue_push(self, queue: Any, task: Task) -> None:
+        queue.push(task)
+
+    def _queue_pop(self, queue: Any) -> Task:
+        return queue.pop()
+
+    def _queue_peek(self, queue: Any) -> Task:
+        return queue.peek()
+
+    def _queue_remove(self, queue: Any, task: Task) -> None:
+        queue.remove(task)
+
+    def _queue_reorder(self, queue: Any) -> None:
+        queue.rebuild()
+
+    def _wakeup_next(self) -> None:
+        if self._selective_waiters:
+            self._wakeup_all()
+            return
+        while self._getters:
+            waiter = self._getters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def put(self, task: Task) -> Optional[Task]:
+        victim = self._enqueue(task)
+        self._wakeup_next()
+        return victim
+
+    async def put_many(self, tasks: Sequence[Task]) -> None:
+        self._enqueue_many(tasks)
+        for _ in tasks:
+            self._wakeup_next()
+
+    def _wakeup_all(self) -> None:
+        while self._getters:
+            waiter = self._getters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _wake_waiters(self) -> None:
+        self._wakeup_all()
+
+    def kick(self) -> None:
+        if self._selective_waiters:
+            self._wakeup_all()
+
+    async def pop(self, allowed: Optional[Callable[[str], bool]] = None) -> Task | None:
+        while not self._has_ready(allowed):
+            if self._closed and not self._size:
+                return None
+            waiter = asyncio.get_running_loop().create_future()
+            self._getters.append(waiter)
+            if allowed is not None:
+                self._selective_waiters += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                waiter.cancel()
+                try:
+                    self._getters.remove(waiter)
+                except ValueError:
+                    pass
+                if self._size or self._control:
+                    self._wakeup_next()
+                raise
+            finally:
+                if allowed is not None:
+                    self._selective_waiters -= 1
+        return self._pop_next(allowed)
+
+    async def drain(self) -> list[Task]:
+        drained: list[Task] = []
+        while self._size or self._control:
+            drained.append(self._pop_next())
+        return drained
+
+    async def close(self) -> None:
+        self._closed = True
+        self._wakeup_all()
+
+
+def _build_scheduler(impl: str, maxsize: int, **kwargs: Any) -> PriorityScheduler:
+    if impl == "bucket":
+        return BucketPriorityScheduler(maxsize, **kwargs)
+    if impl == "heap":
+        return PriorityScheduler(maxsize, **kwargs)
+    raise ValueError("scheduler_impl must be 'heap' or 'bucket'")
 
 
 # ----------------------------------------------------------------------
+# 专用线程池（阻塞任务）
+# ----------------------------------------------------------------------
+class BlockingExecutor:
+    """
+    Agent 池独占的 ThreadPoolExecutor，与 asyncio 默认线程池隔离：
+    LLM 调用再慢也只会占满这里的线程，不影响日志写入、Dida HTTP 等走 asyncio.to_thread 的 I/O。
+    同时统计排队/运行中的任务数与排队等待时长，用于判断线程池是否饱和。
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(int(max_workers), 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="AgentPoolThread")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._peak_active = 0
+        self._completed = 0
+        self._saturated_submits = 0
+        self._rotations = 0
+        self._rotations_skipped = 0
+        self._leaked: set[int] = set()
+        self._leaked_total = 0
+        self._wait_samples: deque[float] = deque(maxlen=500)
+
+    def _run(self, submitted_at: float, func: Callable[..., Any]) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._peak_active = max(self._peak_active, self._active)
+            self._wait_samples.append(perf_counter() - submitted_at)
+        try:
+            return func()
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                # 留在旧池中的卡死线程终于返回，随后自行退出
+                self._leaked.discard(threading.get_ident())
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """等价于 asyncio.to_thread：复制当前上下文（供 raise_if_agent_job_abandoned 使用）后在专用线程池执行。"""
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        with self._lock:
+            if self._active + self._queued >= self.max_workers:
+                self._saturated_submits += 1
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._run, perf_counter(), call)
+
+    def rotate(self, thread_ident: int, *, max_leaked: int) -> bool:
+        """
+        有线程卡死时换一个新的底层线程池，恢复线程容量：旧池 shutdown(wait=False)，
+        其中正常运行的任务跑完后线程自行退出，卡死的线程留在旧池里直到阻塞调用返回（计为泄漏线程）。
+        泄漏线程已达 max_leaked 时不再轮换并返回 False：卡死的线程继续占用当前池的名额，总线程数不再增长。
+        """
+        with self._lock:
+            if len(self._leaked) >= max_leaked:
+                self._rotations_skipped += 1
+                return False
+            self._leaked.add(thread_ident)
+            self._leaked_total += 1
+            old = self._executor
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="AgentPoolThread")
+            self._rotations += 1
+        old.shutdown(wait=False)
+        return True
+
+    def shutdown(self, *, wait: bool) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waits = list(self._wait_samples)
+            return {
+                "size": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "peak_active": self._peak_active,
+                "completed": self._completed,
+                "saturated_submits": self._saturated_submits,
+                "rotations": self._rotations,
+                "rotations_skipped": self._rotations_skipped,
+                "leaked_threads": len(self._leaked),
+                "leaked_total": self._leaked_total,
+                "utilization": round(self._active / self.max_workers, 3),
+                "queue_wait_p95_ms": round(_percentile(waits, 0.95) * 1000, 1),
+            }
+
+
+class ProcessJobExecutor:
+    """
+    run_in_process 任务使用的进程池（CPU 密集的纯 Python 预处理，绕开 GIL）：
+    - 使用 spawn 启动子进程，首次提交时才创建；子进程会重新导入主模块和 func 所在模块，
+      func 须放在不导入 bot 的轻量模块中（如 workflows/summary_chunking.py）
+    - max_tasks_per_child 个任务后回收子进程，限制长期运行的内存增长
+    - 子进程异常退出（BrokenProcessPool）时丢弃旧池，下次提交重新创建
+    """
+
+    def __init__(self, max_workers: int, max_tasks_per_child: int):
+        self.max_workers = max(int(max_workers), 1)
+        self.max_tasks_per_child = max(int(max_tasks_per_child), 0)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight = 0
+        self._completed = 0
+        self._failed = 0
+        self._restarts = 0
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child or None,
+            )
+        return self._pool
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        pool = self._ensure_pool()
+        loop = asyncio.get_running_loop()
+        self._inflight += 1
+        try:
+            result = await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+            self._completed += 1
+            return result
+        except BrokenProcessPool:
+            self._failed += 1
+            if self._pool is pool:
+                self._pool = None
+                self._restarts += 1
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._inflight -= 1
+
+    def shutdown(self, *, wait: bool) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._pool = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self.max_workers,
+            "max_tasks_per_child": self.max_tasks_per_child,
+            "started": self._pool is not None,
+            "inflight": self._inflight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "restarts": self._restarts,
+        }
+
+
+# ----------------------------------------------------------------------
 # 全局状态
 # ----------------------------------------------------------------------
 _scheduler: Optional[PriorityScheduler] = None
+_executor: Optional[BlockingExecutor] = None
+_process_executor: Optional[ProcessJobExecutor] = None
+_shed_notify = True
 _loop: Optional[asyncio.AbstractEventLoop] = None
 _worker_tasks: List[asyncio.Task] = []
 _worker_counter = 0
+_dropped_counts: dict[str, dict[str, int]] = {}
+_busy_workers = 0
+_job_samples: deque[tuple[float, float, float, str]] = deque(maxlen=2000)
+_timeout_times: deque[float] = deque(maxlen=2000)
+_autoscaler_task: Optional[asyncio.Task] = None
+_autoscaler_state: dict[str, Any] = {}
+_async_slots: Optional["AsyncSlots"] = None
+_async_limit = 0
+_async_slots_per_worker = 0.0
+_async_inflight: set[asyncio.Task] = set()
+_current_task: contextvars.ContextVar[Optional[Task]] = contextvars.ContextVar("agent_pool_current_task", default=None)
+_job_store: Optional[AgentJobStore] = None
+_durable_handlers: dict[str, Callable[..., Awaitable[Any]]] = {}
+_replay_tasks: set[asyncio.Task] = set()
+_lanes: dict[str, dict[str, Any]] = {}
+_default_lane = ""
+_lane_running: dict[str, int] = {}
+_worker_home_lanes: dict[int, str] = {}
+_unknown_lanes: set[str] = set()
+_retry_tasks: set[asyncio.Task] = set()
+_retry_counts: dict[str, dict[str, int]] = {}
+_job_spans_enabled = True
+_running_jobs: dict[str, tuple[Task, asyncio.Task]] = {}
+_watchdog_task: Optional[asyncio.Task] = None
+_watchdog_state: dict[str, Any] = {}
+
+
+class AgentJobShed(RuntimeError):
+    """队列已满时任务被更高优先级的任务挤出队列（shed_policy=priority）。"""
+
+
+class AgentJobAbandoned(RuntimeError):
+    """调用方已超时或取消，任务在阶段边界被放弃。"""
+
+
+@dataclass(frozen=True)
+class AgentJobResult:
+    """submit_agent_jobs 的单项结果：index 为该调用在 calls 中的下标，失败时 error 非空。"""
+
+    index: int
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass(frozen=True)
+class AgentRetryPolicy:
+    """
+    池级重试策略（submit_agent_job / submit_agent_jobs 的 retry 参数）：
+    - 任务抛出 retry_on 中的异常且尝试次数未达 max_attempts 时，等待退避时间后重新入队，
+      等待期间不占用 Worker
+    - 第 n 次失败后的退避 = min(max_delay, base_delay * multiplier ** (n - 1))；jitter=True 时在 [0, 退避] 内
+      均匀取值（full jitter），避免同一批失败的任务同时重试
+    - 剩余截止时间不够"退避 + 本次执行耗时"时不再重试，直接把最后一次的异常交给调用方
+    AgentJobAbandoned / AgentJobShed 与取消永远不重试。
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    jitter: bool = True
+    retry_on: tuple[type[BaseException], ...] = (Exception,)
+
+    def retryable(self, error: BaseException) -> bool:
+        if isinstance(error, (AgentJobAbandoned, AgentJobShed)):
+            return False
+        return isinstance(error, self.retry_on)
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** max(attempt - 1, 0))
+        return random.uniform(0.0, delay) if self.jitter else delay
+
+    @classmethod
+    def from_config(
+        cls,
+        raw: Any,
+        *,
+        retry_on: tuple[type[BaseException], ...] = (Exception,),
+    ) -> Optional["AgentRetryPolicy"]:
+        """从工作流配置的 retry 段构造策略；未配置、enabled=false 或 max_attempts <= 1 时返回 None。"""
+        if not isinstance(raw, dict) or not raw.get("enabled", True):
+            return None
+        try:
+            policy = cls(
+                max_attempts=int(raw.get("max_attempts", cls.max_attempts)),
+                base_delay=max(float(raw.get("base_delay_seconds", cls.base_delay)), 0.0),
+                max_delay=max(float(raw.get("max_delay_seconds", cls.max_delay)), 0.0),
+                multiplier=max(float(raw.get("multiplier", cls.multiplier)), 1.0),
+                jitter=bool(raw.get("jitter", cls.jitter)),
+                retry_on=retry_on,
+            )
+        except (TypeError, ValueError):
+            return None
+        return policy if policy.max_attempts > 1 else None
+
+
+def _count_dropped(reason: str, agent_name: str) -> None:
+    per_agent = _dropped_counts.setdefault(reason, {})
+    per_agent[agent_name] = per_agent.get(agent_name, 0) + 1
+
+
+def _classify_error(error: BaseException) -> str:
+    text = f"{type(error).__name__} {error}"
+    if "RateLimit" in text or "429" in text:
+        return "rate_limited"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in text:
+        return "timeout"
+    return "error"
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+def _collect_window_metrics(window_seconds: float) -> dict[str, Any]:
+    """汇总最近 window_seconds 内完成的任务：排队等待/执行耗时 p95 与 429/超时比例。"""
+    since = time() - window_seconds
+    samples = [sample for sample in _job_samples if sample[0] >= since]
+    timeouts = sum(1 for ts in _timeout_times if ts >= since)
+    queue_waits = [sample[1] for sample in samples]
+    exec_times = [sample[2] for sample in samples]
+    rate_limited = sum(1 for sample in samples if sample[3] == "rate_limited")
+    exec_timeouts = sum(1 for sample in samples if sample[3] == "timeout")
+    total = len(samples) + timeouts
+    return {
+        "completed": len(samples),
+        "queue_wait_p50": round(_percentile(queue_waits, 0.50), 3),
+        "queue_wait_p95": round(_percentile(queue_waits, 0.95), 3),
+        "exec_p50": round(_percentile(exec_times, 0.50), 3),
+        "exec_p95": round(_percentile(exec_times, 0.95), 3),
+        "rate_limited": rate_limited,
+        "timeouts": timeouts + exec_timeouts,
+        "error_rate": round((rate_limited + timeouts + exec_timeouts) / total, 3) if total else 0.0,
+    }
+
+
+def register_durable_job(name: str, handler: Callable[..., Awaitable[Any]]) -> None:
+    """
+    注册可持久化任务的处理函数（工作流模块导入时调用）。
+    持久化存储只保存 (name, JSON 参数)，重启后按 name 找到 handler 并以 handler(**args) 重放；
+    handler 应是工作流的顶层协程（内部再 submit_agent_job），不能依赖调用方上下文。
+    """
+    if not inspect.iscoroutinefunction(handler):
+        raise TypeError("durable 任务的处理函数必须是协程函数")
+    _durable_handlers[name] = handler
+
+
+def persist_durable_job(
+    job_key: str,
+    job_name: str,
+    args: dict[str, Any],
+    *,
+    priority: int = 7,
+    agent_name: str = DEFAULT_AGENT_NAME,
+) -> None:
+    """
+    把尚未进入 Agent 池的待执行状态（如防抖中的 pending 回复）写入持久化存储；同一 job_key 覆盖写。
+    只在调用线程里做 JSON 编码，SQLite 写入由存储的写线程按提交顺序完成（不阻塞事件循环，失败时记日志）。
+    未启用 durable_queue 时不做任何事。
+    """
+    if _job_store is None:
+        return
+    if job_name not in _durable_handlers:
+        raise ValueError(f"未注册的 durable 任务: {job_name}")
+    try:
+        write = _job_store.enqueue_save(job_key, job_name, args, priority=priority, agent_name=agent_name)
+    except (TypeError, ValueError) as error:
+        raise TypeError(f"durable 任务参数必须可 JSON 序列化: {error}") from error
+    except RuntimeError:
+        # 存储已关闭（代理池停止）
+        logger.warning("持久化存储已关闭，未写入 job_key=%s", job_key)
+        return
+    write.add_done_callback(functools.partial(_log_store_write, "写入", job_key))
+
+
+def forget_durable_job(job_key: str) -> None:
+    """删除 persist_durable_job 写入的记录（任务已提交、已执行或已放弃）。"""
+    if _job_store is None:
+        return
+    try:
+        write = _job_store.enqueue_delete(job_key)
+    except RuntimeError:
+        logger.warning("持久化存储已关闭，未删除 job_key=%s", job_key)
+        return
+    write.add_done_callback(functools.partial(_log_store_write, "删除", job_key))
+
+
+def _log_store_write(action: str, job_key: str, write: Any) -> None:
+    error = write.exception()
+    if error is not None:
+        logger.error("持久化任务%s失败 job_key=%s", action, job_key, exc_info=error)
+
+
+def _forget_task_record(task: Task) -> None:
+    if task.data.get("durable_key"):
+        forget_durable_job(str(task.data["durable_key"]))
+
+
+async def _run_replayed_job(job_name: str, handler: Callable[..., Awaitable[Any]], args: dict[str, Any]) -> None:
+    try:
+        await handler(**args)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("重放持久化任务失败 job_name=%s", job_name)
+
+
+def _replay_durable_jobs(max_age_seconds: float) -> int:
+    """
+    重放上次运行遗留的任务：超过 max_age_seconds 的直接丢弃（计入 dropped.replay_expired），
+    其余先删除记录再交给 handler 重新提交（handler 会写入新的记录），保证每条记录最多执行一次。
+    """
+    if _job_store is None:
+        return 0
+    now = time()
+    replayed = 0
+    for job in _job_store.load_all():
+        _job_store.delete(job["job_key"])
+        if max_age_seconds > 0 and now - float(job["created_at"]) > max_age_seconds:
+            _count_dropped("replay_expired", job["agent_name"])
+            continue
+        handler = _durable_handlers.get(job["job_name"])
+        if handler is None:
+            logger.warning("未注册的持久化任务 job_name=%s，已丢弃 job_key=%s", job["job_name"], job["job_key"])
+            continue
+        replay = asyncio.create_task(_run_replayed_job(job["job_name"], handler, job["args"]),
+                                     name=f"AgentJobReplay-{job['job_key']}")
+        _replay_tasks.add(replay)
+        replay.add_done_callback(_replay_tasks.discard)
+        replayed += 1
+    return replayed
+
+
+def _count_retry(kind: str, agent_name: str) -> None:
+    per_agent = _retry_counts.setdefault(kind, {})
+    per_agent[agent_name] = per_agent.get(agent_name, 0) + 1
+
+
+def _observe_retry(task: Task, stage: str, error: BaseException, extra: dict[str, Any]) -> None:
+    try:
+        observe_agent_event(
+            agent_name=task.agent_name,
+            task_type="AGENT_POOL",
+            run_id=task.run_id,
+            stage=stage,
+            error=f"{type(error).__name__}: {error}",
+            extra={
+                "task_id": task.task_id,
+                "attempt": task.attempt,
+                "max_attempts": task.retry.max_attempts if task.retry is not None else 1,
+                **extra,
+            },
+        )
+    except Exception:
+        logger.exception("写入重试观测日志失败 task_id=%s", task.task_id)
+
+
+def _schedule_retry(task: Task, error: BaseException, elapsed: float) -> bool:
+    """任务失败后按其重试策略安排重新入队；返回 False 时由调用方把异常交给 future。"""
+    policy = task.retry
+    if policy is None or not policy.retryable(error):
+        return False
+    delay = 0.0
+    if task.attempt >= policy.max_attempts:
+        reason = "max_attempts"
+    elif _scheduler is None:
+        reason = "pool_stopped"
+    elif task.future is not None and task.future.done():
+        reason = "abandoned"
+    else:
+        delay = policy.backoff(task.attempt)
+        reason = "deadline" if task.deadline is not None and time() + delay + elapsed >= task.deadline else ""
+    if reason:
+        _count_retry("exhausted", task.agent_name)
+        _observe_retry(task, "pool_retry_exhausted", error, {"reason": reason})
+        return False
+    _count_retry("scheduled", task.agent_name)
+    _observe_retry(task, "pool_retry", error, {"delay_seconds": round(delay, 3), "elapsed_seconds": round(elapsed, 3)})
+    durable = task.data.get("durable_job")
+    if durable is not None:
+        # 退避期间进程重启时仍能重放（出队时 _forget_task_record 会再删掉）
+        persist_durable_job(task.task_id, durable[0], durable[1], priority=task.priority, agent_name=task.agent_name)
+    retry = asyncio.create_task(_requeue_after(task, delay), name=f"AgentRetry-{task.task_id}")
+    _retry_tasks.add(retry)
+    retry.add_done_callback(_retry_tasks.discard)
+    return True
+
+
+async def _requeue_after(task: Task, delay: float) -> None:
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        if task.future and not task.future.done():
+            task.future.cancel()
+        raise
+    reason = task.abandon_reason()
+    if reason:
+        _count_dropped(reason, task.agent_name)
+        _forget_task_record(task)
+        if task.future and not task.future.done():
+            task.future.cancel()
+        return
+    if _scheduler is None:
+        # 代理池已停止：保留持久化记录，下次启动时重放
+        _count_dropped("stopped", task.agent_name)
+        if task.future and not task.future.done():
+            task.future.cancel()
+        return
+    task.attempt += 1
+    task.timestamp = time()
+    task.reset_spans()
+    task.effective_priority = task.priority
+    try:
+        victim = await _scheduler.put(task)
+    except asyncio.QueueFull as error:
+        _count_dropped("rejected", task.agent_name)
+        _forget_task_record(task)
+        if task.future and not task.future.done():
+            task.future.set_exception(RuntimeError(f"Agent 池队列已满，重试未能入队: {error!r}"))
+        return
+    except RuntimeError as error:
+        # 队列已关闭（代理池正在停止）：保留持久化记录，下次启动时重放
+        _count_dropped("stopped", task.agent_name)
+        if task.future and not task.future.done():
+            task.future.set_exception(RuntimeError(f"Agent 池已停止，重试未能入队: {error!r}"))
+        return
+    if victim is not None:
+        _handle_shed(victim, task)
+
+
+async def _cancel_retry_tasks() -> None:
+    """取消退避中的重试：任务的持久化记录保留，下次启动时重放。"""
+    retries = list(_retry_tasks)
+    for retry in retries:
+        retry.cancel()
+    if retries:
+        await asyncio.gather(*retries, return_exceptions=True)
+
+
+def raise_if_agent_job_abandoned(stage: str = "") -> None:
+    """
+    供工作流在阶段边界（LangGraph 节点之间、LLM 调用之前）调用：
+    当前池任务已过期或被调用方取消时抛出 AgentJobAbandoned；不在池任务中执行时不做任何事。
+    run_in_thread 任务在提交到线程池时复制上下文，因此在线程内同样可用。
+    """
+    task = _current_task.get()
+    if task is None:
+        return
+    reason = task.abandon_reason()
+    if reason:
+        raise AgentJobAbandoned(f"task_id={task.task_id} {reason} at stage={stage or 'unknown'}")
 
 
 # ----------------------------------------------------------------------
-# Worker 池（固定数量，串行执行）
+# Worker 池（固定数量；线程任务串行执行，原生异步任务派发到事件循环）
 # ----------------------------------------------------------------------
-async def _worker(worker_id: int):
-    while True:
-        task = None
+def _is_async_job(data: dict[str, Any]) -> bool:
+    return (
+        data.get("type") == "callable"
+        and not data.get("run_in_thread", False)
+        and not data.get("run_in_process", False)
+    )
+
+
+class AsyncSlots:
+    """
+    原生异步任务的并发额度：可调整上限的信号量，按车道记账。
+    上限随 Worker 数按比例伸缩，自动伸缩的乘性减少因此同样压低在途 LLM 调用数；
+    调小上限时不打断在途协程，只是降到新上限以下之前不再放行。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(int(limit), 1)
+        self.in_use = 0
+        self.lane_in_use: dict[str, int] = {}
+        self._waiters: list[asyncio.Future] = []
+
+    async def acquire(self, lane: str, admit: Callable[[str], bool]) -> None:
+        """等到总额度与车道额度（admit）都允许时占用一个额度。"""
+        while self.in_use >= self.limit or not admit(lane):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self.in_use += 1
+        self.lane_in_use[lane] = self.lane_in_use.get(lane, 0) + 1
+
+    def release(self, lane: str) -> None:
+        self.in_use -= 1
+        self.lane_in_use[lane] -= 1
+        self.kick()
+
+    def resize(self, limit: int) -> None:
+        self.limit = max(int(limit), 1)
+        self.kick()
+
+    def kick(self) -> None:
+        """唤醒等待额度的 Worker 重新判断（额度释放、上限调整、车道排队变化时调用）。"""
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def _async_slots_for(worker_count: int) -> int:
+    """Worker 数对应的异步额度：按比例折算，不超过 async_concurrency。"""
+    return min(_async_limit, max(round(worker_count * _async_slots_per_worker), 1))
+
+
+def _resize_async_slots(worker_count: int) -> None:
+    if _async_slots is not None:
+        _async_slots.resize(_async_slots_for(worker_count))
+
+
+def _release_async_slot(job: asyncio.Task, slots: AsyncSlots, task: Task) -> None:
+    _async_inflight.discard(job)
+    slots.release(task.lane)
+    if _scheduler is not None:
+        _scheduler.kick()
+
+
+# ----------------------------------------------------------------------
+# 车道（lanes）：按车道预留 Worker、限制并发上限
+# ----------------------------------------------------------------------
+def _resolve_lane(lane: str, agent_name: str) -> str:
+    if not _lanes:
+        return ""
+    if lane in _lanes:
+        return lane
+    if lane and lane not in _unknown_lanes:
+        _unknown_lanes.add(lane)
+        logger.warning("未配置的车道 %s（agent=%s），归入默认车道 %s", lane, agent_name, _default_lane)
+    return _default_lane
+
+
+def _lane_async_slots(workers: int) -> int:
+    return math.ceil(workers * _async_slots_per_worker)
+
+
+def _lane_load(lane: str) -> float:
+    """车道占用的 Worker 数：线程任务各算 1 个，原生异步任务按额度折算（每个 Worker 对应 _async_slots_per_worker 个额度）。"""
+    load = float(_lane_running.get(lane, 0))
+    if _async_slots is not None and _async_slots_per_worker > 0:
+        load += _async_slots.lane_in_use.get(lane, 0) / _async_slots_per_worker
+    return load
+
+
+def _lane_at_ceiling(lane: str) -> bool:
+    config = _lanes.get(lane)
+    limit = config["max_workers"] if config else 0
+    return limit > 0 and _lane_load(lane) >= limit
+
+
+def _async_lane_admits(lane: str) -> bool:
+    """
+    异步额度的车道约束，与 Worker 车道使用同一套配置（按 _async_slots_per_worker 折算成额度）：
+    - 车道已用额度达到 max_workers 折算值时不再放行
+    - 未借出的预留（lend_when_idle=false，或该车道仍有排队任务）不分给其它车道
+    """
+    slots = _async_slots
+    if not _lanes or slots is None:
+        return True
+    config = _lanes.get(lane)
+    used = slots.lane_in_use.get(lane, 0)
+    if config is not None:
+        if config["max_workers"] > 0 and used >= _lane_async_slots(config["max_workers"]):
+            return False
+        if used < _lane_async_slots(config["reserved_workers"]):
+            return True
+    held = sum(
+        max(_lane_async_slots(other["reserved_workers"]) - slots.lane_in_use.get(name, 0), 0)
+        for name, other in _lanes.items()
+        if name != lane and (not other["lend_when_idle"] or (_scheduler is not None and _scheduler.lane_size(name)))
+    )
+    return slots.in_use + held < slots.limit
+
+
+def _lane_filter(worker_id: int) -> Callable[[str], bool]:
+    """
+    Worker 的出队谓词：车道已达 max_workers 时不再取该车道的任务；
+    预留给某车道（home）的 Worker 优先服务本车道；本车道没有可执行任务时，
+    lend_when_idle=true 的车道把它借给其它车道（借出期间执行的任务不会被抢占），否则保持空闲。
+    """
+
+    def allowed(lane: str) -> bool:
+        if _lane_at_ceiling(lane):
+            return False
+        home = _worker_home_lanes.get(worker_id, "")
+        if not home or lane == home:
+            return True
+        if not _lanes[home]["lend_when_idle"]:
+            return False
+        return _lane_at_ceiling(home) or _scheduler is None or not _scheduler.lane_size(home)
+
+    return allowed
+
+
+def _rebalance_home_lanes() -> None:
+    """按 reserved_workers 把存活的 Worker 分配给各车道，其余为共享 Worker（缩容/扩容后重新分配）。"""
+    homes = [lane for lane, config in _lanes.items() for _ in range(config["reserved_workers"])]
+    for index, worker_id in enumerate(sorted(_worker_home_lanes)):
+        _worker_home_lanes[worker_id] = homes[index] if index < len(homes) else ""
+
+
+def _lane_started(task: Task) -> None:
+    if task.lane:
+        _lane_running[task.lane] = _lane_running.get(task.lane, 0) + 1
+
+
+def _lane_finished(task: Task) -> None:
+    if task.lane:
+        _lane_running[task.lane] -= 1
+        if _scheduler is not None:
+            _scheduler.kick()
+
+
+def _load_lanes_config() -> tuple[dict[str, dict[str, Any]], str]:
+    raw = AGENT_POOL_CONFIG.get("lanes")
+    if not isinstance(raw, dict) or not raw.get("enabled", False):
+        return {}, ""
+    lanes: dict[str, dict[str, Any]] = {}
+    definitions = raw.get("definitions")
+    for name, config in (definitions.items() if isinstance(definitions, dict) else []):
+        config = config if isinstance(config, dict) else {}
         try:
-            task = await _scheduler.pop() # type: ignore[union-attr]
+            reserved = max(int(config.get("reserved_workers", 0)), 0)
+            ceiling = max(int(config.get("max_workers", 0)), 0)
+        except (TypeError, ValueError):
+            continue
+        lanes[str(name)] = {
+            "reserved_workers": reserved,
+            "max_workers": ceiling,
+            "lend_when_idle": bool(config.get("lend_when_idle", True)),
+        }
+    if not lanes:
+        return {}, ""
+    default_lane = str(raw.get("default_lane") or "")
+    if default_lane not in lanes:
+        default_lane = next(iter(lanes))
+    return lanes, default_lane
+
+
+def _span(name: str, origin: float, start: Optional[float], end: Optional[float], error: str = "") -> Optional[dict[str, Any]]:
+    if start is None or end is None:
+        return None
+    span: dict[str, Any] = {
+        "name": name,
+        "start_ms": round((start - origin) * 1000, 2),
+        "duration_ms": round(max(end - start, 0.0) * 1000, 2),
+    }
+    if error:
+        span["error"] = error
+    return span
+
+
+def _observe_job_span(task: Task, outcome: str, finished: float) -> None:
+    """
+    每次尝试结束（含出队后丢弃）写一条 stage=pool_job_span，run_id 取提交时的 job_run_id（为空则不写）。
+    spans 以入队时刻为 0 点：queue_wait（入队 -> 出队）、dispatch（出队 -> 开始执行，含异步并发额度等待）、
+    thread_handoff（开始执行 -> 线程池真正开始跑，仅 run_in_thread）、execute（执行耗时）、node:<名称>（trace_agent_node）。
+    """
+    if not _job_spans_enabled or not task.run_id:
+        return
+    origin = task.timestamp
+    exec_started = task.thread_started_at or task.started_at
+    spans = [
+        _span("queue_wait", origin, origin, task.dequeued_at),
+        _span("dispatch", origin, task.dequeued_at, task.started_at),
+        _span("thread_handoff", origin, task.started_at, task.thread_started_at),
+        _span("execute", origin, exec_started, finished),
+        *(_span(f"node:{name}", origin, start, end, error) for name, start, end, error in list(task.spans)),
+    ]
+    try:
+        observe_agent_event(
+            agent_name=task.agent_name,
+            task_type="AGENT_POOL",
+            run_id=task.run_id,
+            stage="pool_job_span",
+            latency_ms=(finished - origin) * 1000,
+            extra={
+                "task_id": task.task_id,
+                "attempt": task.attempt,
+                "worker_id": task.worker_id,
+                "lane": task.lane,
+                "priority": task.priority,
+                "outcome": outcome,
+                "enqueued_at": round(origin, 3),
+                "queue_wait_ms": round(((task.dequeued_at or finished) - origin) * 1000, 2),
+                "exec_ms": round((finished - exec_started) * 1000, 2) if exec_started is not None else 0.0,
+                "spans": [span for span in spans if span is not None],
+            },
+        )
+    except Exception:
+        logger.exception("写入任务 span 失败 task_id=%s", task.task_id)
+
+
+def trace_agent_node(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    包装 LangGraph 节点函数（同步 / 异步均可），把节点耗时记为当前池任务的 node:<name> span；
+    不在池任务中执行时原样调用。用法：graph.add_node("decide", trace_agent_node("decide", decide_node))。
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def traced_async(*args: Any, **kwargs: Any) -> Any:
+            task = _current_task.get()
             if task is None:
-                break
-            if task.data.get("type") == "__retire_worker__":
-                logger.info("Worker-%d 收到缩容信号，退出", worker_id)
-                break
+                return await func(*args, **kwargs)
+            started, error = time(), ""
             try:
-                result = await _execute_task_payload(task.data)
-                if task.future and not task.future.done():
-                    task.future.set_result(result)
-            except Exception as e:
-                logger.exception("Worker-%d 处理任务失败, task_id=%s", worker_id, task.task_id)
-                if task.future and not task.future.done():
-                    task.future.set_exception(e)
-
-        except asyncio.CancelledError:
-            logger.info("Worker-%d 已取消", worker_id)
-            break
-        except Exception:
-            logger.exception("Worker-%d 内部异常", worker_id)
+                return await func(*args, **kwargs)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                task.spans.append((name, started, time(), error))
+
+        return traced_async
+
+    @functools.wraps(func)
+    def traced(*args: Any, **kwargs: Any) -> Any:
+        task = _current_task.get()
+        if task is None:
+            return func(*args, **kwargs)
+        started, error = time(), ""
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            task.spans.append((name, started, time(), error))
+
+    return traced
+
+
+def _mark_thread_started(func: Callable[..., Any]) -> Callable[..., Any]:
+    """run_in_thread 任务在线程里真正开始时记录时间点（上下文随任务复制进线程）。"""
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        task = _current_task.get()
+        if task is not None:
+            task.thread_started_at = time()
+            task.thread_ident = threading.get_ident()
+        return func(*args, **kwargs)
+
+    return run
+
+
+async def _run_task(worker_id: int, task: Task, *, hold_worker: bool = True) -> None:
+    """
+    执行单个任务并记录耗时样本。
+    hold_worker=False 时任务由 Worker 派发到事件循环上独立运行（原生异步任务），
+    不占用 Worker，并发度由 AsyncSlots 额度控制（随 Worker 数伸缩，受车道约束）。
+    """
+    global _busy_workers
+    # 任务已出队：无论执行还是丢弃都删除持久化记录（最多执行一次，避免重启后重复回复）
+    _forget_task_record(task)
+    reason = task.abandon_reason()
+    if reason:
+        _count_dropped(reason, task.agent_name)
+        logger.info("Worker-%d 丢弃任务 task_id=%s agent=%s reason=%s",
+                    worker_id, task.task_id, task.agent_name, reason)
+        if task.future and not task.future.done():
+            task.future.cancel()
+        _observe_job_span(task, f"dropped_{reason}", time())
+        return
+    token = _current_task.set(task)
+    started = time()
+    task.started_at = started
+    outcome = "ok"
+    retrying = False
+    job = asyncio.current_task()
+    if job is not None:
+        _running_jobs[task.task_id] = (task, job)
+    if hold_worker:
+        _busy_workers += 1
+    try:
+        result = await _execute_task_payload(task.data)
+        if task.future and not task.future.done():
+            task.future.set_result(result)
+    except AgentJobAbandoned as e:
+        outcome = "abandoned"
+        _count_dropped("abandoned_in_stage", task.agent_name)
+        logger.info("Worker-%d 任务中途放弃: %s", worker_id, e)
+        if task.future and not task.future.done():
+            task.future.set_exception(e)
+    except asyncio.CancelledError:
+        outcome = "hung" if task.hung else "cancelled"
+        if task.future and not task.future.done():
+            task.future.cancel()
+        raise
+    except Exception as e:
+        outcome = _classify_error(e)
+        if _schedule_retry(task, e, time() - started):
+            retrying = True
+            logger.warning("Worker-%d 任务失败，稍后重试 task_id=%s attempt=%d error=%r",
+                           worker_id, task.task_id, task.attempt, e)
+        else:
+            logger.exception("Worker-%d 处理任务失败, task_id=%s", worker_id, task.task_id)
+            if task.future and not task.future.done():
+                task.future.set_exception(e)
+    finally:
+        if hold_worker:
+            _busy_workers -= 1
+        _current_task.reset(token)
+        _running_jobs.pop(task.task_id, None)
+        finished = time()
+        # 卡死按超时计入窗口指标（自动伸缩据此判断后端拥塞）
+        _job_samples.append((finished, started - task.timestamp, finished - started,
+                             "timeout" if outcome == "hung" else outcome))
+        _observe_job_span(task, "retry_scheduled" if retrying else outcome, finished)
+
+
+async def _worker(worker_id: int):
+    allowed = _lane_filter(worker_id) if _lanes else None
+    try:
+        while True:
+            task = None
+            try:
+                task = await _scheduler.pop(allowed) # type: ignore[union-attr]
+                if task is None:
+                    break
+                if task.data.get("type") == "__retire_worker__":
+                    logger.info("Worker-%d 收到缩容信号，退出", worker_id)
+                    break
+                task.dequeued_at = time()
+                task.worker_id = worker_id
+                slots = _async_slots
+                if slots is not None and _is_async_job(task.data):
+                    # 车道的排队情况已变化，让等待额度的 Worker 重新计算预留
+                    slots.kick()
+                    await slots.acquire(task.lane, _async_lane_admits)
+                    job = asyncio.create_task(_run_task(worker_id, task, hold_worker=False),
+                                              name=f"AgentAsyncJob-{task.task_id}")
+                    _async_inflight.add(job)
+                    job.add_done_callback(lambda done, slots=slots, task=task: _release_async_slot(done, slots, task))
+                    if task.future is not None:
+                        # 调用方放弃（超时/取消）时直接取消协程，立即释放并发额度
+                        task.future.add_done_callback(lambda done, job=job: job.cancel() if done.cancelled() else None)
+                    continue
+                _lane_started(task)
+                try:
+                    await _run_task(worker_id, task)
+                finally:
+                    _lane_finished(task)
+
+            except asyncio.CancelledError:
+                logger.info("Worker-%d 已取消", worker_id)
+                break
+            except Exception:
+                logger.exception("Worker-%d 内部异常", worker_id)
+    finally:
+        _worker_home_lanes.pop(worker_id, None)
+        _rebalance_home_lanes()
 
 
 def _compact_worker_tasks() -> None:
@@ -123,13 +1535,16 @@ def _spawn_workers(count: int) -> None:
     for _ in range(count):
         worker_id = _worker_counter
         _worker_counter += 1
+        _worker_home_lanes[worker_id] = ""
         _worker_tasks.append(asyncio.create_task(_worker(worker_id), name=f"AgentWorker-{worker_id}"))
+    _rebalance_home_lanes()
 
 
 async def _execute_task_payload(data: dict[str, Any]) -> Any:
     """
     - callable：执行函数（submit_agent_job(...) 走这个分支），支持：
-        - run_in_thread=True 时用 asyncio.to_thread 跑同步阻塞函数
+        - run_in_thread=True 时在池专用线程池（BlockingExecutor）中跑同步阻塞函数
+        - run_in_process=True 时在进程池（ProcessJobExecutor）中跑 CPU 密集函数
         - 否则直接调用；若返回 awaitable 就 await
     """
     payload_type = str(data.get("type", ""))
@@ -139,9 +1554,15 @@ async def _execute_task_payload(data: dict[str, Any]) -> Any:
             raise ValueError("callable 任务缺少可调用对象")
         args = data.get("args", ())
         kwargs = data.get("kwargs", {})
+        if data.get("run_in_process", False):
+            if _process_executor is None:
+                raise RuntimeError("❌ Agent 池未启动，请先调用 setup_agent_pool()")
+            return await _process_executor.run(func, *args, **kwargs)
         run_in_thread = bool(data.get("run_in_thread", False))
         if run_in_thread:
-            return await asyncio.to_thread(func, *args, **kwargs)
+            if _executor is None:
+                return await asyncio.to_thread(_mark_thread_started(func), *args, **kwargs)
+            return await _executor.run(_mark_thread_started(func), *args, **kwargs)
         result = func(*args, **kwargs)
         if inspect.isawaitable(result):
             return await result
@@ -151,27 +1572,320 @@ async def _execute_task_payload(data: dict[str, Any]) -> Any:
 
 
 # ----------------------------------------------------------------------
+# 卡死任务看门狗
+# ----------------------------------------------------------------------
+def _load_watchdog_config() -> dict[str, Any]:
+    raw = AGENT_POOL_CONFIG.get("watchdog")
+    raw = raw if isinstance(raw, dict) else {}
+
+    def number(name: str, default: float) -> float:
+        try:
+            return float(raw.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    return {
+        "enabled": bool(raw.get("enabled", True)),
+        "interval_seconds": max(number("interval_seconds", 5.0), 0.05),
+        "hard_limit_seconds": max(number("hard_limit_seconds", 600.0), 0.0),
+        "deadline_grace_seconds": max(number("deadline_grace_seconds", 60.0), 0.0),
+        "max_leaked_threads": max(int(number("max_leaked_threads", 0)), 0),
+    }
+
+
+def _hung_reason(task: Task, now: float, config: dict[str, Any]) -> str:
+    """超过硬上限，或已过截止时间 deadline_grace_seconds 仍在运行时返回原因（两项为 0 时各自不判定）。"""
+    if task.started_at is None:
+        return ""
+    running = now - task.started_at
+    hard_limit = config["hard_limit_seconds"]
+    if hard_limit > 0 and running >= hard_limit:
+        return f"running {running:.1f}s >= hard_limit {hard_limit:g}s"
+    grace = config["deadline_grace_seconds"]
+    if grace > 0 and task.deadline is not None and now >= task.deadline + grace:
+        return f"still running {now - task.deadline:.1f}s past deadline"
+    return ""
+
+
+def _capture_job_stack(task: Task, job: asyncio.Task) -> str:
+    """run_in_thread 任务取卡住线程的当前栈（sys._current_frames），否则取协程栈。"""
+    if task.thread_ident is not None:
+        frame = sys._current_frames().get(task.thread_ident)
+        if frame is not None:
+            return "".join(traceback.format_stack(frame))
+    # 沿 cr_await 链走到最内层的 await，Task.print_stack 只给出最外层协程的帧
+    frames = []
+    awaitable: Any = job.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    if not frames:
+        buffer = io.StringIO()
+        job.print_stack(file=buffer)
+        return buffer.getvalue()
+    return "".join(traceback.StackSummary.extract(frames).format())
+
+
+def _quarantine_hung_job(task: Task, job: asyncio.Task, reason: str, now: float) -> None:
+    """
+    记录卡死任务的栈并放弃它：调用方收到 AgentJobAbandoned；取消执行它的协程，
+    占用 Worker 的任务补一个新 Worker，线程任务再换新的底层线程池，恢复容量。
+    卡住的线程无法强制终止，阻塞调用返回后会在下一个阶段边界（raise_if_agent_job_abandoned）退出；
+    泄漏线程达到 watchdog.max_leaked_threads 后既不换池也不补 Worker，容量随之下降而总线程数不再增长。
+    """
+    stack = _capture_job_stack(task, job)
+    task.hung = True
+    _count_dropped("hung", task.agent_name)
+    running = round(now - (task.started_at or now), 1)
+    _watchdog_state["hung_total"] = _watchdog_state.get("hung_total", 0) + 1
+    _watchdog_state["last_hung"] = {
+        "task_id": task.task_id,
+        "agent_name": task.agent_name,
+        "worker_id": task.worker_id,
+        "running_seconds": running,
+        "reason": reason,
+        "ts": now,
+    }
+    logger.error("Agent 池任务卡死 task_id=%s agent=%s worker=%d reason=%s，栈：\n%s",
+                 task.task_id, task.agent_name, task.worker_id, reason, stack)
+    try:
+        observe_agent_event(
+            agent_name=task.agent_name,
+            task_type="AGENT_POOL",
+            run_id=task.run_id,
+            stage="pool_job_hung",
+            error=reason,
+            extra={
+                "task_id": task.task_id,
+                "attempt": task.attempt,
+                "worker_id": task.worker_id,
+                "running_seconds": running,
+                "in_thread": task.thread_ident is not None,
+                "stack": stack[-8000:],
+            },
+        )
+    except Exception:
+        logger.exception("写入卡死任务观测日志失败 task_id=%s", task.task_id)
+    if task.future and not task.future.done():
+        task.future.set_exception(AgentJobAbandoned(f"task_id={task.task_id} hung: {reason}"))
+    restore = True
+    if task.thread_ident is not None and _executor is not None:
+        max_leaked = _watchdog_state.get("config", {}).get("max_leaked_threads") or _executor.max_workers
+        restore = _executor.rotate(task.thread_ident, max_leaked=max_leaked)
+        if not restore:
+            _watchdog_state["restore_skipped"] = _watchdog_state.get("restore_skipped", 0) + 1
+            logger.error("Agent 池泄漏线程已达上限 %d，不再更换线程池与补充 Worker task_id=%s",
+                         max_leaked, task.task_id)
+    replace_worker = job in _worker_tasks
+    if replace_worker:
+        _worker_tasks.remove(job)
+    job.cancel()
+    if replace_worker and restore and _scheduler is not None:
+        _spawn_workers(1)
+        logger.warning("Worker-%d 被卡死任务占用，已补充新 Worker", task.worker_id)
+
+
+async def _watchdog_loop(config: dict[str, Any]) -> None:
+    while True:
+        await asyncio.sleep(config["interval_seconds"])
+        if _scheduler is None:
+            return
+        try:
+            now = time()
+            _watchdog_state["last_check_ts"] = now
+            for task, job in list(_running_jobs.values()):
+                if task.hung or job.done():
+                    continue
+                reason = _hung_reason(task, now, config)
+                if reason:
+                    _quarantine_hung_job(task, job, reason, now)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Agent 池看门狗异常")
+
+
+# ----------------------------------------------------------------------
 # 启动 / 停止
 # ----------------------------------------------------------------------
+def _load_fair_share_weights() -> dict[str, float]:
+    raw_weights = AGENT_POOL_CONFIG.get("fair_share_weights")
+    if not isinstance(raw_weights, dict):
+        return {}
+    weights: dict[str, float] = {}
+    for name, value in raw_weights.items():
+        try:
+            weight = float(value)
+        except (TypeError, ValueError):
+            continue
+        if weight > 0:
+            weights[str(name).strip()] = weight
+    return weights
+
+
+def _load_aging_steps() -> list[float]:
+    """把 aging_bands（按 priority 区间配置老化步长）展开为 16 项的步长表。"""
+    steps = [0.0] * 16
+    bands = AGENT_POOL_CONFIG.get("aging_bands")
+    if not isinstance(bands, list):
+        return steps
+    for band in bands:
+        if not isinstance(band, dict):
+            continue
+        try:
+            min_priority = int(band.get("min_priority", 0))
+            max_priority = int(band.get("max_priority", 15))
+            step_seconds = float(band.get("step_seconds", 0))
+        except (TypeError, ValueError):
+            continue
+        for priority in range(max(min_priority, 0), min(max_priority, 15) + 1):
+            steps[priority] = max(step_seconds, 0.0)
+    return steps
+
+
 async def setup_agent_pool(
     worker_count: int = 5,
     maxsize: int = 100,
-    loop: Optional[asyncio.AbstractEventLoop] = None
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+    *,
+    scheduling_mode: Optional[str] = None,
+    fair_share_weights: Optional[dict[str, float]] = None,
+    aging_steps: Optional[list[float]] = None,
+    autoscale: Optional[bool] = None,
+    async_concurrency: Optional[int] = None,
+    thread_pool_size: Optional[int] = None,
+    process_pool_size: Optional[int] = None,
+    durable: Optional[bool] = None,
+    scheduler_impl: Optional[str] = None,
+    watchdog: Optional[bool] = None,
 ) -> None:
-    """启动代理池（只需要 Worker 数量和队列容量）"""
-    global _scheduler, _loop, _worker_tasks, _worker_counter
+    """
+    启动代理池（Worker 数量、队列容量；调度模式、权重、老化与自动伸缩策略缺省时读取 agent_pool_config）。
+    async_concurrency：原生异步任务的最大并发数（信号量），0 表示异步任务也占用 Worker 执行。
+    thread_pool_size：run_in_thread 任务专用线程池大小，0 表示取 Worker 数（开启自动伸缩时取 max_workers）。
+    process_pool_size：run_in_process 任务的进程数（子进程在首次使用时才启动）。
+    durable：是否启用持久化任务存储（缺省读取 durable_queue.enabled），启用时会重放上次遗留的任务。
+    scheduler_impl：队列实现，heap（默认）或 bucket（16 个 FIFO 桶 + 位图，O(1) 入队/出队）。
+    watchdog：是否启用卡死任务看门狗（缺省读取 watchdog.enabled）。
+    """
+    global _scheduler, _loop, _worker_tasks, _worker_counter, _autoscaler_task, _async_slots, _async_limit, _executor
+    global _watchdog_task, _async_slots_per_worker
+    global _process_executor, _shed_notify, _job_store, _lanes, _default_lane, _job_spans_enabled
 
     if _scheduler is not None:
         logger.warning("Agent 池已启动，忽略重复调用")
         return
 
-    _scheduler = PriorityScheduler(maxsize=maxsize)
+    mode = str(scheduling_mode or AGENT_POOL_CONFIG.get("scheduling_mode") or "strict").strip().lower()
+    try:
+        default_weight = float(AGENT_POOL_CONFIG.get("fair_share_default_weight", 1.0))
+    except (TypeError, ValueError):
+        default_weight = 1.0
+    try:
+        aging_refresh_seconds = float(AGENT_POOL_CONFIG.get("aging_refresh_seconds", 1.0))
+    except (TypeError, ValueError):
+        aging_refresh_seconds = 1.0
+    if async_concurrency is None:
+        try:
+            async_concurrency = int(AGENT_POOL_CONFIG.get("async_concurrency", 100))
+        except (TypeError, ValueError):
+            async_concurrency = 100
+    _async_limit = max(async_concurrency, 0)
+    _async_inflight.clear()
+    shed_policy = str(AGENT_POOL_CONFIG.get("shed_policy") or "priority").strip().lower()
+    _shed_notify = bool(AGENT_POOL_CONFIG.get("shed_notify", True))
+    _job_spans_enabled = bool(AGENT_POOL_CONFIG.get("job_spans", True))
+    impl = str(scheduler_impl or AGENT_POOL_CONFIG.get("scheduler_impl") or "heap").strip().lower()
+    _scheduler = _build_scheduler(
+        impl,
+        maxsize,
+        mode=mode,
+        shed_policy=shed_policy,
+        weights=fair_share_weights if fair_share_weights is not None else _load_fair_share_weights(),
+        default_weight=default_weight if default_weight > 0 else 1.0,
+        aging_steps=aging_steps if aging_steps is not None else _load_aging_steps(),
+        aging_refresh_seconds=aging_refresh_seconds,
+    )
     _loop = loop or asyncio.get_running_loop()
     _worker_tasks = []
     _worker_counter = 0
+    _lanes, _default_lane = _load_lanes_config()
+    _lane_running.clear()
+    _worker_home_lanes.clear()
+    _dropped_counts.clear()
+    _job_samples.clear()
+    _timeout_times.clear()
+    _autoscaler_state.clear()
+    _running_jobs.clear()
+    _watchdog_state.clear()
+    autoscale_config = _load_autoscale_config()
+    if autoscale is not None:
+        autoscale_config["enabled"] = bool(autoscale)
+    if autoscale_config["enabled"]:
+        worker_count = min(max(worker_count, autoscale_config["min_workers"]), autoscale_config["max_workers"])
+    # Worker 数达到上限（开启自动伸缩时为 autoscale.max_workers，否则为启动时的 Worker 数）时异步额度为 async_concurrency
+    _async_slots_per_worker = _async_limit / max(
+        autoscale_config["max_workers"] if autoscale_config["enabled"] else worker_count, 1
+    )
+    _async_slots = AsyncSlots(_async_slots_for(worker_count)) if _async_limit > 0 else None
+    if thread_pool_size is None:
+        try:
+            thread_pool_size = int(AGENT_POOL_CONFIG.get("thread_pool_size", 0))
+        except (TypeError, ValueError):
+            thread_pool_size = 0
+    if thread_pool_size <= 0:
+        thread_pool_size = autoscale_config["max_workers"] if autoscale_config["enabled"] else worker_count
+    _executor = BlockingExecutor(thread_pool_size)
+    if process_pool_size is None:
+        try:
+            process_pool_size = int(AGENT_POOL_CONFIG.get("process_pool_size", 2))
+        except (TypeError, ValueError):
+            process_pool_size = 2
+    try:
+        max_tasks_per_child = int(AGENT_POOL_CONFIG.get("process_max_tasks_per_child", 20))
+    except (TypeError, ValueError):
+        max_tasks_per_child = 20
+    _process_executor = ProcessJobExecutor(process_pool_size, max_tasks_per_child)
+    reserved_total = sum(config["reserved_workers"] for config in _lanes.values())
+    if _lanes and reserved_total >= worker_count:
+        logger.warning("车道预留 Worker 总数=%d 不小于 Worker 数=%d，没有共享 Worker", reserved_total, worker_count)
     _spawn_workers(worker_count)
-    logger.info("✅ Agent 池已启动，Worker 数量=%d，队列容量=%s",
-                worker_count, maxsize if maxsize > 0 else "无限制")
+    durable_config = _load_durable_queue_config()
+    if durable is not None:
+        durable_config["enabled"] = bool(durable)
+    if durable_config["enabled"]:
+        _job_store = AgentJobStore(durable_config["path"])
+        replayed = _replay_durable_jobs(durable_config["replay_max_age_seconds"])
+        logger.info("Agent 池持久化存储=%s，重放遗留任务=%d", durable_config["path"], replayed)
+    if autoscale_config["enabled"]:
+        _autoscaler_state["config"] = autoscale_config
+        _autoscaler_task = asyncio.create_task(_autoscaler_loop(autoscale_config), name="AgentPoolAutoscaler")
+    watchdog_config = _load_watchdog_config()
+    if watchdog is not None:
+        watchdog_config["enabled"] = bool(watchdog)
+    if watchdog_config["enabled"]:
+        _watchdog_state.update({"config": watchdog_config, "hung_total": 0})
+        _watchdog_task = asyncio.create_task(_watchdog_loop(watchdog_config), name="AgentPoolWatchdog")
+    logger.info("✅ Agent 池已启动，Worker 数量=%d，队列容量=%s，调度模式=%s，自动伸缩=%s，异步并发=%s，线程池=%d",
+                worker_count, maxsize if maxsize > 0 else "无限制", mode, autoscale_config["enabled"],
+                _async_slots.limit if _async_slots is not None else "占用 Worker", _executor.max_workers)
+
+
+def _load_durable_queue_config() -> dict[str, Any]:
+    raw = AGENT_POOL_CONFIG.get("durable_queue")
+    raw = raw if isinstance(raw, dict) else {}
+    try:
+        max_age = float(raw.get("replay_max_age_seconds", 900))
+    except (TypeError, ValueError):
+        max_age = 900.0
+    return {
+        "enabled": bool(raw.get("enabled", False)),
+        "path": str(raw.get("path") or "data/agent_jobs.sqlite3"),
+        "replay_max_age_seconds": max(max_age, 0.0),
+    }
 
 
 async def resize_agent_pool(
@@ -180,11 +1894,12 @@ async def resize_agent_pool(
     graceful: bool = True,
     wait_timeout: float = 10.0,
 ) -> None:
-    """动态调整 Agent 池 worker 数量。"""
+    """动态调整 Agent 池 worker 数量（原生异步任务的并发额度按比例同步调整）。"""
     if worker_count <= 0:
         raise ValueError("worker_count must be > 0")
     if _scheduler is None:
         raise RuntimeError("❌ Agent 池未启动，请先调用 setup_agent_pool()")
+    _resize_async_slots(worker_count)
 
     _compact_worker_tasks()
     current_count = len(_worker_tasks)
@@ -203,6 +1918,7 @@ async def resize_agent_pool(
                 priority=0,
                 data={"type": "__retire_worker__"},
                 future=None,
+                agent_name=_CONTROL_AGENT_NAME,
             )
             await _scheduler.put(retire_task)
 
@@ -226,16 +1942,122 @@ async def resize_agent_pool(
     logger.info("Agent 池强制缩容完成: %d -> %d", current_count, len(_worker_tasks))
 
 
+def _load_autoscale_config() -> dict[str, Any]:
+    raw = AGENT_POOL_CONFIG.get("autoscale")
+    raw = raw if isinstance(raw, dict) else {}
+
+    def number(name: str, default: float) -> float:
+        try:
+            return float(raw.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+    min_workers = max(int(number("min_workers", 2)), 1)
+    return {
+        "enabled": bool(raw.get("enabled", False)),
+        "min_workers": min_workers,
+        "max_workers": max(int(number("max_workers", 10)), min_workers),
+        "interval_seconds": max(number("interval_seconds", 15.0), 1.0),
+        "window_seconds": max(number("window_seconds", 120.0), 1.0),
+        "target_queue_wait_p95_seconds": max(number("target_queue_wait_p95_seconds", 5.0), 0.0),
+        "max_exec_p95_seconds": max(number("max_exec_p95_seconds", 0.0), 0.0),
+        "error_rate_threshold": min(max(number("error_rate_threshold", 0.2), 0.0), 1.0),
+        "increase_step": max(int(number("increase_step", 1)), 1),
+        "decrease_factor": min(max(number("decrease_factor", 0.5), 0.1), 0.95),
+        "idle_ticks_before_shrink": max(int(number("idle_ticks_before_shrink", 4)), 1),
+    }
+
+
+def _decide_worker_count(
+    current: int,
+    *,
+    qsize: int,
+    busy: float,
+    metrics: dict[str, Any],
+    config: dict[str, Any],
+    idle_ticks: int,
+) -> tuple[int, str, int]:
+    """
+    AIMD 决策，返回 (目标 worker 数, 原因, 新的连续空闲计数)：
+    - 429/超时比例超过阈值：乘性减少（后端已拥塞，加 worker 只会更糟）
+    - 排队 p95 超过目标或积压 >= worker 数，且执行耗时未超过上限：加性增加
+    - 队列为空且半数以上 worker 空闲，连续若干个周期：减少 1 个
+    """
+    min_workers = config["min_workers"]
+    max_workers = config["max_workers"]
+    if metrics["error_rate"] >= config["error_rate_threshold"] > 0 and metrics["rate_limited"] + metrics["timeouts"] > 0:
+        target = max(min_workers, int(current * config["decrease_factor"]))
+        return target, "backend_errors", 0
+
+    exec_ok = config["max_exec_p95_seconds"] <= 0 or metrics["exec_p95"] <= config["max_exec_p95_seconds"]
+    backlog = qsize > 0 and (metrics["queue_wait_p95"] > config["target_queue_wait_p95_seconds"] or qsize >= current)
+    if backlog and exec_ok:
+        return min(max_workers, current + config["increase_step"]), "queue_pressure", 0
+
+    if qsize == 0 and busy * 2 <= current:
+        idle_ticks += 1
+        if idle_ticks >= config["idle_ticks_before_shrink"]:
+            return max(min_workers, current - 1), "idle", 0
+        return current, "idle_pending", idle_ticks
+    return current, "steady", 0
+
+
+def _busy_worker_load() -> float:
+    """忙碌 Worker 数：线程任务占用的 Worker，加上原生异步任务按额度折算的 Worker 数。"""
+    busy = float(_busy_workers)
+    if _async_slots is not None and _async_slots_per_worker > 0:
+        busy += _async_slots.in_use / _async_slots_per_worker
+    return busy
+
+
+async def _autoscaler_loop(config: dict[str, Any]) -> None:
+    idle_ticks = 0
+    while True:
+        await asyncio.sleep(config["interval_seconds"])
+        if _scheduler is None:
+            return
+        try:
+            _compact_worker_tasks()
+            current = len(_worker_tasks)
+            metrics = _collect_window_metrics(config["window_seconds"])
+            target, reason, idle_ticks = _decide_worker_count(
+                current,
+                qsize=_scheduler.qsize(),
+                busy=_busy_worker_load(),
+                metrics=metrics,
+                config=config,
+                idle_ticks=idle_ticks,
+            )
+            _autoscaler_state.update(
+                {"last_check_ts": time(), "last_reason": reason, "last_target": target, "metrics": metrics}
+            )
+            if target != current:
+                logger.info("Agent 池自动伸缩: %d -> %d reason=%s metrics=%s", current, target, reason, metrics)
+                await resize_agent_pool(target, graceful=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Agent 池自动伸缩异常")
+
+
 async def stop_agent_pool(
     *,
     wait_for_pending: bool = True,
     drop_pending: bool = False,
 ) -> list[dict[str, Any]]:
     """停止代理池并按需返回未执行任务信息。"""
-    global _worker_tasks, _scheduler, _loop
+    global _worker_tasks, _scheduler, _loop, _autoscaler_task, _async_slots, _executor, _process_executor, _job_store
+    global _watchdog_task
     if _scheduler is None:
         return []
 
+    for background in (_autoscaler_task, _watchdog_task):
+        if background is not None:
+            background.cancel()
+            await asyncio.gather(background, return_exceptions=True)
+    _autoscaler_task = None
+    _watchdog_task = None
+
     drained_tasks: list[Task] = []
     if drop_pending or not wait_for_pending:
         drained_tasks = await _scheduler.drain()
@@ -243,6 +2065,8 @@ async def stop_agent_pool(
             if task.future and not task.future.done():
                 task.future.cancel()
 
+    # 先取消退避中的重试，再关闭队列：否则重试醒来时向已关闭的队列入队失败
+    await _cancel_retry_tasks()
     await _scheduler.close()
 
     if not wait_for_pending:
@@ -252,6 +2076,34 @@ async def stop_agent_pool(
     if _worker_tasks:
         await asyncio.gather(*_worker_tasks, return_exceptions=True)
     _worker_tasks.clear()
+
+    inflight = list(_async_inflight)
+    if not wait_for_pending:
+        for job in inflight:
+            job.cancel()
+    if inflight:
+        await asyncio.gather(*inflight, return_exceptions=True)
+    _async_inflight.clear()
+    _async_slots = None
+    if _executor is not None:
+        executor = _executor
+        _executor = None
+        await asyncio.to_thread(executor.shutdown, wait=wait_for_pending)
+    if _process_executor is not None:
+        process_executor = _process_executor
+        _process_executor = None
+        await asyncio.to_thread(process_executor.shutdown, wait=wait_for_pending)
+    # 被丢弃的排队任务（含退避中的重试）保留持久化记录，下次启动时重放；
+    # 收尾期间执行失败的任务可能又安排了重试，这里再取消一次
+    await _cancel_retry_tasks()
+    replays = list(_replay_tasks)
+    for replay in replays:
+        replay.cancel()
+    if replays:
+        await asyncio.gather(*replays, return_exceptions=True)
+    if _job_store is not None:
+        _job_store.close()
+        _job_store = None
     _scheduler = None
     _loop = None
     pending_info = [
@@ -259,39 +2111,139 @@ async def stop_agent_pool(
             "priority": task.priority,
             "task_type": str(task.data.get("type", "")),
             "task_id": task.task_id,
+            "agent_name": task.agent_name,
         }
         for task in drained_tasks
+        if task.agent_name != _CONTROL_AGENT_NAME
     ]
     logger.info("🛑 Agent 池已停止，未执行任务=%d", len(pending_info))
     return pending_info
 
 
+def _handle_shed(victim: Task, incoming: Task) -> None:
+    """通知被挤出队列的任务：已过期/取消的直接取消，其余按 shed_notify 抛 AgentJobShed 或取消。"""
+    reason = victim.abandon_reason()
+    _count_dropped(reason or "shed", victim.agent_name)
+    _forget_task_record(victim)
+    logger.info("Agent 池队列已满，淘汰 task_id=%s agent=%s priority=%d reason=%s，接纳 agent=%s priority=%d",
+                victim.task_id, victim.agent_name, victim.priority, reason or "shed",
+                incoming.agent_name, incoming.priority)
+    if victim.future is None or victim.future.done():
+        return
+    if reason or not _shed_notify:
+        victim.future.cancel()
+        return
+    victim.future.set_exception(
+        AgentJobShed(f"task_id={victim.task_id} priority={victim.priority} 被 priority={incoming.priority} 的任务挤出队列")
+    )
+
+
+def _new_pool_task(
+    payload: dict[str, Any],
+    *,
+    priority: int,
+    agent_name: str,
+    deadline: Optional[float],
+    lane: str = "",
+    retry: Optional[AgentRetryPolicy] = None,
+    run_id: str = "",
+) -> Task:
+    loop = _loop or asyncio.get_running_loop()
+    future = loop.create_future()
+    task = Task(
+        priority=priority,
+        data=payload,
+        future=future,
+        agent_name=agent_name,
+        deadline=deadline,
+        lane=_resolve_lane(lane, agent_name),
+    )
+    task.retry = retry
+    task.run_id = run_id
+
+    def _mark_cancelled(done_future: asyncio.Future) -> None:
+        if done_future.cancelled():
+            task.cancelled = True
+
+    future.add_done_callback(_mark_cancelled)
+    return task
+
+
 async def _submit_pool_task(
     *,
     payload: dict[str, Any],
     priority: int,
     timeout: float,
+    agent_name: str = DEFAULT_AGENT_NAME,
+    durable: Optional[tuple[str, dict[str, Any]]] = None,
+    lane: str = "",
+    retry: Optional[AgentRetryPolicy] = None,
+    run_id: str = "",
 ) -> Any:
     if _scheduler is None:
         raise RuntimeError("❌ Agent 池未启动，请先调用 setup_agent_pool()")
 
-    loop = _loop or asyncio.get_running_loop()
-    future = loop.create_future()
-    task = Task(priority=priority, data=payload, future=future)
+    task = _new_pool_task(
+        payload,
+        priority=priority,
+        agent_name=agent_name,
+        deadline=time() + timeout if timeout and timeout > 0 else None,
+        lane=lane,
+        retry=retry,
+        run_id=run_id,
+    )
+    future = task.future
+    if durable is not None and _job_store is not None:
+        payload["durable_key"] = task.task_id
+        payload["durable_job"] = durable
 
     try:
-        await _scheduler.put(task)
+        victim = await _scheduler.put(task)
     except asyncio.QueueFull as error:
+        _count_dropped("rejected", agent_name)
         raise RuntimeError("Agent 池队列已满，请求被拒绝") from error
     except RuntimeError as error:
         raise RuntimeError("Agent 池已停止，拒绝接收新任务") from error
+    if durable is not None and _job_store is not None:
+        persist_durable_job(task.task_id, durable[0], durable[1], priority=priority, agent_name=agent_name)
+    if victim is not None:
+        _handle_shed(victim, task)
 
     try:
         return await asyncio.wait_for(future, timeout=timeout)
     except asyncio.TimeoutError:
+        _timeout_times.append(time())
         if not future.done():
             future.cancel()
         raise
+
+
+def _callable_payload(
+    func: Callable[..., Any],
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+    *,
+    run_in_thread: Optional[bool],
+    run_in_process: bool,
+) -> dict[str, Any]:
+    if run_in_process:
+        if run_in_thread or inspect.iscoroutinefunction(func):
+            raise ValueError("run_in_process 只支持同步函数，且不能与 run_in_thread 同时使用")
+        try:
+            pickle.dumps(func)
+        except Exception as error:
+            raise TypeError(f"run_in_process 任务的函数必须是可 pickle 的模块级函数: {error}") from error
+        run_blocking = False
+    else:
+        run_blocking = not inspect.iscoroutinefunction(func) if run_in_thread is None else bool(run_in_thread)
+    return {
+        "type": "callable",
+        "func": func,
+        "args": args,
+        "kwargs": kwargs,
+        "run_in_thread": run_blocking,
+        "run_in_process": bool(run_in_process),
+    }
 
 
 async def submit_agent_job(
@@ -300,22 +2252,204 @@ async def submit_agent_job(
     priority: int = 7,
     timeout: float = 60.0,
     run_in_thread: Optional[bool] = None,
+    agent_name: str = DEFAULT_AGENT_NAME,
+    run_in_process: bool = False,
+    durable_job: str = "",
+    durable_args: Optional[dict[str, Any]] = None,
+    lane: str = "",
+    retry: Optional[AgentRetryPolicy] = None,
+    job_run_id: str = "",
     **kwargs: Any,
 ) -> Any:
     """
     提交通用任务到 Agent 池调度执行（不改变任务内部实现方式）。
+    协程函数（run_in_thread 缺省或 False）直接在事件循环上运行，不占用线程；
+    同步阻塞函数需 run_in_thread=True，在池专用线程池执行。
+    run_in_process=True 时在进程池执行：func 须为模块级函数，参数与返回值须可 pickle，
+    且子进程内不做阶段边界放弃检查（任务只在出队时检查截止时间）。
+    durable_job/durable_args：启用 durable_queue 时，排队期间把 (durable_job, durable_args) 写入持久化存储，
+    进程重启后按 register_durable_job 注册的处理函数重放；durable_args 须可 JSON 序列化。
+    lane：任务所属车道（interactive / near_real_time / batch 等，见 agent_pool_config.lanes）；
+    未启用车道时忽略，未配置的车道归入 default_lane。
+    retry：AgentRetryPolicy，失败后按退避重新入队（见 AgentRetryPolicy）；job_run_id：池内事件
+    （pool_retry / pool_retry_exhausted）写入 agent_events.jsonl 时使用的 run_id，通常与工作流日志的 run_id 相同。
     
-    实质上，就是 add_task 函数
+    实质上，就是 add_task 函数；agent_name 决定 fair_share 模式下任务所属的调度类
     """
-    run_blocking = not inspect.iscoroutinefunction(func) if run_in_thread is None else bool(run_in_thread)
-    payload = {
-        "type": "callable",
-        "func": func,
-        "args": args,
-        "kwargs": kwargs,
-        "run_in_thread": run_blocking,
+    durable = None
+    if durable_job:
+        if durable_job not in _durable_handlers:
+            raise ValueError(f"未注册的 durable 任务: {durable_job}")
+        durable_args = dict(durable_args or {})
+        try:
+            json.dumps(durable_args, ensure_ascii=False)
+        except (TypeError, ValueError) as error:
+            raise TypeError(f"durable 任务参数必须可 JSON 序列化: {error}") from error
+        durable = (durable_job, durable_args)
+    payload = _callable_payload(func, args, kwargs, run_in_thread=run_in_thread, run_in_process=run_in_process)
+    return await _submit_pool_task(
+        payload=payload,
+        priority=priority,
+        timeout=timeout,
+        agent_name=agent_name,
+        durable=durable,
+        lane=lane,
+        retry=retry,
+        run_id=job_run_id,
+    )
+
+
+def _normalize_batch_call(call: Any) -> tuple[Callable[..., Any], tuple[Any, ...], dict[str, Any]]:
+    if callable(call):
+        return call, (), {}
+    if isinstance(call, (tuple, list)) and 1 <= len(call) <= 3 and callable(call[0]):
+        args = tuple(call[1]) if len(call) > 1 else ()
+        kwargs = dict(call[2]) if len(call) > 2 else {}
+        return call[0], args, kwargs
+    raise TypeError("calls 的每一项须为 func、(func, args) 或 (func, args, kwargs)")
+
+
+async def submit_agent_jobs(
+    calls: Iterable[Any],
+    *,
+    priority: int = 7,
+    timeout: float = 60.0,
+    run_in_thread: Optional[bool] = None,
+    agent_name: str = DEFAULT_AGENT_NAME,
+    run_in_process: bool = False,
+    max_concurrency: int = 0,
+    lane: str = "",
+    retry: Optional[AgentRetryPolicy] = None,
+    job_run_id: str = "",
+) -> AsyncIterator[AgentJobResult]:
+    """
+    批量提交任务，按完成顺序逐个产出 AgentJobResult（单项失败不影响其它项）。
+    - calls：每项为 func、(func, args) 或 (func, args, kwargs)
+    - 整批共用 priority、agent_name、lane 与截止时间（提交时刻 + timeout）；截止后未完成的项以 asyncio.TimeoutError 产出
+    - max_concurrency > 0 时同一批最多这么多项在排队/执行，其余项等前面的完成后再入队，避免一次灌满队列；
+      首批（或 max_concurrency=0 时整批）原子入队，队列放不下时整体拒绝
+    - 调用方提前结束迭代（break / aclose）时，未完成的项全部取消
+    - retry / job_run_id：同 submit_agent_job，每项各自重试，重试中的项仍占用窗口名额
+
+        async for item in submit_agent_jobs([(fetch, (pid,)) for pid in ids], max_concurrency=4):
+            ...
+    """
+    if _scheduler is None:
+        raise RuntimeError("❌ Agent 池未启动，请先调用 setup_agent_pool()")
+    payloads = [
+        _callable_payload(func, args, kwargs, run_in_thread=run_in_thread, run_in_process=run_in_process)
+        for func, args, kwargs in map(_normalize_batch_call, calls)
+    ]
+    if not payloads:
+        return
+    deadline = time() + timeout if timeout and timeout > 0 else None
+    window = min(max_concurrency, len(payloads)) if max_concurrency > 0 else len(payloads)
+    first = [
+        _new_pool_task(
+            payloads[index],
+            priority=priority,
+            agent_name=agent_name,
+            deadline=deadline,
+            lane=lane,
+            retry=retry,
+            run_id=job_run_id,
+        )
+        for index in range(window)
+    ]
+    try:
+        await _scheduler.put_many(first)
+    except asyncio.QueueFull as error:
+        _count_dropped("rejected", agent_name)
+        raise RuntimeError("Agent 池队列已满，批量请求被拒绝") from error
+    except RuntimeError as error:
+        raise RuntimeError("Agent 池已停止，拒绝接收新任务") from error
+
+    pending: dict[asyncio.Future, int] = {task.future: index for index, task in enumerate(first)}  # type: ignore[misc]
+    next_index = window
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - time()
+            if remaining is not None and remaining <= 0:
+                break
+            done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                index = pending.pop(future)
+                # 先补位再产出结果，调用方处理结果期间窗口保持满载
+                if next_index < len(payloads) and _scheduler is not None:
+                    task = _new_pool_task(
+                        payloads[next_index],
+                        priority=priority,
+                        agent_name=agent_name,
+                        deadline=deadline,
+                        lane=lane,
+                        retry=retry,
+                        run_id=job_run_id,
+                    )
+                    try:
+                        victim = await _scheduler.put(task)
+                    except (asyncio.QueueFull, RuntimeError) as error:
+                        _count_dropped("rejected", agent_name)
+                        yield AgentJobResult(next_index, error=RuntimeError(f"Agent 池队列已满或已停止: {error!r}"))
+                    else:
+                        pending[task.future] = next_index  # type: ignore[index]
+                        if victim is not None:
+                            _handle_shed(victim, task)
+                    next_index += 1
+                if future.cancelled():
+                    yield AgentJobResult(index, error=asyncio.CancelledError())
+                elif future.exception() is not None:
+                    yield AgentJobResult(index, error=future.exception())
+                else:
+                    yield AgentJobResult(index, result=future.result())
+        if pending or next_index < len(payloads):
+            _timeout_times.append(time())
+            for index in sorted(pending.values()):
+                yield AgentJobResult(index, error=asyncio.TimeoutError())
+            for index in range(next_index, len(payloads)):
+                yield AgentJobResult(index, error=asyncio.TimeoutError())
+    finally:
+        for future in pending:
+            if not future.done():
+                future.cancel()
+
+
+def get_agent_pool_stats() -> dict[str, Any]:
+    """返回 Agent 池当前的调度统计（未启动时返回 running=False）。"""
+    if _scheduler is None:
+        return {"running": False}
+    _compact_worker_tasks()
+    return {
+        "running": True,
+        "workers": len(_worker_tasks),
+        "busy_workers": _busy_workers,
+        "async_inflight": len(_async_inflight),
+        "async_limit": _async_slots.limit if _async_slots is not None else 0,
+        "async_concurrency": _async_limit,
+        "thread_pool": _executor.stats() if _executor is not None else None,
+        "process_pool": _process_executor.stats() if _process_executor is not None else None,
+        "durable_jobs": _job_store.count() if _job_store is not None else None,
+        **_scheduler.stats(),
+        "metrics": _collect_window_metrics(60.0),
+        "autoscaler": dict(_autoscaler_state),
+        "watchdog": dict(_watchdog_state),
+        "dropped": {reason: dict(per_agent) for reason, per_agent in _dropped_counts.items()},
+        "retries": {
+            "pending": len(_retry_tasks),
+            **{kind: dict(per_agent) for kind, per_agent in _retry_counts.items()},
+        },
+        "lanes": {
+            lane: {
+                **config,
+                "running": _lane_running.get(lane, 0),
+                "async_running": _async_slots.lane_in_use.get(lane, 0) if _async_slots is not None else 0,
+                "queued": _scheduler.lane_size(lane),
+                "home_workers": sum(1 for home in _worker_home_lanes.values() if home == lane),
+            }
+            for lane, config in _lanes.items()
+        },
     }
-    return await _submit_pool_task(payload=payload, priority=priority, timeout=timeout)
 
 
 # ----------------------------------------------------------------------
@@ -326,4 +2460,15 @@ __all__ = [
     "resize_agent_pool",
     "stop_agent_pool",
     "submit_agent_job",
+    "submit_agent_jobs",
+    "AgentJobResult",
+    "AgentRetryPolicy",
+    "get_agent_pool_stats",
+    "trace_agent_node",
+    "register_durable_job",
+    "persist_durable_job",
+    "forget_durable_job",
+    "raise_if_agent_job_abandoned",
+    "AgentJobAbandoned",
+    "AgentJobShed",
 ]
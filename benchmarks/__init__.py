@@ -0,0 +1 @@
+"""本地性能基准脚本（不参与运行时，只用于对比实现）。"""
@@ -0,0 +1,64 @@
+"""压测用的假 LLM：按对数正态分布模拟调用延迟，可按比例注入失败，不访问任何网络。"""
+
+from __future__ import annotations
+
+from time import sleep
+import asyncio
+import math
+import random
+
+
+# 标准正态分布的 95 分位
+_Z95 = 1.6448536269514722
+
+
+class FakeLLMError(ConnectionError):
+    """注入的模拟失败（继承 ConnectionError，可直接用于 AgentRetryPolicy.retry_on）。"""
+
+
+class FakeLLM:
+    """
+    延迟服从对数正态分布，由中位数与 p95 确定（真实 LLM 的延迟通常是右偏长尾）：
+    mu = ln(median)，sigma = (ln(p95) - mu) / z95。
+    time_scale 把所有延迟等比缩小，便于在几秒内跑完一轮压测。
+    """
+
+    def __init__(
+        self,
+        *,
+        median_ms: float,
+        p95_ms: float,
+        error_rate: float = 0.0,
+        time_scale: float = 1.0,
+        seed: int | None = None,
+    ):
+        if median_ms <= 0 or p95_ms < median_ms:
+            raise ValueError("需要 0 < median_ms <= p95_ms")
+        self.mu = math.log(median_ms / 1000.0)
+        self.sigma = (math.log(p95_ms) - math.log(median_ms)) / _Z95
+        self.error_rate = min(max(error_rate, 0.0), 1.0)
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+
+    def sample_seconds(self) -> float:
+        """一次调用的延迟（已乘 time_scale）。"""
+        return self._rng.lognormvariate(self.mu, self.sigma) * self.time_scale
+
+    def _outcome(self) -> tuple[float, bool]:
+        return self.sample_seconds(), self._rng.random() < self.error_rate
+
+    def invoke(self, messages: object = None) -> dict[str, str]:
+        """同步调用：在当前线程 sleep（模拟 run_in_thread 工作流里的 llm.invoke）。"""
+        delay, failed = self._outcome()
+        sleep(delay)
+        if failed:
+            raise FakeLLMError("fake llm injected failure")
+        return {"content": "ok"}
+
+    async def ainvoke(self, messages: object = None) -> dict[str, str]:
+        """异步调用：asyncio.sleep（模拟原生异步工作流里的 llm.ainvoke）。"""
+        delay, failed = self._outcome()
+        await asyncio.sleep(delay)
+        if failed:
+            raise FakeLLMError("fake llm injected failure")
+        return {"content": "ok"}
@@ -0,0 +1,237 @@
+"""
+LangGraph 图构建开销对比：每条消息重新 StateGraph + compile（rebuild）vs 进程内只编译一次、调用参数经 config 传入（compiled）。
+
+回放 N 条合成群消息，LLM 用零延迟的假实现，测出来的差值就是每次调用省下的图构建 / 编译开销。
+图结构与 workflows 中的判定图一致：单节点判定图（forward / ai_decide / reply_generate）
+与两节点 map -> finalize 图（summary 分片）。
+
+用法：
+    python -m benchmarks.graph_bench
+    python -m benchmarks.graph_bench --messages 1000 --graphs decide summary --async
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Any, Callable, TypedDict
+import argparse
+import asyncio
+import json
+import random
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, StateGraph
+
+from agent_pool import trace_agent_node
+from workflows.llm_gateway import LLMCallSpec, llm_call_from_config
+
+
+DECISION_PROMPT = "你是消息转发判定助手。仅返回 JSON：{\"should_forward\":true/false,\"reason\":\"...\"}"
+WORDS = ("今晚", "开会", "截止", "提醒", "发布", "回滚", "报错", "部署", "周报", "需求", "上线", "吃饭")
+
+
+class _ZeroLatencyLLM:
+    """零延迟的结构化输出假 LLM：同步 / 异步都直接返回固定结果。"""
+
+    def __init__(self, result: Any):
+        self.result = result
+        self.calls = 0
+
+    def invoke(self, messages: list[Any]) -> Any:
+        self.calls += 1
+        return self.result
+
+    async def ainvoke(self, messages: list[Any]) -> Any:
+        self.calls += 1
+        return self.result
+
+
+class DecideState(TypedDict):
+    user_id: str
+    cleaned_message: str
+    should_forward: bool
+    reason: str
+
+
+class SummaryState(TypedDict):
+    text: str
+    overview: str
+    final: str
+
+
+def _decide_messages(state: DecideState) -> list[Any]:
+    llm_input = {"user_id": state["user_id"], "cleaned_message": state["cleaned_message"]}
+    return [SystemMessage(content=DECISION_PROMPT), HumanMessage(content=json.dumps(llm_input, ensure_ascii=False))]
+
+
+def _apply_decision(state: DecideState, result: Any) -> DecideState:
+    return {**state, "should_forward": bool(result.should_forward), "reason": str(result.reason or "").strip()}
+
+
+def _summary_messages(state: SummaryState) -> list[Any]:
+    return [SystemMessage(content="总结以下群聊"), HumanMessage(content=state["text"])]
+
+
+def _summary_finalize(state: SummaryState) -> dict[str, Any]:
+    return {"final": f"[SUMMARY] {state['overview']}"}
+
+
+# ---- rebuild：旧写法，调用参数捕获在闭包里，每条消息重新建图 ----
+
+
+def _build_decide_app(llm: Any) -> Any:
+    def decide_node(state: DecideState) -> DecideState:
+        return _apply_decision(state, llm.invoke(_decide_messages(state)))
+
+    async def adecide_node(state: DecideState) -> DecideState:
+        return _apply_decision(state, await llm.ainvoke(_decide_messages(state)))
+
+    graph = StateGraph(DecideState)
+    graph.add_node(
+        "decide",
+        RunnableLambda(trace_agent_node("decide", decide_node), afunc=trace_agent_node("decide", adecide_node)),
+    )
+    graph.add_edge(START, "decide")
+    graph.add_edge("decide", END)
+    return graph.compile()
+
+
+def _build_summary_app(llm: Any) -> Any:
+    def map_node(state: SummaryState) -> dict[str, Any]:
+        return {"overview": llm.invoke(_summary_messages(state)).overview}
+
+    async def amap_node(state: SummaryState) -> dict[str, Any]:
+        return {"overview": (await llm.ainvoke(_summary_messages(state))).overview}
+
+    graph = StateGraph(SummaryState)
+    graph.add_node(
+        "map_node",
+        RunnableLambda(trace_agent_node("map_node", map_node), afunc=trace_agent_node("map_node", amap_node)),
+    )
+    graph.add_node("finalize_node", trace_agent_node("finalize_node", _summary_finalize))
+    graph.add_edge(START, "map_node")
+    graph.add_edge("map_node", "finalize_node")
+    graph.add_edge("finalize_node", END)
+    return graph.compile()
+
+
+# ---- compiled：新写法，节点在模块级，LLMCallSpec 经 config 传入 ----
+
+
+def _decide_node(state: DecideState, config: RunnableConfig) -> DecideState:
+    call = llm_call_from_config(config)
+    return _apply_decision(state, call.llm.invoke(_decide_messages(state)))
+
+
+async def _adecide_node(state: DecideState, config: RunnableConfig) -> DecideState:
+    call = llm_call_from_config(config)
+    return _apply_decision(state, await call.llm.ainvoke(_decide_messages(state)))
+
+
+def _map_node(state: SummaryState, config: RunnableConfig) -> dict[str, Any]:
+    call = llm_call_from_config(config)
+    return {"overview": call.llm.invoke(_summary_messages(state)).overview}
+
+
+async def _amap_node(state: SummaryState, config: RunnableConfig) -> dict[str, Any]:
+    call = llm_call_from_config(config)
+    return {"overview": (await call.llm.ainvoke(_summary_messages(state))).overview}
+
+
+@lru_cache(maxsize=None)
+def _decide_graph() -> Any:
+    graph = StateGraph(DecideState)
+    graph.add_node(
+        "decide",
+        RunnableLambda(trace_agent_node("decide", _decide_node), afunc=trace_agent_node("decide", _adecide_node)),
+    )
+    graph.add_edge(START, "decide")
+    graph.add_edge("decide", END)
+    return graph.compile()
+
+
+@lru_cache(maxsize=None)
+def _summary_graph() -> Any:
+    graph = StateGraph(SummaryState)
+    graph.add_node(
+        "map_node",
+        RunnableLambda(trace_agent_node("map_node", _map_node), afunc=trace_agent_node("map_node", _amap_node)),
+    )
+    graph.add_node("finalize_node", trace_agent_node("finalize_node", _summary_finalize))
+    graph.add_edge(START, "map_node")
+    graph.add_edge("map_node", "finalize_node")
+    graph.add_edge("finalize_node", END)
+    return graph.compile()
+
+
+GRAPHS: dict[str, tuple[Callable[[Any], Any], Callable[[], Any], Any]] = {
+    "decide": (_build_decide_app, _decide_graph, SimpleNamespace(should_forward=True, reason="命中关键词")),
+    "summary": (_build_summary_app, _summary_graph, SimpleNamespace(overview="今日讨论了上线与回滚")),
+}
+
+
+def _replay_messages(count: int, seed: int) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    return [
+        (str(10000 + rng.randrange(200)), " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20))))
+        for _ in range(count)
+    ]
+
+
+def _initial_state(graph_name: str, user_id: str, text: str) -> dict[str, Any]:
+    if graph_name == "decide":
+        return {"user_id": user_id, "cleaned_message": text, "should_forward": False, "reason": ""}
+    return {"text": text, "overview": "", "final": ""}
+
+
+async def _run_once(graph_name: str, impl: str, messages: list[tuple[str, str]], use_async: bool) -> float:
+    build_app, compiled_graph, result = GRAPHS[graph_name]
+    llm = _ZeroLatencyLLM(result)
+    if impl == "compiled":
+        compiled_graph()  # 预热：只编译一次的代价不计入逐条调用
+
+    started = perf_counter()
+    for user_id, text in messages:
+        state = _initial_state(graph_name, user_id, text)
+        if impl == "rebuild":
+            app, config = build_app(llm), None
+        else:
+            app, config = compiled_graph(), LLMCallSpec(llm=llm, budget_kwargs={}, guard_kwargs={}).as_config()
+        if use_async:
+            await app.ainvoke(state, config=config)
+        else:
+            app.invoke(state, config=config)
+    elapsed = perf_counter() - started
+    if llm.calls != len(messages):
+        raise RuntimeError(f"{graph_name}/{impl} 调用次数不符：{llm.calls} != {len(messages)}")
+    return elapsed
+
+
+async def _main(count: int, graphs: list[str], use_async: bool, seed: int) -> None:
+    messages = _replay_messages(count, seed)
+    print(f"messages={count} invoke={'ainvoke' if use_async else 'invoke'}")
+    print(f"{'graph':<10}{'impl':<10}{'total s':>10}{'us/call':>12}{'saved us/call':>16}")
+    for graph_name in graphs:
+        rebuild_seconds = await _run_once(graph_name, "rebuild", messages, use_async)
+        compiled_seconds = await _run_once(graph_name, "compiled", messages, use_async)
+        rebuild_us = rebuild_seconds / count * 1e6
+        compiled_us = compiled_seconds / count * 1e6
+        print(f"{graph_name:<10}{'rebuild':<10}{rebuild_seconds:>10.3f}{rebuild_us:>12,.0f}{'':>16}")
+        print(f"{graph_name:<10}{'compiled':<10}{compiled_seconds:>10.3f}{compiled_us:>12,.0f}{rebuild_us - compiled_us:>16,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LangGraph 每次重建 vs 只编译一次的逐条调用开销对比")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--graphs", nargs="+", choices=tuple(GRAPHS), default=list(GRAPHS))
+    parser.add_argument("--async", dest="use_async", action="store_true", help="走 ainvoke（默认 invoke）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(_main(max(args.messages, 1), args.graphs, args.use_async, args.seed))
+
+
+if __name__ == "__main__":
+    main()
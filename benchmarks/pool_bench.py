@@ -0,0 +1,325 @@
+"""
+Agent 池端到端压测：用假 LLM 模拟 auto_reply / forward / summary 的混合负载，
+按泊松过程到达，经 setup_agent_pool / submit_agent_job 走完整的排队、调度与执行路径。
+
+报告（延迟按 time_scale 还原到真实时间尺度）：
+- 排队等待（提交 -> 开始执行）与端到端（提交 -> 拿到结果）的 p50 / p95 / p99
+- 吞吐（每秒完成数）、超时 / 淘汰 / 拒绝 / 失败计数
+- 容量利用率：任务执行时间总和 / (容量 × 压测时长)，容量为 Worker 数（异步任务不占 Worker 时为 async_concurrency）
+
+用法：
+    python -m benchmarks.pool_bench
+    python -m benchmarks.pool_bench --workers 2 4 8 --modes strict fair_share --rate 3 --duration 300
+    python -m benchmarks.pool_bench --mix auto_reply=0.3 forward=0.6 summary=0.1 --job-mode thread --json out.json
+
+注意：车道（lanes）、淘汰策略（shed_policy）、老化等仍读取 workflows/agent_config.yaml 的 agent_pool_config。
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+
+from agent_pool import (
+    AgentJobShed,
+    get_agent_pool_stats,
+    setup_agent_pool,
+    stop_agent_pool,
+    submit_agent_job,
+)
+from benchmarks.fake_llm import FakeLLM
+
+
+@dataclass(frozen=True)
+class JobProfile:
+    """一类工作流任务：提交参数与其中每次 LLM 调用的延迟分布（毫秒）。"""
+
+    name: str
+    priority: int
+    lane: str
+    timeout: float
+    llm_calls: int
+    median_ms: float
+    p95_ms: float
+
+
+# 与工作流里 submit_agent_job 的参数保持一致；延迟为经验值，按需用 --latency-scale 整体放缩
+PROFILES: dict[str, JobProfile] = {
+    "auto_reply": JobProfile("auto_reply", 0, "interactive", 120.0, 2, 900.0, 3500.0),
+    "forward": JobProfile("forward", 5, "near_real_time", 120.0, 1, 700.0, 2500.0),
+    "summary": JobProfile("summary", 6, "batch", 180.0, 4, 5000.0, 15000.0),
+}
+
+
+@dataclass
+class JobRecord:
+    agent_name: str
+    submitted: float
+    started: float | None = None
+    executed: float = 0.0
+    finished: float | None = None
+    outcome: str = "pending"
+
+
+@dataclass
+class RunResult:
+    workers: int
+    mode: str
+    impl: str
+    wall_seconds: float
+    capacity: int
+    records: list[JobRecord] = field(default_factory=list)
+    pool_stats: dict[str, Any] = field(default_factory=dict)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(max(math.ceil(q * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[index]
+
+
+def _parse_mix(items: list[str]) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for item in items:
+        name, _, weight = item.partition("=")
+        if name not in PROFILES:
+            raise SystemExit(f"未知任务类型: {name}（可选 {', '.join(PROFILES)}）")
+        mix[name] = float(weight or 1.0)
+    total = sum(mix.values())
+    if total <= 0:
+        raise SystemExit("--mix 权重之和必须 > 0")
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def _build_llms(args: argparse.Namespace) -> dict[str, FakeLLM]:
+    return {
+        name: FakeLLM(
+            median_ms=profile.median_ms * args.latency_scale,
+            p95_ms=profile.p95_ms * args.latency_scale,
+            error_rate=args.error_rate,
+            time_scale=args.time_scale,
+            seed=args.seed + index,
+        )
+        for index, (name, profile) in enumerate(PROFILES.items())
+    }
+
+
+def _make_job(profile: JobProfile, llm: FakeLLM, record: JobRecord, *, threaded: bool) -> Any:
+    """返回一个与工作流形态相同的任务函数：依次调用 llm_calls 次 LLM，并记录开始时刻与执行时长。"""
+    if threaded:
+
+        def run_sync() -> str:
+            record.started = perf_counter()
+            try:
+                for _ in range(profile.llm_calls):
+                    llm.invoke()
+            finally:
+                record.executed = perf_counter() - record.started
+            return profile.name
+
+        return run_sync
+
+    async def run_async() -> str:
+        record.started = perf_counter()
+        try:
+            for _ in range(profile.llm_calls):
+                await llm.ainvoke()
+        finally:
+            record.executed = perf_counter() - record.started
+        return profile.name
+
+    return run_async
+
+
+async def _submit(profile: JobProfile, llm: FakeLLM, record: JobRecord, args: argparse.Namespace) -> None:
+    threaded = args.job_mode == "thread"
+    try:
+        await submit_agent_job(
+            _make_job(profile, llm, record, threaded=threaded),
+            priority=profile.priority,
+            timeout=profile.timeout * args.time_scale,
+            run_in_thread=threaded,
+            agent_name=profile.name,
+            lane=profile.lane,
+        )
+        record.outcome = "ok"
+    except asyncio.TimeoutError:
+        record.outcome = "timeout"
+    except AgentJobShed:
+        record.outcome = "shed"
+    except asyncio.CancelledError:
+        record.outcome = "cancelled"
+    except RuntimeError as error:
+        record.outcome = "rejected" if "队列已满" in str(error) else "error"
+    except Exception:
+        record.outcome = "error"
+    record.finished = perf_counter()
+
+
+async def _run_once(args: argparse.Namespace, mix: dict[str, float], workers: int, mode: str, impl: str) -> RunResult:
+    # 每组配置使用相同的到达序列与延迟序列，结果可直接横向对比
+    rng = random.Random(args.seed)
+    llms = _build_llms(args)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    rate = args.rate / args.time_scale
+    horizon = args.duration * args.time_scale
+
+    await setup_agent_pool(
+        worker_count=workers,
+        maxsize=args.maxsize,
+        scheduling_mode=mode,
+        scheduler_impl=impl,
+        autoscale=False,
+        durable=False,
+        async_concurrency=args.async_concurrency,
+    )
+    records: list[JobRecord] = []
+    pending: list[asyncio.Task] = []
+    started = perf_counter()
+    next_arrival = started
+    try:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - started >= horizon:
+                break
+            delay = next_arrival - perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = rng.choices(names, weights)[0]
+            record = JobRecord(agent_name=name, submitted=perf_counter())
+            records.append(record)
+            pending.append(asyncio.create_task(_submit(PROFILES[name], llms[name], record, args)))
+        if pending:
+            await asyncio.gather(*pending)
+        wall = perf_counter() - started
+        pool_stats = get_agent_pool_stats()
+    finally:
+        await stop_agent_pool(wait_for_pending=True)
+
+    occupies_worker = args.job_mode == "thread" or args.async_concurrency <= 0
+    return RunResult(
+        workers=workers,
+        mode=mode,
+        impl=impl,
+        wall_seconds=wall,
+        capacity=workers if occupies_worker else args.async_concurrency,
+        records=records,
+        pool_stats=pool_stats,
+    )
+
+
+def _summarize(records: list[JobRecord], result: RunResult, time_scale: float) -> dict[str, Any]:
+    # 先除以 time_scale 还原到真实时间尺度（毫秒）
+    to_ms = 1000.0 / time_scale
+    waits = [(r.started - r.submitted) * to_ms for r in records if r.started is not None]
+    e2e = [(r.finished - r.submitted) * to_ms for r in records if r.outcome == "ok" and r.finished is not None]
+    counts: dict[str, int] = {}
+    for record in records:
+        counts[record.outcome] = counts.get(record.outcome, 0) + 1
+    model_seconds = result.wall_seconds / time_scale
+    return {
+        "jobs": len(records),
+        **{outcome: counts.get(outcome, 0) for outcome in ("ok", "timeout", "shed", "rejected", "error", "cancelled")},
+        "throughput_per_s": round(counts.get("ok", 0) / model_seconds, 3) if model_seconds > 0 else 0.0,
+        "queue_wait_ms": {f"p{int(q * 100)}": round(_percentile(waits, q), 1) for q in (0.50, 0.95, 0.99)},
+        "e2e_ms": {f"p{int(q * 100)}": round(_percentile(e2e, q), 1) for q in (0.50, 0.95, 0.99)},
+    }
+
+
+def _report(result: RunResult, time_scale: float) -> dict[str, Any]:
+    busy = sum(record.executed for record in result.records)
+    utilization = busy / (result.capacity * result.wall_seconds) if result.wall_seconds > 0 else 0.0
+    per_agent = {
+        name: _summarize([r for r in result.records if r.agent_name == name], result, time_scale)
+        for name in sorted({record.agent_name for record in result.records})
+    }
+    return {
+        "workers": result.workers,
+        "mode": result.mode,
+        "impl": result.impl,
+        "capacity": result.capacity,
+        "utilization": round(utilization, 3),
+        "all": _summarize(result.records, result, time_scale),
+        "agents": per_agent,
+        "lanes_enabled": bool(result.pool_stats.get("lanes")),
+    }
+
+
+def _print_report(report: dict[str, Any]) -> None:
+    print(
+        f"\nworkers={report['workers']} mode={report['mode']} impl={report['impl']} "
+        f"utilization={report['utilization']:.1%} lanes={'on' if report['lanes_enabled'] else 'off'}"
+    )
+    print(
+        f"{'agent':<12}{'jobs':>6}{'ok':>6}{'tmo':>5}{'shed':>5}{'rej':>5}{'err':>5}{'thr/s':>8}"
+        f"{'wait p50':>10}{'p95':>9}{'p99':>9}{'e2e p50':>10}{'p95':>9}{'p99':>9}"
+    )
+    rows = [*report["agents"].items(), ("ALL", report["all"])]
+    for name, row in rows:
+        wait, e2e = row["queue_wait_ms"], row["e2e_ms"]
+        print(
+            f"{name:<12}{row['jobs']:>6}{row['ok']:>6}{row['timeout']:>5}{row['shed']:>5}{row['rejected']:>5}"
+            f"{row['error']:>5}{row['throughput_per_s']:>8.2f}"
+            f"{wait['p50']:>10.0f}{wait['p95']:>9.0f}{wait['p99']:>9.0f}"
+            f"{e2e['p50']:>10.0f}{e2e['p95']:>9.0f}{e2e['p99']:>9.0f}"
+        )
+
+
+async def _main(args: argparse.Namespace) -> None:
+    mix = _parse_mix(args.mix)
+    print(
+        f"rate={args.rate}/s duration={args.duration}s mix={mix} job_mode={args.job_mode} "
+        f"time_scale={args.time_scale} error_rate={args.error_rate}（延迟单位 ms，已还原到真实时间尺度）"
+    )
+    reports = []
+    for workers in args.workers:
+        for mode in args.modes:
+            for impl in args.impls:
+                result = await _run_once(args, mix, workers, mode, impl)
+                report = _report(result, args.time_scale)
+                _print_report(report)
+                reports.append(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"args": vars(args), "runs": reports}, file, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Agent 池端到端压测（假 LLM）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=("strict", "fair_share"), default=["strict", "fair_share"])
+    parser.add_argument("--impls", nargs="+", choices=("heap", "bucket"), default=["bucket"])
+    parser.add_argument("--rate", type=float, default=2.0, help="平均到达速率（每秒任务数，真实时间尺度）")
+    parser.add_argument("--duration", type=float, default=120.0, help="到达持续时长（秒，真实时间尺度）")
+    parser.add_argument("--mix", nargs="+", default=["auto_reply=0.5", "forward=0.4", "summary=0.1"])
+    parser.add_argument("--job-mode", choices=("async", "thread"), default="async",
+                        help="async：协程任务（ainvoke）；thread：run_in_thread 同步任务（invoke）")
+    parser.add_argument("--async-concurrency", type=int, default=0,
+                        help="原生异步任务并发上限，0 表示异步任务占用 Worker（Worker 数即容量）")
+    parser.add_argument("--maxsize", type=int, default=100, help="队列容量")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="时间压缩比例，0.01 表示 100 倍速")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="所有 LLM 延迟分布整体乘以该系数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="每次 LLM 调用的注入失败概率")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", default="", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+    if args.time_scale <= 0 or args.rate <= 0:
+        parser.error("--time-scale 与 --rate 必须 > 0")
+    # 注入失败时池会为每个失败任务打印异常栈，压测时只保留严重错误
+    logging.getLogger("agent_pool").setLevel(logging.CRITICAL)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
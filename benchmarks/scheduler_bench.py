@@ -0,0 +1,61 @@
+"""
+PriorityScheduler 入队/出队吞吐对比：heap（堆 + Condition）vs bucket（16 桶 + 位图）。
+
+用法：
+    python -m benchmarks.scheduler_bench
+    python -m benchmarks.scheduler_bench --sizes 10000 100000 1000000 --mode fair_share
+"""
+
+from __future__ import annotations
+
+from time import perf_counter
+import argparse
+import asyncio
+import random
+
+from agent_pool import Task, _build_scheduler
+
+
+AGENT_NAMES = ("auto_reply", "dida_agent", "forward", "summary")
+
+
+async def _run_once(impl: str, size: int, mode: str, seed: int) -> tuple[float, float]:
+    rng = random.Random(seed)
+    scheduler = _build_scheduler(impl, 0, mode=mode, weights={"auto_reply": 4, "dida_agent": 2})
+    tasks = [
+        Task(priority=rng.randrange(16), data=None, agent_name=AGENT_NAMES[index % len(AGENT_NAMES)])
+        for index in range(size)
+    ]
+
+    started = perf_counter()
+    for task in tasks:
+        await scheduler.put(task)
+    put_seconds = perf_counter() - started
+
+    started = perf_counter()
+    for _ in range(size):
+        await scheduler.pop()
+    pop_seconds = perf_counter() - started
+    return put_seconds, pop_seconds
+
+
+async def _main(sizes: list[int], mode: str, seed: int) -> None:
+    print(f"mode={mode}")
+    print(f"{'impl':<8}{'ops':>10}{'put ops/s':>14}{'pop ops/s':>14}")
+    for size in sizes:
+        for impl in ("heap", "bucket"):
+            put_seconds, pop_seconds = await _run_once(impl, size, mode, seed)
+            print(f"{impl:<8}{size:>10}{size / put_seconds:>14,.0f}{size / pop_seconds:>14,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PriorityScheduler heap/bucket 吞吐对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--mode", choices=("strict", "fair_share"), default="strict")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(_main(args.sizes, args.mode, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -38,12 +38,9 @@ def load_agent_config_by_filename(
     return {}
 
 
-def load_current_agent_config(module_file: str) -> dict[str, Any]:
-    """根据当前模块文件路径读取配置：优先 YAML，回退 JSON。"""
-    module_dir = os.path.dirname(module_file)
-    current_file_name = os.path.basename(module_file)
-
-    yaml_path = os.path.join(module_dir, "agent_config.yaml")
+def load_agent_config_from_dir(file_name: str, *, config_dir: str) -> dict[str, Any]:
+    """在指定目录按 `file_name` 读取配置：优先 YAML，回退 JSON。"""
+    yaml_path = os.path.join(config_dir, "agent_config.yaml")
     if yaml is not None and os.path.exists(yaml_path):
         try:
             with open(yaml_path, "r", encoding="utf-8") as file:
@@ -55,11 +52,19 @@ def load_current_agent_config(module_file: str) -> dict[str, Any]:
             for item in payload.values():
                 if not isinstance(item, dict):
                     continue
-                if str(item.get("file_name", "")).strip() != current_file_name:
+                if str(item.get("file_name", "")).strip() != file_name:
                     continue
                 config = item.get("config")
                 if isinstance(config, dict):
                     return dict(config)
 
-    config_path = os.path.join(module_dir, "agent_config.json")
-    return load_agent_config_by_filename(current_file_name, config_path=config_path)
+    config_path = os.path.join(config_dir, "agent_config.json")
+    return load_agent_config_by_filename(file_name, config_path=config_path)
+
+
+def load_current_agent_config(module_file: str) -> dict[str, Any]:
+    """根据当前模块文件路径读取配置：优先 YAML，回退 JSON。"""
+    return load_agent_config_from_dir(
+        os.path.basename(module_file),
+        config_dir=os.path.dirname(module_file),
+    )
@@ -4,32 +4,49 @@ from __future__ import annotations
 
 import asyncio
 from dataclasses import dataclass, field
+from functools import lru_cache
 from datetime import datetime, timezone
 from time import perf_counter
 from types import SimpleNamespace
 from typing import Any, Awaitable, Callable, TypedDict
 import json
-import os
 import re
 
 from ncatbot.core import GroupMessage, PrivateMessage
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
-from agent_pool import submit_agent_job
+from agent_pool import (
+    AgentJobAbandoned,
+    AgentRetryPolicy,
+    forget_durable_job,
+    persist_durable_job,
+    raise_if_agent_job_abandoned,
+    register_durable_job,
+    submit_agent_job,
+    trace_agent_node,
+)
 from bot import bot
 from workflows.agent_observe import bind_agent_event, generate_run_id
 from workflows.agent_config_loader import load_current_agent_config
-
-try:
-    from dotenv import load_dotenv
-except Exception:  # pragma: no cover
-    load_dotenv = None
+from workflows.llm_gateway import LLMCallSpec, llm_call_from_config, route_llm
+from workflows.llm_circuit_breaker import TRANSIENT_LLM_ERRORS, LLMCircuitOpenError, llm_call_guard
+from workflows.llm_rate_limiter import aacquire_llm_budget
+from workflows.llm_response_cache import alookup_llm_response, astore_llm_response, llm_cache_scope
+from workflows.llm_hedging import ahedged_invoke, llm_hedge_for
+from workflows.llm_cascade import acascade_invoke, llm_cascade_for
+from workflows.trigger_expression import compile_trigger_expression
 
 
 AUTO_REPLY_CONFIG = load_current_agent_config(__file__)
+# LLM 临时故障时由 Agent 池退避后重新入队（retry 段缺省时按默认策略重试）
+AUTO_REPLY_RETRY_POLICY = AgentRetryPolicy.from_config(AUTO_REPLY_CONFIG.get("retry", {}), retry_on=TRANSIENT_LLM_ERRORS)
+# 回复生成不做本地兜底、直接抛出的错误：熔断打开、调用方已放弃，以及交给 retry 重试的临时故障
+REPLY_PROPAGATE_ERRORS: tuple[type[BaseException], ...] = (LLMCircuitOpenError, AgentJobAbandoned) + TRANSIENT_LLM_ERRORS
+# trigger_mode 可用的原子条件（表达式编译见 trigger_expression）
+TRIGGER_CONDITIONS = frozenset({"at_bot", "keyword", "always", "ai_decide"})
 
 
 def get_auto_reply_runtime_config() -> dict[str, Any]:
@@ -174,6 +191,10 @@ def _default_reply_when_parse_failed() -> str:
     return "抱歉，刚才回复格式异常，请再说一次，我马上继续。"
 
 
+def _pending_job_key(session_key: str) -> str:
+    return f"auto_reply:pending:{session_key}"
+
+
 class AutoReplyDispatcher:
     """AutoReply 接入层：监控命中 + 冷却窗口 + pending 聚合/过期。"""
 
@@ -303,6 +324,14 @@ class AutoReplyDispatcher:
                 next_allowed_at = float(state.get("next_allowed_at", 0.0) or 0.0)
                 if now < next_allowed_at:
                     state["pending_payload"] = auto_reply_payload
+                    # 防抖中的 pending 消息写入持久化存储（启用 durable_queue 时），重启后直接重放
+                    persist_durable_job(
+                        _pending_job_key(session_key),
+                        "auto_reply",
+                        {"payload": auto_reply_payload},
+                        priority=0,
+                        agent_name="auto_reply",
+                    )
                     previous_count = int(state.get("pending_count", 0) or 0)
                     state["pending_count"] = min(previous_count + 1, pending_max_messages)
                     if not float(state.get("pending_since", 0.0) or 0.0):
@@ -319,6 +348,7 @@ class AutoReplyDispatcher:
                 else:
                     state["next_allowed_at"] = now + min_reply_interval
                     state["pending_payload"] = None
+                    forget_durable_job(_pending_job_key(session_key))
                     state["pending_since"] = 0.0
                     state["pending_count"] = 0
 
@@ -370,6 +400,7 @@ class AutoReplyDispatcher:
                         state["pending_payload"] = None
                         state["pending_since"] = 0.0
                         state["pending_count"] = 0
+                        forget_durable_job(_pending_job_key(session_key))
                         continue
 
                     next_allowed_at = float(state.get("next_allowed_at", 0.0) or 0.0)
@@ -385,6 +416,7 @@ class AutoReplyDispatcher:
                     )
                     due_payloads.append(pending_payload)
                     state["pending_payload"] = None
+                    forget_durable_job(_pending_job_key(session_key))
                     state["pending_since"] = 0.0
                     state["pending_count"] = 0
                     state["next_allowed_at"] = now + min_interval if min_interval > 0 else 0.0
@@ -488,7 +520,7 @@ async def _execute_auto_reply_payload(payload: dict[str, str]) -> None:
 
     try:
         result = await submit_agent_job(
-            run_auto_reply_pipeline,
+            arun_auto_reply_pipeline,
             chat_type=chat_type,
             group_id=group_id,
             user_id=user_id,
@@ -499,7 +531,12 @@ async def _execute_auto_reply_payload(payload: dict[str, str]) -> None:
             run_id=run_id,
             priority=0,
             timeout=120.0,
-            run_in_thread=True,
+            agent_name="auto_reply",
+            lane="interactive",
+            retry=AUTO_REPLY_RETRY_POLICY,
+            job_run_id=run_id,
+            durable_job="auto_reply",
+            durable_args={"payload": payload},
         )
         elapsed_ms = (perf_counter() - started) * 1000
         log_event(
@@ -549,6 +586,9 @@ async def _execute_auto_reply_payload(payload: dict[str, str]) -> None:
         )
 
 
+register_durable_job("auto_reply", _execute_auto_reply_payload)
+
+
 def _create_auto_reply_task(payload: dict[str, str]) -> None:
     task = asyncio.create_task(_execute_auto_reply_payload(payload))
 
@@ -718,6 +758,147 @@ class AutoReplyGenerateState(TypedDict):
     reply_text: str
 
 
+def _build_llm_messages(state: AutoReplyAIState | AutoReplyGenerateState) -> list[Any]:
+    llm_input = {
+        "chat_type": state["chat_type"],
+        "group_id": state["group_id"],
+        "user_id": state["user_id"],
+        "user_name": state["user_name"],
+        "ts": state["ts"],
+        "raw_message": state["raw_message"],
+        "cleaned_message": state["cleaned_message"],
+        "history_messages": state["history_messages"],
+    }
+    return [
+        SystemMessage(content=state["prompt"]),
+        HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
+    ]
+
+
+def _apply_ai_decision(state: AutoReplyAIState, result: AutoReplyAIDecision) -> AutoReplyAIState:
+    return {
+        **state,
+        "should_reply": bool(result.should_reply),
+        "reason": str(result.reason or "").strip(),
+    }
+
+
+async def _aai_decide_node(state: AutoReplyAIState, config: RunnableConfig) -> AutoReplyAIState:
+    call = llm_call_from_config(config)
+    messages = _build_llm_messages(state)
+    raise_if_agent_job_abandoned("ai_decide")
+    result = await alookup_llm_response(call.cache, messages)
+    if result is None:
+        result = await acascade_invoke(
+            call.llm,
+            messages,
+            guard_kwargs=call.guard_kwargs,
+            budget_kwargs=call.budget_kwargs,
+            cascade=call.cascade,
+            hedge=call.hedge,
+        )
+        await astore_llm_response(call.cache, messages, result)
+    return _apply_ai_decision(state, result)
+
+
+def _apply_reply_result(state: AutoReplyGenerateState, result: Any, *, include_raw: bool) -> AutoReplyGenerateState:
+    if include_raw and isinstance(result, dict):
+        parsed = result.get("parsed")
+        if parsed is not None:
+            return {
+                **state,
+                "reply_text": str(getattr(parsed, "reply_text", "") or "").strip(),
+            }
+        raw_output = result.get("raw")
+        fallback_reply = _extract_reply_text_from_raw_output(raw_output)
+        if fallback_reply:
+            return {
+                **state,
+                "reply_text": fallback_reply,
+            }
+        parse_error = result.get("parsing_error")
+        if parse_error:
+            return {
+                **state,
+                "reply_text": _default_reply_when_parse_failed(),
+            }
+        return {
+            **state,
+            "reply_text": _default_reply_when_parse_failed(),
+        }
+    structured_reply = str(getattr(result, "reply_text", "") or "").strip()
+    if structured_reply:
+        return {
+            **state,
+            "reply_text": structured_reply,
+        }
+    fallback_reply = _extract_reply_text_from_raw_output(result)
+    return {
+        **state,
+        "reply_text": fallback_reply or _default_reply_when_parse_failed(),
+    }
+
+
+def _apply_reply_fallback(state: AutoReplyGenerateState, fallback_reply: str) -> AutoReplyGenerateState:
+    return {
+        **state,
+        "reply_text": fallback_reply or _default_reply_when_parse_failed(),
+    }
+
+
+async def _areply_generate_node(state: AutoReplyGenerateState, config: RunnableConfig) -> AutoReplyGenerateState:
+    call = llm_call_from_config(config)
+    messages = _build_llm_messages(state)
+    raise_if_agent_job_abandoned("reply_generate")
+    cached = await alookup_llm_response(call.cache, messages)
+    if cached is not None:
+        return _apply_reply_result(state, cached, include_raw=call.include_raw)
+    try:
+        result = await ahedged_invoke(
+            call.llm,
+            messages,
+            guard_kwargs=call.guard_kwargs,
+            budget_kwargs=call.budget_kwargs,
+            hedge=call.hedge,
+        )
+    except ValueError:
+        # 只有结构化输出解析 / 校验失败（OutputParserException、ValidationError 都是 ValueError）才改用原始输出兜底
+        fallback_reply = ""
+        try:
+            with llm_call_guard(**call.guard_kwargs) as guard:
+                await aacquire_llm_budget(messages, **call.budget_kwargs)
+                guard.mark_sent()
+                raw_result = await call.raw_llm.ainvoke(messages)
+            fallback_reply = _extract_reply_text_from_raw_output(raw_result)
+        except REPLY_PROPAGATE_ERRORS:
+            raise
+        except Exception:
+            fallback_reply = ""
+        return _apply_reply_fallback(state, fallback_reply)
+    await astore_llm_response(call.cache, messages, result)
+    return _apply_reply_result(state, result, include_raw=call.include_raw)
+
+
+@lru_cache(maxsize=None)
+def _ai_decide_graph() -> Any:
+    """ai_decide 判定图，进程内只编译一次；模型与限流 / 熔断参数由调用方经 config 传入（LLMCallSpec）。"""
+    graph = StateGraph(AutoReplyAIState)
+    graph.add_node("decide", trace_agent_node("decide", _aai_decide_node))
+    graph.add_edge(START, "decide")
+    graph.add_edge("decide", END)
+    return graph.compile()
+
+
+@lru_cache(maxsize=None)
+def _reply_generate_graph() -> Any:
+    """回复生成图，进程内只编译一次；调用参数同样经 config 传入。"""
+    graph = StateGraph(AutoReplyGenerateState)
+    graph.add_node("generate", trace_agent_node("generate", _areply_generate_node))
+    graph.add_edge(START, "generate")
+    graph.add_edge("generate", END)
+    return graph.compile()
+
+
 class AutoReplyDecisionEngine:
     """自动回复判定器：负责读取规则表达式并计算 should_reply。"""
 
@@ -731,8 +912,8 @@ class AutoReplyDecisionEngine:
         except (TypeError, ValueError):
             self.temperature = 0.0
 
-    def should_reply(self, context: AutoReplyMessageContext) -> dict[str, Any]:
-        context_event = bind_agent_event(
+    def _context_event(self, context: AutoReplyMessageContext) -> Callable[..., None]:
+        return bind_agent_event(
             agent_name="auto_reply",
             task_type="AUTO_REPLY",
             run_id=context.run_id,
@@ -742,6 +923,8 @@ class AutoReplyDecisionEngine:
             user_name=context.user_name,
             ts=context.ts,
         )
+
+    def _matching_rules(self, context: AutoReplyMessageContext) -> list[dict[str, Any]]:
         matching_rules = []
         for rule in self.rules:
             rule_chat_type = str(rule.get("chat_type", "")).strip().lower()
@@ -752,91 +935,103 @@ class AutoReplyDecisionEngine:
             if target_number != str(current_number):
                 continue
             matching_rules.append(rule)
+        return matching_rules
 
+    async def ashould_reply(self, context: AutoReplyMessageContext) -> dict[str, Any]:
+        """按规则顺序求值 trigger_mode，命中第一条即返回；ai_decide 条件走 ainvoke。"""
+        context_event = self._context_event(context)
+        matching_rules = self._matching_rules(context)
         context_event(
             stage="rules_filtered",
             extra={"configured_rules": len(self.rules), "matched_rules": len(matching_rules)},
         )
 
+        failure_reasons: list[str] = []
+        for idx, rule in enumerate(matching_rules):
+            expression = str(rule.get("trigger_mode") or "always").strip()
+            ok, reason = await self.aevaluate_trigger_expression(expression, rule, context)
+            result = self._record_rule_result(context_event, idx, rule, expression, ok, reason, failure_reasons)
+            if result is not None:
+                return result
+        return self._finish_decision(context_event, matching_rules, failure_reasons)
+
+    def _record_rule_result(
+        self,
+        context_event: Callable[..., None],
+        idx: int,
+        rule: dict[str, Any],
+        expression: str,
+        ok: bool,
+        reason: str,
+        failure_reasons: list[str],
+    ) -> dict[str, Any] | None:
+        context_event(
+            stage="rule_evaluated",
+            decision={"should_reply": ok, "reason": reason},
+            extra={"rule_index": idx, "trigger_mode": expression},
+        )
+        if ok:
+            result = {
+                "should_reply": True,
+                "reason": reason,
+                "matched_rule": idx,
+                "trigger_mode": expression,
+                "reply_prompt": str(rule.get("reply_prompt") or "").strip(),
+                "rule": rule
+            }
+            context_event(stage="decision_end", decision=result)
+            return result
+        failure_reasons.append(f"rule#{idx}:{reason}")
+        return None
+
+    def _finish_decision(
+        self,
+        context_event: Callable[..., None],
+        matching_rules: list[dict[str, Any]],
+        failure_reasons: list[str],
+    ) -> dict[str, Any]:
         if not matching_rules:
             result = {
                 "should_reply": False,
                 "reason": "未命中启用规则",
                 "matched_rule": None,
             }
-            context_event(stage="decision_end", decision=result)
-            return result
-
-        failure_reasons: list[str] = []
-        for idx, rule in enumerate(matching_rules):
-            expression = str(rule.get("trigger_mode") or "always").strip()
-            ok, reason = self.evaluate_trigger_expression(expression, rule, context)
-            context_event(
-                stage="rule_evaluated",
-                decision={"should_reply": ok, "reason": reason},
-                extra={"rule_index": idx, "trigger_mode": expression},
-            )
-            if ok:
-                result = {
-                    "should_reply": True,
-                    "reason": reason,
-                    "matched_rule": idx,
-                    "trigger_mode": expression,
-                    "reply_prompt": str(rule.get("reply_prompt") or "").strip(),
-                    "rule": rule
-                }
-                context_event(stage="decision_end", decision=result)
-                return result
-            failure_reasons.append(f"rule#{idx}:{reason}")
-
-        result = {
-            "should_reply": False,
-            "reason": "; ".join(failure_reasons) if failure_reasons else "规则未触发",
-            "matched_rule": None,
-        }
+        else:
+            result = {
+                "should_reply": False,
+                "reason": "; ".join(failure_reasons) if failure_reasons else "规则未触发",
+                "matched_rule": None,
+            }
         context_event(stage="decision_end", decision=result)
         return result
 
-    def evaluate_trigger_expression(
+    def _evaluate_sync_condition(
         self,
-        expression: str,
+        token: str,
         rule: dict[str, Any],
         context: AutoReplyMessageContext,
     ) -> tuple[bool, str]:
-        allowed_conditions = {
-            "at_bot": lambda: self.condition_at_bot(context),
-            "keyword": lambda: self.condition_keyword(rule, context),
-            "always": lambda: self.condition_always(),
-            "ai_decide": lambda: self.condition_ai_decide(rule, context),
-        }
+        if token == "at_bot":
+            return self.condition_at_bot(context)
+        if token == "keyword":
+            return self.condition_keyword(rule, context)
+        return self.condition_always()
 
-        tokens = set(re.findall(r"\b[a-zA-Z_][a-zA-Z0-9_]*\b", expression))
-        invalid_tokens = [token for token in tokens if token not in allowed_conditions]
-        if invalid_tokens:
-            invalid_text = ",".join(sorted(invalid_tokens))
-            return False, "trigger_mode 包含未知条件: " + invalid_text
-
-        condition_values: dict[str, bool] = {}
-        condition_reasons: dict[str, str] = {}
-        for token in tokens:
-            value, reason = allowed_conditions[token]()
-            condition_values[token] = bool(value)
-            condition_reasons[token] = reason
-
-        py_expr = expression.replace("&&", " and ").replace("||", " or ")
-        py_expr = re.sub(r"!\s*", " not ", py_expr)
-
-        try:
-            result = bool(eval(py_expr, {"__builtins__": {}}, condition_values))
-        except Exception as error:
-            return False, f"trigger_mode 解析失败: {error}"
+    async def aevaluate_trigger_expression(
+        self,
+        expression: str,
+        rule: dict[str, Any],
+        context: AutoReplyMessageContext,
+    ) -> tuple[bool, str]:
+        """表达式只编译一次；短路求值且先算便宜条件，keyword / at_bot 已能决定结果时不再调用 ai_decide。"""
+        trigger = compile_trigger_expression(expression, TRIGGER_CONDITIONS)
 
-        if result:
-            return True, f"命中表达式: {expression}"
+        async def resolve(token: str) -> tuple[bool, str]:
+            if token == "ai_decide":
+                return await self.acondition_ai_decide(rule, context)
+            return self._evaluate_sync_condition(token, rule, context)
 
-        reason_text = ", ".join([f"{name}={condition_values[name]}" for name in sorted(condition_values)])
-        detail_text = "; ".join([f"{name}:{condition_reasons[name]}" for name in sorted(condition_reasons)])
-        return False, f"表达式未命中: {reason_text}; {detail_text}"
+        return await trigger.aevaluate(resolve)
 
     def condition_always(self) -> tuple[bool, str]:
         return True, "always=true"
@@ -869,18 +1064,18 @@ class AutoReplyDecisionEngine:
                 return True, f"命中关键词: {keyword_text}"
         return False, "未命中关键词"
 
-    def condition_ai_decide(self, rule: dict[str, Any], context: AutoReplyMessageContext) -> tuple[bool, str]:
-        prompt = str(rule.get("ai_decision_prompt") or "").strip()
-        if not prompt:
-            return False, "缺少 ai_decision_prompt"
-
+    def _ai_decide_call(
+        self,
+        rule: dict[str, Any],
+        context: AutoReplyMessageContext,
+    ) -> tuple[LLMCallSpec | None, str]:
+        """准备 ai_decide 的 LLM 调用参数，返回 (LLMCallSpec, 跳过原因)；判定图本身只编译一次（_ai_decide_graph）。"""
         model_name = str(rule.get("decision_model") or rule.get("model") or self.model)
 
-        if load_dotenv is not None:
-            load_dotenv(override=False)
-        api_key = os.getenv("LLM_API_KEY")
-        if not api_key:
-            return False, "缺少 LLM_API_KEY"
+        try:
+            route = route_llm(model_name)
+        except ValueError as error:
+            return None, str(error)
 
         rule_temp = rule.get("temperature")
         if rule_temp is not None:
@@ -891,102 +1086,109 @@ class AutoReplyDecisionEngine:
         else:
             temperature = self.temperature
         
-        llm_kwargs: dict[str, Any] = {
-            "model_name": model_name,
-            "temperature": temperature,
-            "openai_api_key": api_key,
-        }
-        base_url = os.getenv("LLM_API_BASE_URL")
-        if base_url:
-            llm_kwargs["openai_api_base"] = base_url
-
-        llm = ChatOpenAI(**llm_kwargs).with_structured_output(AutoReplyAIDecision)
-
-        def decide_node(state: AutoReplyAIState) -> AutoReplyAIState:
-            llm_input = {
-                "chat_type": state["chat_type"],
-                "group_id": state["group_id"],
-                "user_id": state["user_id"],
-                "user_name": state["user_name"],
-                "ts": state["ts"],
-                "raw_message": state["raw_message"],
-                "cleaned_message": state["cleaned_message"],
-                "history_messages": state["history_messages"],
-            }
-            result = llm.invoke(
-                [
-                    SystemMessage(content=state["prompt"]),
-                    HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
-                ]
-            )
-            return {
-                **state,
-                "should_reply": bool(result.should_reply),
-                "reason": str(result.reason or "").strip(),
-            }
-
-        graph = StateGraph(AutoReplyAIState)
-        graph.add_node("decide", decide_node)
-        graph.add_edge(START, "decide")
-        graph.add_edge("decide", END)
-        app = graph.compile()
-        context_event = bind_agent_event(
+        llm = route.structured_model(AutoReplyAIDecision, temperature=temperature)
+        budget_kwargs = route.budget_kwargs("auto_reply", run_id=context.run_id)
+        guard_kwargs = route.guard_kwargs("auto_reply", run_id=context.run_id)
+        cascade = llm_cascade_for(
             agent_name="auto_reply",
-            task_type="AUTO_REPLY",
+            schema=AutoReplyAIDecision,
+            model=model_name,
+            temperature=temperature,
+            run_id=context.run_id,
+        )
+        cache = llm_cache_scope(
+            agent_name="auto_reply",
+            schema=AutoReplyAIDecision,
+            model=cascade.cache_model if cascade is not None else model_name,
+            temperature=temperature,
             run_id=context.run_id,
-            chat_type=context.chat_type,
-            group_id=context.group_id,
-            user_id=context.user_id,
-            user_name=context.user_name,
-            ts=context.ts,
         )
+        hedge = llm_hedge_for(
+            agent_name="auto_reply",
+            schema=AutoReplyAIDecision,
+            model=model_name,
+            temperature=temperature,
+            run_id=context.run_id,
+            route=route,
+        )
+        call = LLMCallSpec(
+            llm=llm,
+            budget_kwargs=budget_kwargs,
+            guard_kwargs=guard_kwargs,
+            cache=cache,
+            hedge=hedge,
+            cascade=cascade,
+        )
+        return call, ""
 
-        context_event(
+    def _ai_decide_initial_state(self, prompt: str, context: AutoReplyMessageContext) -> AutoReplyAIState:
+        self._context_event(context)(
             stage="ai_decide_start",
             extra={"model": self.model, "history_count": len(context.history_messages)},
         )
+        return {
+            "prompt": prompt,
+            "chat_type": context.chat_type,
+            "group_id": context.group_id,
+            "user_id": context.user_id,
+            "user_name": context.user_name,
+            "ts": context.ts,
+            "raw_message": context.raw_message,
+            "cleaned_message": context.cleaned_message,
+            "history_messages": context.history_messages,
+            "should_reply": False,
+            "reason": "",
+        }
 
-        final_state = app.invoke(
-            {
-                "prompt": prompt,
-                "chat_type": context.chat_type,
-                "group_id": context.group_id,
-                "user_id": context.user_id,
-                "user_name": context.user_name,
-                "ts": context.ts,
-                "raw_message": context.raw_message,
-                "cleaned_message": context.cleaned_message,
-                "history_messages": context.history_messages,
-                "should_reply": False,
-                "reason": "",
-            }
-        )
-
+    def _finish_ai_decide(self, final_state: dict[str, Any], context: AutoReplyMessageContext) -> tuple[bool, str]:
         should_reply = bool(final_state.get("should_reply", False))
         reason = str(final_state.get("reason", "")).strip()
-        context_event(stage="ai_decide_end", decision={"should_reply": should_reply, "reason": reason})
+        self._context_event(context)(stage="ai_decide_end", decision={"should_reply": should_reply, "reason": reason})
         if should_reply:
             return True, reason or "ai_decide=true"
         return False, reason or "ai_decide=false"
 
-    def generate_reply_text(
+    def _ai_decide_circuit_fallback(
         self,
-        *,
-        reply_prompt: str,
+        rule: dict[str, Any],
         context: AutoReplyMessageContext,
-        rule: dict[str, Any] | None = None,
-    ) -> str:
-        prompt = str(reply_prompt).strip()
+        error: LLMCircuitOpenError,
+    ) -> tuple[bool, str]:
+        """LLM 熔断时 ai_decide 退化为本地关键词判定（规则未配置 keywords 时按未命中处理）。"""
+        ok, reason = self.condition_keyword(rule, context)
+        self._context_event(context)(
+            stage="ai_decide_fallback",
+            decision={"should_reply": ok, "reason": reason},
+            error=str(error),
+        )
+        return ok, f"ai_decide 熔断降级为关键词判定: {reason}"
+
+    async def acondition_ai_decide(self, rule: dict[str, Any], context: AutoReplyMessageContext) -> tuple[bool, str]:
+        prompt = str(rule.get("ai_decision_prompt") or "").strip()
         if not prompt:
-            return ""
+            return False, "缺少 ai_decision_prompt"
+        call, skip_reason = self._ai_decide_call(rule, context)
+        if call is None:
+            return False, skip_reason
+        try:
+            final_state = await _ai_decide_graph().ainvoke(
+                self._ai_decide_initial_state(prompt, context),
+                config=call.as_config(),
+            )
+        except LLMCircuitOpenError as error:
+            return self._ai_decide_circuit_fallback(rule, context, error)
+        return self._finish_ai_decide(final_state, context)
 
+    def _reply_generate_call(
+        self,
+        *,
+        context: AutoReplyMessageContext,
+        rule: dict[str, Any] | None,
+    ) -> tuple[LLMCallSpec, str]:
+        """准备回复生成的 LLM 调用参数，返回 (LLMCallSpec, model_name)；生成图本身只编译一次（_reply_generate_graph）。"""
         model_name = str(rule.get("reply_model") or rule.get("model") or self.model) if rule else self.model
 
-        if load_dotenv is not None:
-            load_dotenv(override=False)
-        api_key = os.getenv("LLM_API_KEY")
-        if not api_key:
-            raise ValueError("缺少 LLM_API_KEY")
+        route = route_llm(model_name)
 
         temperature = self.temperature
         
@@ -998,130 +1200,91 @@ class AutoReplyDecisionEngine:
                 except (TypeError, ValueError):
                     pass  # 转换失败则保持全局值
 
-        llm_kwargs: dict[str, Any] = {
-            "model_name": model_name,
-            "temperature": temperature,
-            "openai_api_key": api_key,
-        }
-        base_url = os.getenv("LLM_API_BASE_URL")
-        if base_url:
-            llm_kwargs["openai_api_base"] = base_url
-
-        llm_base = ChatOpenAI(**llm_kwargs)
+        llm_base = route.chat_model(temperature=temperature)
         use_raw_fallback = True
         try:
-            llm = llm_base.with_structured_output(AutoReplyGeneratedReply, include_raw=True)
+            llm = route.structured_model(AutoReplyGeneratedReply, include_raw=True, temperature=temperature)
         except TypeError:
             use_raw_fallback = False
-            llm = llm_base.with_structured_output(AutoReplyGeneratedReply)
-
-        def generate_node(state: AutoReplyGenerateState) -> AutoReplyGenerateState:
-            llm_input = {
-                "chat_type": state["chat_type"],
-                "group_id": state["group_id"],
-                "user_id": state["user_id"],
-                "user_name": state["user_name"],
-                "ts": state["ts"],
-                "raw_message": state["raw_message"],
-                "cleaned_message": state["cleaned_message"],
-                "history_messages": state["history_messages"],
-            }
-            messages = [
-                SystemMessage(content=state["prompt"]),
-                HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
-            ]
-            try:
-                result = llm.invoke(messages)
-            except Exception:
-                # 某些兼容模型不会遵守结构化输出，改走原始文本兜底，避免 reply_len=0
-                fallback_reply = ""
-                try:
-                    raw_result = llm_base.invoke(messages)
-                    fallback_reply = _extract_reply_text_from_raw_output(raw_result)
-                except Exception:
-                    fallback_reply = ""
-                return {
-                    **state,
-                    "reply_text": fallback_reply or _default_reply_when_parse_failed(),
-                }
-            if use_raw_fallback and isinstance(result, dict):
-                parsed = result.get("parsed")
-                if parsed is not None:
-                    return {
-                        **state,
-                        "reply_text": str(getattr(parsed, "reply_text", "") or "").strip(),
-                    }
-                raw_output = result.get("raw")
-                fallback_reply = _extract_reply_text_from_raw_output(raw_output)
-                if fallback_reply:
-                    return {
-                        **state,
-                        "reply_text": fallback_reply,
-                    }
-                parse_error = result.get("parsing_error")
-                if parse_error:
-                    return {
-                        **state,
-                        "reply_text": _default_reply_when_parse_failed(),
-                    }
-                return {
-                    **state,
-                    "reply_text": _default_reply_when_parse_failed(),
-                }
-            structured_reply = str(getattr(result, "reply_text", "") or "").strip()
-            if structured_reply:
-                return {
-                    **state,
-                    "reply_text": structured_reply,
-                }
-            fallback_reply = _extract_reply_text_from_raw_output(result)
-            return {
-                **state,
-                "reply_text": fallback_reply or _default_reply_when_parse_failed(),
-            }
-
-        graph = StateGraph(AutoReplyGenerateState)
-        graph.add_node("generate", generate_node)
-        graph.add_edge(START, "generate")
-        graph.add_edge("generate", END)
-        app = graph.compile()
-        context_event = bind_agent_event(
-            agent_name="auto_reply",
-            task_type="AUTO_REPLY",
-            run_id=context.run_id,
-            chat_type=context.chat_type,
-            group_id=context.group_id,
-            user_id=context.user_id,
-            user_name=context.user_name,
-            ts=context.ts,
+            llm = route.structured_model(AutoReplyGeneratedReply, temperature=temperature)
+        budget_kwargs = route.budget_kwargs("auto_reply", run_id=context.run_id)
+        guard_kwargs = route.guard_kwargs("auto_reply", run_id=context.run_id)
+        call = LLMCallSpec(
+            llm=llm,
+            budget_kwargs=budget_kwargs,
+            guard_kwargs=guard_kwargs,
+            raw_llm=llm_base,
+            include_raw=use_raw_fallback,
+            cache=llm_cache_scope(
+                agent_name="auto_reply",
+                schema=AutoReplyGeneratedReply,
+                model=model_name,
+                temperature=temperature,
+                include_raw=use_raw_fallback,
+                run_id=context.run_id,
+            ),
+            hedge=llm_hedge_for(
+                agent_name="auto_reply",
+                schema=AutoReplyGeneratedReply,
+                model=model_name,
+                temperature=temperature,
+                include_raw=use_raw_fallback,
+                run_id=context.run_id,
+                route=route,
+            ),
         )
+        return call, model_name
 
-        context_event(
+    def _reply_generate_initial_state(
+        self,
+        prompt: str,
+        context: AutoReplyMessageContext,
+        model_name: str,
+    ) -> AutoReplyGenerateState:
+        self._context_event(context)(
             stage="reply_generate_start",
             extra={"model": model_name, "history_count": len(context.history_messages)},
         )
+        return {
+            "prompt": prompt,
+            "chat_type": context.chat_type,
+            "group_id": context.group_id,
+            "user_id": context.user_id,
+            "user_name": context.user_name,
+            "ts": context.ts,
+            "raw_message": context.raw_message,
+            "cleaned_message": context.cleaned_message,
+            "history_messages": context.history_messages,
+            "reply_text": "",
+        }
 
-        final_state = app.invoke(
-            {
-                "prompt": prompt,
-                "chat_type": context.chat_type,
-                "group_id": context.group_id,
-                "user_id": context.user_id,
-                "user_name": context.user_name,
-                "ts": context.ts,
-                "raw_message": context.raw_message,
-                "cleaned_message": context.cleaned_message,
-                "history_messages": context.history_messages,
-                "reply_text": "",
-            }
-        )
-
+    def _finish_reply_generate(self, final_state: dict[str, Any], context: AutoReplyMessageContext) -> str:
         reply_text = str(final_state.get("reply_text", "")).strip()
-        context_event(stage="reply_generate_end", decision={"reply_length": len(reply_text), "has_reply": bool(reply_text)})
+        self._context_event(context)(
+            stage="reply_generate_end",
+            decision={"reply_length": len(reply_text), "has_reply": bool(reply_text)},
+        )
         return reply_text
 
+    async def agenerate_reply_text(
+        self,
+        *,
+        reply_prompt: str,
+        context: AutoReplyMessageContext,
+        rule: dict[str, Any] | None = None,
+    ) -> str:
+        prompt = str(reply_prompt).strip()
+        if not prompt:
+            return ""
+        call, model_name = self._reply_generate_call(context=context, rule=rule)
+        final_state = await _reply_generate_graph().ainvoke(
+            self._reply_generate_initial_state(prompt, context, model_name),
+            config=call.as_config(),
+        )
+        return self._finish_reply_generate(final_state, context)
+
 
-def run_auto_reply_pipeline(
+def _build_auto_reply_context(
     *,
     chat_type: str,
     group_id: str,
@@ -1131,8 +1294,7 @@ def run_auto_reply_pipeline(
     raw_message: str,
     cleaned_message: str,
     run_id: str = "",
-) -> dict[str, Any]:
-    """AutoReply 主处理管道：先判定，再按规则提示词生成回复文本。"""
+) -> tuple[AutoReplyMessageContext, Callable[..., None]]:
     runtime_config = get_auto_reply_runtime_config()
     context_limit = runtime_config["context_history_limit"]
     context_max_chars = runtime_config["context_max_chars"]
@@ -1179,21 +1341,14 @@ def run_auto_reply_pipeline(
             "context_window_seconds": context_window_seconds,
         },
     )
+    return context, context_event
 
-    # 先判断是否要回复
-    engine = AutoReplyDecisionEngine(AUTO_REPLY_CONFIG)
-    result = engine.should_reply(context)
 
-    # 然后生成具体的回复内容文本
-    reply_text = ""
-    if bool(result.get("should_reply", False)):
-        reply_prompt = str(result.get("reply_prompt", "")).strip()
-        if reply_prompt:
-            rule = result.get("rule")
-            try:
-                reply_text = engine.generate_reply_text(reply_prompt=reply_prompt, context=context, rule=rule)
-            except Exception as error:
-                context_event(stage="reply_generate_error", error=str(error))
+def _auto_reply_pipeline_result(
+    result: dict[str, Any],
+    reply_text: str,
+    context: AutoReplyMessageContext,
+) -> dict[str, Any]:
     return {
         "should_reply": bool(result.get("should_reply", False)),
         "reason": str(result.get("reason", "")),
@@ -1204,3 +1359,45 @@ def run_auto_reply_pipeline(
         "group_id": context.group_id,
         "user_id": context.user_id,
     }
+
+
+async def arun_auto_reply_pipeline(
+    *,
+    chat_type: str,
+    group_id: str,
+    user_id: str,
+    user_name: str,
+    ts: str,
+    raw_message: str,
+    cleaned_message: str,
+    run_id: str = "",
+) -> dict[str, Any]:
+    """AutoReply 主处理管道：先判定，再按规则提示词生成回复文本；LLM 调用走 ainvoke，只有读取上下文文件放到线程中。"""
+    context, context_event = await asyncio.to_thread(
+        _build_auto_reply_context,
+        chat_type=chat_type,
+        group_id=group_id,
+        user_id=user_id,
+        user_name=user_name,
+        ts=ts,
+        raw_message=raw_message,
+        cleaned_message=cleaned_message,
+        run_id=run_id,
+    )
+
+    engine = AutoReplyDecisionEngine(AUTO_REPLY_CONFIG)
+    result = await engine.ashould_reply(context)
+
+    reply_text = ""
+    if bool(result.get("should_reply", False)):
+        reply_prompt = str(result.get("reply_prompt", "")).strip()
+        if reply_prompt:
+            rule = result.get("rule")
+            try:
+                reply_text = await engine.agenerate_reply_text(reply_prompt=reply_prompt, context=context, rule=rule)
+            except (AgentJobAbandoned,) + TRANSIENT_LLM_ERRORS:
+                # 调用方已放弃时直接结束；临时故障交给 AUTO_REPLY_RETRY_POLICY 重试整个任务
+                raise
+            except Exception as error:
+                context_event(stage="reply_generate_error", error=str(error))
+    return _auto_reply_pipeline_result(result, reply_text, context)
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import asyncio
 from dataclasses import dataclass, field
+from functools import lru_cache
 from datetime import datetime, timezone
 from time import perf_counter
 from types import SimpleNamespace
@@ -14,23 +15,40 @@ import re
 
 from ncatbot.core import GroupMessage, PrivateMessage
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
-from agent_pool import submit_agent_job
+from agent_pool import (
+    AgentJobAbandoned,
+    AgentRetryPolicy,
+    forget_durable_job,
+    persist_durable_job,
+    raise_if_agent_job_abandoned,
+    register_durable_job,
+    submit_agent_job,
+    trace_agent_node,
+)
 from bot import bot
 from workflows.agent_observe import bind_agent_event, generate_run_id
 from workflows.agent_config_loader import load_current_agent_config
+from workflows.llm_gateway import LLMCallSpec, llm_call_from_config, route_llm
+from workflows.llm_circuit_breaker import TRANSIENT_LLM_ERRORS, LLMCircuitOpenError, llm_call_guard
+from workflows.llm_rate_limiter import aacquire_llm_budget
+from workflows.llm_response_cache import alookup_llm_response, astore_llm_response, llm_cache_scope
+from workflows.llm_hedging import ahedged_invoke, llm_hedge_for
+from workflows.llm_cascade import acascade_invoke, llm_cascade_for
+from workflows.trigger_expression import compile_trigger_expression
 from workflows.dida_scheduler import dida_scheduler
 
-try:
-    from dotenv import load_dotenv
-except Exception:  # pragma: no cover
-    load_dotenv = None
-
 
 DIDA_AGENT_CONFIG = load_current_agent_config(__file__)
+# LLM 临时故障时由 Agent 池退避后重新入队（retry 段缺省时按默认策略重试）
+DIDA_AGENT_RETRY_POLICY = AgentRetryPolicy.from_config(DIDA_AGENT_CONFIG.get("retry", {}), retry_on=TRANSIENT_LLM_ERRORS)
+# 回复生成不做本地兜底、直接抛出的错误：熔断打开、调用方已放弃，以及交给 retry 重试的临时故障
+REPLY_PROPAGATE_ERRORS: tuple[type[BaseException], ...] = (LLMCircuitOpenError, AgentJobAbandoned) + TRANSIENT_LLM_ERRORS
+# trigger_mode 可用的原子条件（表达式编译见 trigger_expression）
+TRIGGER_CONDITIONS = frozenset({"at_bot", "keyword", "always", "ai_decide"})
 
 
 def get_dida_agent_runtime_config() -> dict[str, Any]:
@@ -175,6 +193,10 @@ def _default_reply_when_parse_failed() -> str:
     return "抱歉，刚才回复格式异常，请再说一次，我马上继续。"
 
 
+def _pending_job_key(session_key: str) -> str:
+    return f"dida_agent:pending:{session_key}"
+
+
 class DidaAgentDispatcher:
     """DidaAgent 接入层：监控命中 + 冷却窗口 + pending 聚合/过期。"""
 
@@ -304,6 +326,14 @@ class DidaAgentDispatcher:
                 next_allowed_at = float(state.get("next_allowed_at", 0.0) or 0.0)
                 if now < next_allowed_at:
                     state["pending_payload"] = dida_agent_payload
+                    # 防抖中的 pending 消息写入持久化存储（启用 durable_queue 时），重启后直接重放
+                    persist_durable_job(
+                        _pending_job_key(session_key),
+                        "dida_agent",
+                        {"payload": dida_agent_payload},
+                        priority=0,
+                        agent_name="dida_agent",
+                    )
                     previous_count = int(state.get("pending_count", 0) or 0)
                     state["pending_count"] = min(previous_count + 1, pending_max_messages)
                     if not float(state.get("pending_since", 0.0) or 0.0):
@@ -320,6 +350,7 @@ class DidaAgentDispatcher:
                 else:
                     state["next_allowed_at"] = now + min_reply_interval
                     state["pending_payload"] = None
+                    forget_durable_job(_pending_job_key(session_key))
                     state["pending_since"] = 0.0
                     state["pending_count"] = 0
 
@@ -371,6 +402,7 @@ class DidaAgentDispatcher:
                         state["pending_payload"] = None
                         state["pending_since"] = 0.0
                         state["pending_count"] = 0
+                        forget_durable_job(_pending_job_key(session_key))
                         continue
 
                     next_allowed_at = float(state.get("next_allowed_at", 0.0) or 0.0)
@@ -386,6 +418,7 @@ class DidaAgentDispatcher:
                     )
                     due_payloads.append(pending_payload)
                     state["pending_payload"] = None
+                    forget_durable_job(_pending_job_key(session_key))
                     state["pending_since"] = 0.0
                     state["pending_count"] = 0
                     state["next_allowed_at"] = now + min_interval if min_interval > 0 else 0.0
@@ -489,7 +522,7 @@ async def _execute_dida_agent_payload(payload: dict[str, str]) -> None:
 
     try:
         result = await submit_agent_job(
-            run_dida_agent_pipeline,
+            arun_dida_agent_pipeline,
             chat_type=chat_type,
             group_id=group_id,
             user_id=user_id,
@@ -500,7 +533,12 @@ async def _execute_dida_agent_payload(payload: dict[str, str]) -> None:
             run_id=run_id,
             priority=0,
             timeout=120.0,
-            run_in_thread=True,
+            agent_name="dida_agent",
+            lane="interactive",
+            retry=DIDA_AGENT_RETRY_POLICY,
+            job_run_id=run_id,
+            durable_job="dida_agent",
+            durable_args={"payload": payload},
         )
         elapsed_ms = (perf_counter() - started) * 1000
         log_event(
@@ -566,6 +604,9 @@ async def _execute_dida_agent_payload(payload: dict[str, str]) -> None:
         )
 
 
+register_durable_job("dida_agent", _execute_dida_agent_payload)
+
+
 def _create_dida_agent_task(payload: dict[str, str]) -> None:
     task = asyncio.create_task(_execute_dida_agent_payload(payload))
 
@@ -752,6 +793,194 @@ class DidaAgentGenerateState(TypedDict):
     dida_action: Optional[DidaAction]
 
 
+def _build_llm_messages(state: DidaAgentAIState | DidaAgentGenerateState) -> list[Any]:
+    llm_input = {
+        "chat_type": state["chat_type"],
+        "group_id": state["group_id"],
+        "user_id": state["user_id"],
+        "user_name": state["user_name"],
+        "ts": state["ts"],
+        "raw_message": state["raw_message"],
+        "cleaned_message": state["cleaned_message"],
+        "history_messages": state["history_messages"],
+    }
+    return [
+        SystemMessage(content=state["prompt"]),
+        HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
+    ]
+
+
+def _inject_dida_task_context(prompt: str, context: DidaAgentMessageContext) -> str:
+    """把 data/dida_context.json 中当前用户的任务列表追加到回复提示词。"""
+    # Inject Dida task context if available
+    try:
+        context_path = os.path.join("data", "dida_context.json")
+        if os.path.exists(context_path):
+            with open(context_path, "r", encoding="utf-8") as f:
+                dida_data = json.load(f)
+                
+            task_context_lines = []
+            # Check for user-specific context or fallback to all
+            # The keys in dida_context.json are internal user IDs (e.g., from dida_tokens.json)
+            # Since dida_agent doesn't know the internal ID mapping easily without auth,
+            # we will include all available tasks from the context file.
+            # In a single-user/couple bot scenario, this is usually fine.
+            
+            # Only include tasks for the current user to avoid context pollution and privacy issues
+            target_uids = {str(context.user_id)}
+            # If we want to support "master" tasks management by others, we could add logic here.
+            
+            for uid, tasks in dida_data.items():
+                if str(uid) not in target_uids:
+                    continue
+                if not isinstance(tasks, list) or not tasks:
+                    continue
+                for t in tasks:
+                    tid = str(t.get("id") or "")
+                    ttitle = str(t.get("title") or "")
+                    tproject = str(t.get("project") or "")
+                    tdue = str(t.get("due") or "无到期")
+                    # Format: [Project] Title (ID: ...) Due: ...
+                    task_context_lines.append(f"- [{tproject}] {ttitle} (ID: {tid}) Due: {tdue}")
+            
+            if task_context_lines:
+                prompt += "\n\n【当前 Dida 任务列表（仅供 AI 参考，不要泄露 ID 给用户，但在调用工具时必须使用 ID）】:\n" + "\n".join(task_context_lines)
+    except Exception as e:
+        pass # Ignore context loading errors
+    return prompt
+
+
+def _apply_ai_decision(state: DidaAgentAIState, result: DidaAgentAIDecision) -> DidaAgentAIState:
+    return {
+        **state,
+        "should_reply": bool(result.should_reply),
+        "reason": str(result.reason or "").strip(),
+    }
+
+
+async def _aai_decide_node(state: DidaAgentAIState, config: RunnableConfig) -> DidaAgentAIState:
+    call = llm_call_from_config(config)
+    messages = _build_llm_messages(state)
+    raise_if_agent_job_abandoned("ai_decide")
+    result = await alookup_llm_response(call.cache, messages)
+    if result is None:
+        result = await acascade_invoke(
+            call.llm,
+            messages,
+            guard_kwargs=call.guard_kwargs,
+            budget_kwargs=call.budget_kwargs,
+            cascade=call.cascade,
+            hedge=call.hedge,
+        )
+        await astore_llm_response(call.cache, messages, result)
+    return _apply_ai_decision(state, result)
+
+
+def _apply_reply_result(state: DidaAgentGenerateState, result: Any, *, include_raw: bool) -> DidaAgentGenerateState:
+    if include_raw and isinstance(result, dict):
+        parsed = result.get("parsed")
+        if parsed is not None:
+            return {
+                **state,
+                "reply_text": str(getattr(parsed, "reply_text", "") or "").strip(),
+                "dida_action": getattr(parsed, "dida_action", None),
+            }
+        raw_output = result.get("raw")
+        fallback_reply = _extract_reply_text_from_raw_output(raw_output)
+        if fallback_reply:
+            return {
+                **state,
+                "reply_text": fallback_reply,
+                "dida_action": None,
+            }
+        parse_error = result.get("parsing_error")
+        if parse_error:
+            return {
+                **state,
+                "reply_text": _default_reply_when_parse_failed(),
+                "dida_action": None,
+            }
+        return {
+            **state,
+            "reply_text": _default_reply_when_parse_failed(),
+            "dida_action": None,
+        }
+    structured_reply = str(getattr(result, "reply_text", "") or "").strip()
+    if structured_reply:
+        return {
+            **state,
+            "reply_text": structured_reply,
+            "dida_action": getattr(result, "dida_action", None),
+        }
+    fallback_reply = _extract_reply_text_from_raw_output(result)
+    return {
+        **state,
+        "reply_text": fallback_reply or _default_reply_when_parse_failed(),
+        "dida_action": None,
+    }
+
+
+def _apply_reply_fallback(state: DidaAgentGenerateState, fallback_reply: str) -> DidaAgentGenerateState:
+    return {
+        **state,
+        "reply_text": fallback_reply or _default_reply_when_parse_failed(),
+        "dida_action": None,
+    }
+
+
+async def _areply_generate_node(state: DidaAgentGenerateState, config: RunnableConfig) -> DidaAgentGenerateState:
+    call = llm_call_from_config(config)
+    messages = _build_llm_messages(state)
+    raise_if_agent_job_abandoned("reply_generate")
+    cached = await alookup_llm_response(call.cache, messages)
+    if cached is not None:
+        return _apply_reply_result(state, cached, include_raw=call.include_raw)
+    try:
+        result = await ahedged_invoke(
+            call.llm,
+            messages,
+            guard_kwargs=call.guard_kwargs,
+            budget_kwargs=call.budget_kwargs,
+            hedge=call.hedge,
+        )
+    except ValueError:
+        # 只有结构化输出解析 / 校验失败（OutputParserException、ValidationError 都是 ValueError）才改用原始输出兜底
+        fallback_reply = ""
+        try:
+            with llm_call_guard(**call.guard_kwargs) as guard:
+                await aacquire_llm_budget(messages, **call.budget_kwargs)
+                guard.mark_sent()
+                raw_result = await call.raw_llm.ainvoke(messages)
+            fallback_reply = _extract_reply_text_from_raw_output(raw_result)
+        except REPLY_PROPAGATE_ERRORS:
+            raise
+        except Exception:
+            fallback_reply = ""
+        return _apply_reply_fallback(state, fallback_reply)
+    await astore_llm_response(call.cache, messages, result)
+    return _apply_reply_result(state, result, include_raw=call.include_raw)
+
+
+@lru_cache(maxsize=None)
+def _ai_decide_graph() -> Any:
+    """ai_decide 判定图，进程内只编译一次；模型与限流 / 熔断参数由调用方经 config 传入（LLMCallSpec）。"""
+    graph = StateGraph(DidaAgentAIState)
+    graph.add_node("decide", trace_agent_node("decide", _aai_decide_node))
+    graph.add_edge(START, "decide")
+    graph.add_edge("decide", END)
+    return graph.compile()
+
+
+@lru_cache(maxsize=None)
+def _reply_generate_graph() -> Any:
+    """回复生成图，进程内只编译一次；调用参数同样经 config 传入。"""
+    graph = StateGraph(DidaAgentGenerateState)
+    graph.add_node("generate", trace_agent_node("generate", _areply_generate_node))
+    graph.add_edge(START, "generate")
+    graph.add_edge("generate", END)
+    return graph.compile()
+
+
 class DidaAgentDecisionEngine:
     """自动回复判定器：负责读取规则表达式并计算 should_reply。"""
 
@@ -765,8 +994,8 @@ class DidaAgentDecisionEngine:
         except (TypeError, ValueError):
             self.temperature = 0.0
 
-    def should_reply(self, context: DidaAgentMessageContext) -> dict[str, Any]:
-        context_event = bind_agent_event(
+    def _context_event(self, context: DidaAgentMessageContext) -> Callable[..., None]:
+        return bind_agent_event(
             agent_name="dida_agent",
             task_type="DIDA_AGENT",
             run_id=context.run_id,
@@ -776,6 +1005,8 @@ class DidaAgentDecisionEngine:
             user_name=context.user_name,
             ts=context.ts,
         )
+
+    def _matching_rules(self, context: DidaAgentMessageContext) -> list[dict[str, Any]]:
         matching_rules = []
         for rule in self.rules:
             rule_chat_type = str(rule.get("chat_type", "")).strip().lower()
@@ -786,91 +1017,103 @@ class DidaAgentDecisionEngine:
             if target_number != str(current_number):
                 continue
             matching_rules.append(rule)
+        return matching_rules
 
+    async def ashould_reply(self, context: DidaAgentMessageContext) -> dict[str, Any]:
+        """按规则顺序求值 trigger_mode，命中第一条即返回；ai_decide 条件走 ainvoke。"""
+        context_event = self._context_event(context)
+        matching_rules = self._matching_rules(context)
         context_event(
             stage="rules_filtered",
             extra={"configured_rules": len(self.rules), "matched_rules": len(matching_rules)},
         )
 
+        failure_reasons: list[str] = []
+        for idx, rule in enumerate(matching_rules):
+            expression = str(rule.get("trigger_mode") or "always").strip()
+            ok, reason = await self.aevaluate_trigger_expression(expression, rule, context)
+            result = self._record_rule_result(context_event, idx, rule, expression, ok, reason, failure_reasons)
+            if result is not None:
+                return result
+        return self._finish_decision(context_event, matching_rules, failure_reasons)
+
+    def _record_rule_result(
+        self,
+        context_event: Callable[..., None],
+        idx: int,
+        rule: dict[str, Any],
+        expression: str,
+        ok: bool,
+        reason: str,
+        failure_reasons: list[str],
+    ) -> dict[str, Any] | None:
+        context_event(
+            stage="rule_evaluated",
+            decision={"should_reply": ok, "reason": reason},
+            extra={"rule_index": idx, "trigger_mode": expression},
+        )
+        if ok:
+            result = {
+                "should_reply": True,
+                "reason": reason,
+                "matched_rule": idx,
+                "trigger_mode": expression,
+                "reply_prompt": str(rule.get("reply_prompt") or "").strip(),
+                "rule": rule
+            }
+            context_event(stage="decision_end", decision=result)
+            return result
+        failure_reasons.append(f"rule#{idx}:{reason}")
+        return None
+
+    def _finish_decision(
+        self,
+        context_event: Callable[..., None],
+        matching_rules: list[dict[str, Any]],
+        failure_reasons: list[str],
+    ) -> dict[str, Any]:
         if not matching_rules:
             result = {
                 "should_reply": False,
                 "reason": "未命中启用规则",
                 "matched_rule": None,
             }
-            context_event(stage="decision_end", decision=result)
-            return result
-
-        failure_reasons: list[str] = []
-        for idx, rule in enumerate(matching_rules):
-            expression = str(rule.get("trigger_mode") or "always").strip()
-            ok, reason = self.evaluate_trigger_expression(expression, rule, context)
-            context_event(
-                stage="rule_evaluated",
-                decision={"should_reply": ok, "reason": reason},
-                extra={"rule_index": idx, "trigger_mode": expression},
-            )
-            if ok:
-                result = {
-                    "should_reply": True,
-                    "reason": reason,
-                    "matched_rule": idx,
-                    "trigger_mode": expression,
-                    "reply_prompt": str(rule.get("reply_prompt") or "").strip(),
-                    "rule": rule
-                }
-                context_event(stage="decision_end", decision=result)
-                return result
-            failure_reasons.append(f"rule#{idx}:{reason}")
-
-        result = {
-            "should_reply": False,
-            "reason": "; ".join(failure_reasons) if failure_reasons else "规则未触发",
-            "matched_rule": None,
-        }
+        else:
+            result = {
+                "should_reply": False,
+                "reason": "; ".join(failure_reasons) if failure_reasons else "规则未触发",
+                "matched_rule": None,
+            }
         context_event(stage="decision_end", decision=result)
         return result
 
-    def evaluate_trigger_expression(
+    def _evaluate_sync_condition(
         self,
-        expression: str,
+        token: str,
         rule: dict[str, Any],
         context: DidaAgentMessageContext,
     ) -> tuple[bool, str]:
-        allowed_conditions = {
-            "at_bot": lambda: self.condition_at_bot(context),
-            "keyword": lambda: self.condition_keyword(rule, context),
-            "always": lambda: self.condition_always(),
-            "ai_decide": lambda: self.condition_ai_decide(rule, context),
-        }
-
-        tokens = set(re.findall(r"\b[a-zA-Z_][a-zA-Z0-9_]*\b", expression))
-        invalid_tokens = [token for token in tokens if token not in allowed_conditions]
-        if invalid_tokens:
-            invalid_text = ",".join(sorted(invalid_tokens))
-            return False, "trigger_mode 包含未知条件: " + invalid_text
-
-        condition_values: dict[str, bool] = {}
-        condition_reasons: dict[str, str] = {}
-        for token in tokens:
-            value, reason = allowed_conditions[token]()
-            condition_values[token] = bool(value)
-            condition_reasons[token] = reason
-
-        py_expr = expression.replace("&&", " and ").replace("||", " or ")
-        py_expr = re.sub(r"!\s*", " not ", py_expr)
+        if token == "at_bot":
+            return self.condition_at_bot(context)
+        if token == "keyword":
+            return self.condition_keyword(rule, context)
+        return self.condition_always()
 
-        try:
-            result = bool(eval(py_expr, {"__builtins__": {}}, condition_values))
-        except Exception as error:
-            return False, f"trigger_mode 解析失败: {error}"
+    async def aevaluate_trigger_expression(
+        self,
+        expression: str,
+        rule: dict[str, Any],
+        context: DidaAgentMessageContext,
+    ) -> tuple[bool, str]:
+        """表达式只编译一次；短路求值且先算便宜条件，keyword / at_bot 已能决定结果时不再调用 ai_decide。"""
+        trigger = compile_trigger_expression(expression, TRIGGER_CONDITIONS)
 
-        if result:
-            return True, f"命中表达式: {expression}"
+        async def resolve(token: str) -> tuple[bool, str]:
+            if token == "ai_decide":
+                return await self.acondition_ai_decide(rule, context)
+            return self._evaluate_sync_condition(token, rule, context)
 
-        reason_text = ", ".join([f"{name}={condition_values[name]}" for name in sorted(condition_values)])
-        detail_text = "; ".join([f"{name}:{condition_reasons[name]}" for name in sorted(condition_reasons)])
-        return False, f"表达式未命中: {reason_text}; {detail_text}"
+        return await trigger.aevaluate(resolve)
 
     def condition_always(self) -> tuple[bool, str]:
         return True, "always=true"
@@ -903,18 +1146,18 @@ class DidaAgentDecisionEngine:
                 return True, f"命中关键词: {keyword_text}"
         return False, "未命中关键词"
 
-    def condition_ai_decide(self, rule: dict[str, Any], context: DidaAgentMessageContext) -> tuple[bool, str]:
-        prompt = str(rule.get("ai_decision_prompt") or "").strip()
-        if not prompt:
-            return False, "缺少 ai_decision_prompt"
-
+    def _ai_decide_call(
+        self,
+        rule: dict[str, Any],
+        context: DidaAgentMessageContext,
+    ) -> tuple[LLMCallSpec | None, str]:
+        """准备 ai_decide 的 LLM 调用参数，返回 (LLMCallSpec, 跳过原因)；判定图本身只编译一次（_ai_decide_graph）。"""
         model_name = str(rule.get("decision_model") or rule.get("model") or self.model)
 
-        if load_dotenv is not None:
-            load_dotenv(override=False)
-        api_key = os.getenv("LLM_API_KEY")
-        if not api_key:
-            return False, "缺少 LLM_API_KEY"
+        try:
+            route = route_llm(model_name)
+        except ValueError as error:
+            return None, str(error)
 
         rule_temp = rule.get("temperature")
         if rule_temp is not None:
@@ -925,139 +1168,109 @@ class DidaAgentDecisionEngine:
         else:
             temperature = self.temperature
         
-        llm_kwargs: dict[str, Any] = {
-            "model_name": model_name,
-            "temperature": temperature,
-            "openai_api_key": api_key,
-        }
-        base_url = os.getenv("LLM_API_BASE_URL")
-        if base_url:
-            llm_kwargs["openai_api_base"] = base_url
-
-        llm = ChatOpenAI(**llm_kwargs).with_structured_output(DidaAgentAIDecision)
-
-        def decide_node(state: DidaAgentAIState) -> DidaAgentAIState:
-            llm_input = {
-                "chat_type": state["chat_type"],
-                "group_id": state["group_id"],
-                "user_id": state["user_id"],
-                "user_name": state["user_name"],
-                "ts": state["ts"],
-                "raw_message": state["raw_message"],
-                "cleaned_message": state["cleaned_message"],
-                "history_messages": state["history_messages"],
-            }
-            result = llm.invoke(
-                [
-                    SystemMessage(content=state["prompt"]),
-                    HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
-                ]
-            )
-            return {
-                **state,
-                "should_reply": bool(result.should_reply),
-                "reason": str(result.reason or "").strip(),
-            }
-
-        graph = StateGraph(DidaAgentAIState)
-        graph.add_node("decide", decide_node)
-        graph.add_edge(START, "decide")
-        graph.add_edge("decide", END)
-        app = graph.compile()
-        context_event = bind_agent_event(
+        llm = route.structured_model(DidaAgentAIDecision, temperature=temperature)
+        budget_kwargs = route.budget_kwargs("dida_agent", run_id=context.run_id)
+        guard_kwargs = route.guard_kwargs("dida_agent", run_id=context.run_id)
+        cascade = llm_cascade_for(
             agent_name="dida_agent",
-            task_type="DIDA_AGENT",
+            schema=DidaAgentAIDecision,
+            model=model_name,
+            temperature=temperature,
             run_id=context.run_id,
-            chat_type=context.chat_type,
-            group_id=context.group_id,
-            user_id=context.user_id,
-            user_name=context.user_name,
-            ts=context.ts,
         )
+        cache = llm_cache_scope(
+            agent_name="dida_agent",
+            schema=DidaAgentAIDecision,
+            model=cascade.cache_model if cascade is not None else model_name,
+            temperature=temperature,
+            run_id=context.run_id,
+        )
+        hedge = llm_hedge_for(
+            agent_name="dida_agent",
+            schema=DidaAgentAIDecision,
+            model=model_name,
+            temperature=temperature,
+            run_id=context.run_id,
+            route=route,
+        )
+        call = LLMCallSpec(
+            llm=llm,
+            budget_kwargs=budget_kwargs,
+            guard_kwargs=guard_kwargs,
+            cache=cache,
+            hedge=hedge,
+            cascade=cascade,
+        )
+        return call, ""
 
-        context_event(
+    def _ai_decide_initial_state(self, prompt: str, context: DidaAgentMessageContext) -> DidaAgentAIState:
+        self._context_event(context)(
             stage="ai_decide_start",
             extra={"model": self.model, "history_count": len(context.history_messages)},
         )
+        return {
+            "prompt": prompt,
+            "chat_type": context.chat_type,
+            "group_id": context.group_id,
+            "user_id": context.user_id,
+            "user_name": context.user_name,
+            "ts": context.ts,
+            "raw_message": context.raw_message,
+            "cleaned_message": context.cleaned_message,
+            "history_messages": context.history_messages,
+            "should_reply": False,
+            "reason": "",
+        }
 
-        final_state = app.invoke(
-            {
-                "prompt": prompt,
-                "chat_type": context.chat_type,
-                "group_id": context.group_id,
-                "user_id": context.user_id,
-                "user_name": context.user_name,
-                "ts": context.ts,
-                "raw_message": context.raw_message,
-                "cleaned_message": context.cleaned_message,
-                "history_messages": context.history_messages,
-                "should_reply": False,
-                "reason": "",
-            }
-        )
-
+    def _finish_ai_decide(self, final_state: dict[str, Any], context: DidaAgentMessageContext) -> tuple[bool, str]:
         should_reply = bool(final_state.get("should_reply", False))
         reason = str(final_state.get("reason", "")).strip()
-        context_event(stage="ai_decide_end", decision={"should_reply": should_reply, "reason": reason})
+        self._context_event(context)(stage="ai_decide_end", decision={"should_reply": should_reply, "reason": reason})
         if should_reply:
             return True, reason or "ai_decide=true"
         return False, reason or "ai_decide=false"
 
-    def generate_reply_text(
+    def _ai_decide_circuit_fallback(
         self,
-        *,
-        reply_prompt: str,
+        rule: dict[str, Any],
         context: DidaAgentMessageContext,
-        rule: dict[str, Any] | None = None,
-    ) -> dict[str, Any]:
-        prompt = str(reply_prompt).strip()
-        
-        # Inject Dida task context if available
-        try:
-            context_path = os.path.join("data", "dida_context.json")
-            if os.path.exists(context_path):
-                with open(context_path, "r", encoding="utf-8") as f:
-                    dida_data = json.load(f)
-                    
-                task_context_lines = []
-                # Check for user-specific context or fallback to all
-                # The keys in dida_context.json are internal user IDs (e.g., from dida_tokens.json)
-                # Since dida_agent doesn't know the internal ID mapping easily without auth,
-                # we will include all available tasks from the context file.
-                # In a single-user/couple bot scenario, this is usually fine.
-                
-                # Only include tasks for the current user to avoid context pollution and privacy issues
-                target_uids = {str(context.user_id)}
-                # If we want to support "master" tasks management by others, we could add logic here.
-                
-                for uid, tasks in dida_data.items():
-                    if str(uid) not in target_uids:
-                        continue
-                    if not isinstance(tasks, list) or not tasks:
-                        continue
-                    for t in tasks:
-                        tid = str(t.get("id") or "")
-                        ttitle = str(t.get("title") or "")
-                        tproject = str(t.get("project") or "")
-                        tdue = str(t.get("due") or "无到期")
-                        # Format: [Project] Title (ID: ...) Due: ...
-                        task_context_lines.append(f"- [{tproject}] {ttitle} (ID: {tid}) Due: {tdue}")
-                
-                if task_context_lines:
-                    prompt += "\n\n【当前 Dida 任务列表（仅供 AI 参考，不要泄露 ID 给用户，但在调用工具时必须使用 ID）】:\n" + "\n".join(task_context_lines)
-        except Exception as e:
-            pass # Ignore context loading errors
+        error: LLMCircuitOpenError,
+    ) -> tuple[bool, str]:
+        """LLM 熔断时 ai_decide 退化为本地关键词判定（规则未配置 keywords 时按未命中处理）。"""
+        ok, reason = self.condition_keyword(rule, context)
+        self._context_event(context)(
+            stage="ai_decide_fallback",
+            decision={"should_reply": ok, "reason": reason},
+            error=str(error),
+        )
+        return ok, f"ai_decide 熔断降级为关键词判定: {reason}"
 
+    async def acondition_ai_decide(self, rule: dict[str, Any], context: DidaAgentMessageContext) -> tuple[bool, str]:
+        prompt = str(rule.get("ai_decision_prompt") or "").strip()
         if not prompt:
-            return {"reply_text": "", "dida_action": None}
+            return False, "缺少 ai_decision_prompt"
+        call, skip_reason = self._ai_decide_call(rule, context)
+        if call is None:
+            return False, skip_reason
+        try:
+            final_state = await _ai_decide_graph().ainvoke(
+                self._ai_decide_initial_state(prompt, context),
+                config=call.as_config(),
+            )
+        except LLMCircuitOpenError as error:
+            return self._ai_decide_circuit_fallback(rule, context, error)
+        return self._finish_ai_decide(final_state, context)
 
+    def _reply_generate_call(
+        self,
+        *,
+        context: DidaAgentMessageContext,
+        rule: dict[str, Any] | None,
+    ) -> tuple[LLMCallSpec, str]:
+        """准备回复生成的 LLM 调用参数，返回 (LLMCallSpec, model_name)；生成图本身只编译一次（_reply_generate_graph）。"""
         model_name = str(rule.get("reply_model") or rule.get("model") or self.model) if rule else self.model
 
-        if load_dotenv is not None:
-            load_dotenv(override=False)
-        api_key = os.getenv("LLM_API_KEY")
-        if not api_key:
-            raise ValueError("缺少 LLM_API_KEY")
+        route = route_llm(model_name)
 
         temperature = self.temperature
         
@@ -1069,139 +1282,93 @@ class DidaAgentDecisionEngine:
                 except (TypeError, ValueError):
                     pass  # 转换失败则保持全局值
 
-        llm_kwargs: dict[str, Any] = {
-            "model_name": model_name,
-            "temperature": temperature,
-            "openai_api_key": api_key,
-        }
-        base_url = os.getenv("LLM_API_BASE_URL")
-        if base_url:
-            llm_kwargs["openai_api_base"] = base_url
-
-        llm_base = ChatOpenAI(**llm_kwargs)
+        llm_base = route.chat_model(temperature=temperature)
         use_raw_fallback = True
         try:
-            llm = llm_base.with_structured_output(DidaAgentGeneratedReply, include_raw=True)
+            llm = route.structured_model(DidaAgentGeneratedReply, include_raw=True, temperature=temperature)
         except TypeError:
             use_raw_fallback = False
-            llm = llm_base.with_structured_output(DidaAgentGeneratedReply)
-
-        def generate_node(state: DidaAgentGenerateState) -> DidaAgentGenerateState:
-            llm_input = {
-                "chat_type": state["chat_type"],
-                "group_id": state["group_id"],
-                "user_id": state["user_id"],
-                "user_name": state["user_name"],
-                "ts": state["ts"],
-                "raw_message": state["raw_message"],
-                "cleaned_message": state["cleaned_message"],
-                "history_messages": state["history_messages"],
-            }
-            messages = [
-                SystemMessage(content=state["prompt"]),
-                HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
-            ]
-            try:
-                result = llm.invoke(messages)
-            except Exception:
-                # 某些兼容模型不会遵守结构化输出，改走原始文本兜底，避免 reply_len=0
-                fallback_reply = ""
-                try:
-                    raw_result = llm_base.invoke(messages)
-                    fallback_reply = _extract_reply_text_from_raw_output(raw_result)
-                except Exception:
-                    fallback_reply = ""
-                return {
-                    **state,
-                    "reply_text": fallback_reply or _default_reply_when_parse_failed(),
-                    "dida_action": None,
-                }
-            if use_raw_fallback and isinstance(result, dict):
-                parsed = result.get("parsed")
-                if parsed is not None:
-                    return {
-                        **state,
-                        "reply_text": str(getattr(parsed, "reply_text", "") or "").strip(),
-                        "dida_action": getattr(parsed, "dida_action", None),
-                    }
-                raw_output = result.get("raw")
-                fallback_reply = _extract_reply_text_from_raw_output(raw_output)
-                if fallback_reply:
-                    return {
-                        **state,
-                        "reply_text": fallback_reply,
-                        "dida_action": None,
-                    }
-                parse_error = result.get("parsing_error")
-                if parse_error:
-                    return {
-                        **state,
-                        "reply_text": _default_reply_when_parse_failed(),
-                        "dida_action": None,
-                    }
-                return {
-                    **state,
-                    "reply_text": _default_reply_when_parse_failed(),
-                    "dida_action": None,
-                }
-            structured_reply = str(getattr(result, "reply_text", "") or "").strip()
-            if structured_reply:
-                return {
-                    **state,
-                    "reply_text": structured_reply,
-                    "dida_action": getattr(result, "dida_action", None),
-                }
-            fallback_reply = _extract_reply_text_from_raw_output(result)
-            return {
-                **state,
-                "reply_text": fallback_reply or _default_reply_when_parse_failed(),
-                "dida_action": None,
-            }
-
-        graph = StateGraph(DidaAgentGenerateState)
-        graph.add_node("generate", generate_node)
-        graph.add_edge(START, "generate")
-        graph.add_edge("generate", END)
-        app = graph.compile()
-        context_event = bind_agent_event(
-            agent_name="dida_agent",
-            task_type="DIDA_AGENT",
-            run_id=context.run_id,
-            chat_type=context.chat_type,
-            group_id=context.group_id,
-            user_id=context.user_id,
-            user_name=context.user_name,
-            ts=context.ts,
+            llm = route.structured_model(DidaAgentGeneratedReply, temperature=temperature)
+        budget_kwargs = route.budget_kwargs("dida_agent", run_id=context.run_id)
+        guard_kwargs = route.guard_kwargs("dida_agent", run_id=context.run_id)
+        call = LLMCallSpec(
+            llm=llm,
+            budget_kwargs=budget_kwargs,
+            guard_kwargs=guard_kwargs,
+            raw_llm=llm_base,
+            include_raw=use_raw_fallback,
+            cache=llm_cache_scope(
+                agent_name="dida_agent",
+                schema=DidaAgentGeneratedReply,
+                model=model_name,
+                temperature=temperature,
+                include_raw=use_raw_fallback,
+                run_id=context.run_id,
+            ),
+            hedge=llm_hedge_for(
+                agent_name="dida_agent",
+                schema=DidaAgentGeneratedReply,
+                model=model_name,
+                temperature=temperature,
+                include_raw=use_raw_fallback,
+                run_id=context.run_id,
+                route=route,
+            ),
         )
+        return call, model_name
 
-        context_event(
+    def _reply_generate_initial_state(
+        self,
+        prompt: str,
+        context: DidaAgentMessageContext,
+        model_name: str,
+    ) -> DidaAgentGenerateState:
+        self._context_event(context)(
             stage="reply_generate_start",
             extra={"model": model_name, "history_count": len(context.history_messages)},
         )
+        return {
+            "prompt": prompt,
+            "chat_type": context.chat_type,
+            "group_id": context.group_id,
+            "user_id": context.user_id,
+            "user_name": context.user_name,
+            "ts": context.ts,
+            "raw_message": context.raw_message,
+            "cleaned_message": context.cleaned_message,
+            "history_messages": context.history_messages,
+            "reply_text": "",
+            "dida_action": None,
+        }
 
-        final_state = app.invoke(
-            {
-                "prompt": prompt,
-                "chat_type": context.chat_type,
-                "group_id": context.group_id,
-                "user_id": context.user_id,
-                "user_name": context.user_name,
-                "ts": context.ts,
-                "raw_message": context.raw_message,
-                "cleaned_message": context.cleaned_message,
-                "history_messages": context.history_messages,
-                "reply_text": "",
-                "dida_action": None,
-            }
-        )
-
+    def _finish_reply_generate(self, final_state: dict[str, Any], context: DidaAgentMessageContext) -> dict[str, Any]:
         reply_text = str(final_state.get("reply_text", "")).strip()
         dida_action = final_state.get("dida_action")
-        context_event(stage="reply_generate_end", decision={"reply_length": len(reply_text), "has_reply": bool(reply_text)})
+        self._context_event(context)(
+            stage="reply_generate_end",
+            decision={"reply_length": len(reply_text), "has_reply": bool(reply_text)},
+        )
         return {"reply_text": reply_text, "dida_action": dida_action}
 
+    async def agenerate_reply_text(
+        self,
+        *,
+        reply_prompt: str,
+        context: DidaAgentMessageContext,
+        rule: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        prompt = _inject_dida_task_context(str(reply_prompt).strip(), context)
+        if not prompt:
+            return {"reply_text": "", "dida_action": None}
+        call, model_name = self._reply_generate_call(context=context, rule=rule)
+        final_state = await _reply_generate_graph().ainvoke(
+            self._reply_generate_initial_state(prompt, context, model_name),
+            config=call.as_config(),
+        )
+        return self._finish_reply_generate(final_state, context)
+
 
-def run_dida_agent_pipeline(
+def _build_dida_agent_context(
     *,
     chat_type: str,
     group_id: str,
@@ -1211,8 +1378,7 @@ def run_dida_agent_pipeline(
     raw_message: str,
     cleaned_message: str,
     run_id: str = "",
-) -> dict[str, Any]:
-    """DidaAgent 主处理管道：先判定，再按规则提示词生成回复文本。"""
+) -> tuple[DidaAgentMessageContext, Callable[..., None]]:
     runtime_config = get_dida_agent_runtime_config()
     context_limit = runtime_config["context_history_limit"]
     context_max_chars = runtime_config["context_max_chars"]
@@ -1259,21 +1425,14 @@ def run_dida_agent_pipeline(
             "context_window_seconds": context_window_seconds,
         },
     )
+    return context, context_event
 
-    # 先判断是否要回复
-    engine = DidaAgentDecisionEngine(DIDA_AGENT_CONFIG)
-    result = engine.should_reply(context)
 
-    # 然后生成具体的回复内容文本
-    reply_payload: dict[str, Any] = {"reply_text": "", "dida_action": None}
-    if bool(result.get("should_reply", False)):
-        reply_prompt = str(result.get("reply_prompt", "")).strip()
-        if reply_prompt:
-            rule = result.get("rule")
-            try:
-                reply_payload = engine.generate_reply_text(reply_prompt=reply_prompt, context=context, rule=rule)
-            except Exception as error:
-                context_event(stage="reply_generate_error", error=str(error))
+def _dida_agent_pipeline_result(
+    result: dict[str, Any],
+    reply_payload: dict[str, Any],
+    context: DidaAgentMessageContext,
+) -> dict[str, Any]:
     dida_action = reply_payload.get("dida_action")
     rule = result.get("rule") if isinstance(result.get("rule"), dict) else {}
     if not bool(rule.get("dida_enabled", False)):
@@ -1290,3 +1449,45 @@ def run_dida_agent_pipeline(
         "group_id": context.group_id,
         "user_id": context.user_id,
     }
+
+
+async def arun_dida_agent_pipeline(
+    *,
+    chat_type: str,
+    group_id: str,
+    user_id: str,
+    user_name: str,
+    ts: str,
+    raw_message: str,
+    cleaned_message: str,
+    run_id: str = "",
+) -> dict[str, Any]:
+    """DidaAgent 主处理管道：先判定，再按规则提示词生成回复文本；LLM 调用走 ainvoke，只有读取上下文文件放到线程中。"""
+    context, context_event = await asyncio.to_thread(
+        _build_dida_agent_context,
+        chat_type=chat_type,
+        group_id=group_id,
+        user_id=user_id,
+        user_name=user_name,
+        ts=ts,
+        raw_message=raw_message,
+        cleaned_message=cleaned_message,
+        run_id=run_id,
+    )
+
+    engine = DidaAgentDecisionEngine(DIDA_AGENT_CONFIG)
+    result = await engine.ashould_reply(context)
+
+    reply_payload: dict[str, Any] = {"reply_text": "", "dida_action": None}
+    if bool(result.get("should_reply", False)):
+        reply_prompt = str(result.get("reply_prompt", "")).strip()
+        if reply_prompt:
+            rule = result.get("rule")
+            try:
+                reply_payload = await engine.agenerate_reply_text(reply_prompt=reply_prompt, context=context, rule=rule)
+            except (AgentJobAbandoned,) + TRANSIENT_LLM_ERRORS:
+                # 调用方已放弃时直接结束；临时故障交给 DIDA_AGENT_RETRY_POLICY 重试整个任务
+                raise
+            except Exception as error:
+                context_event(stage="reply_generate_error", error=str(error))
+    return _dida_agent_pipeline_result(result, reply_payload, context)
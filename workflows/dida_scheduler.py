@@ -7,9 +7,10 @@ from typing import Any
 
 from ncatbot.core import GroupMessage, PrivateMessage
 
+from agent_pool import AgentRetryPolicy, submit_agent_jobs
 from bot import bot
 from workflows.agent_config_loader import load_current_agent_config
-from workflows.dida_service import DidaService
+from workflows.dida_service import DidaService, DidaTransientError
 
 
 def _now() -> datetime:
@@ -100,6 +101,7 @@ class DidaScheduler:
         poll_interval_seconds = int(config.get("poll_interval_seconds", 60))
         due_window_seconds = int(config.get("due_window_seconds", 60))
         max_tasks_scan = int(config.get("max_tasks_scan_per_user", 200))
+        fetch_concurrency = int(config.get("fetch_concurrency", 4))
         project_ids = config.get("project_ids")
         if not isinstance(project_ids, list):
             project_ids = []
@@ -107,7 +109,9 @@ class DidaScheduler:
             "poll_interval_seconds": max(poll_interval_seconds, 5),
             "due_window_seconds": max(due_window_seconds, 30),
             "max_tasks_scan_per_user": max(max_tasks_scan, 50),
+            "fetch_concurrency": max(fetch_concurrency, 1),
             "project_ids": [str(item).strip() for item in project_ids if str(item).strip()],
+            "retry": AgentRetryPolicy.from_config(config.get("retry", {}), retry_on=(DidaTransientError,)),
         }
 
     def load_tokens(self) -> dict[str, Any]:
@@ -527,8 +531,30 @@ class DidaScheduler:
             # Context for AI
             user_active_tasks = []
 
-            for project_id in project_ids:
-                data = await asyncio.to_thread(service.get_project_data, access_token=access_token, project_id=project_id)
+            # 各项目数据通过 Agent 池批量并发拉取（最多 fetch_concurrency 个同时进行），单个项目失败只跳过该项目
+            project_data: dict[int, Any] = {}
+            async for item in submit_agent_jobs(
+                [
+                    (service.get_project_data, (), {"access_token": access_token, "project_id": project_id})
+                    for project_id in project_ids
+                ],
+                priority=8,
+                timeout=60.0,
+                run_in_thread=True,
+                agent_name="dida_scheduler",
+                lane="batch",
+                max_concurrency=config["fetch_concurrency"],
+                retry=config["retry"],
+            ):
+                if item.ok:
+                    project_data[item.index] = item.result
+                else:
+                    self._log(f"poll_project_failed user={user_id} project={project_ids[item.index]} error={item.error!r}")
+
+            for index, project_id in enumerate(project_ids):
+                if index not in project_data:
+                    continue
+                data = project_data[index]
                 tasks = data.get("tasks", []) if isinstance(data, dict) else []
                 project_info = data.get("project", {}) if isinstance(data, dict) else {}
                 project_name = project_info.get("name", "unknown")
@@ -6,6 +6,13 @@ from time import perf_counter
 from typing import Any
 
 
+class DidaTransientError(RuntimeError):
+    pass
+
+
+_TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
 class DidaService:
     def __init__(self, *, client_id: str, client_secret: str, redirect_uri: str) -> None:
         self.client_id = client_id
@@ -116,11 +123,12 @@ class DidaService:
             text = error.read().decode("utf-8") if hasattr(error, "read") else ""
             elapsed_ms = (perf_counter() - started) * 1000
             print(f"[DIDA] {method} {url} status={error.code} elapsed_ms={elapsed_ms:.2f} error=http")
-            raise RuntimeError(f"Dida API error {error.code}: {text}") from error
-        except urllib.error.URLError as error:
+            error_class = DidaTransientError if error.code in _TRANSIENT_STATUS_CODES else RuntimeError
+            raise error_class(f"Dida API error {error.code}: {text}") from error
+        except (urllib.error.URLError, TimeoutError) as error:
             elapsed_ms = (perf_counter() - started) * 1000
             print(f"[DIDA] {method} {url} elapsed_ms={elapsed_ms:.2f} error=network detail={error}")
-            raise RuntimeError(f"Dida API request failed: {error}") from error
+            raise DidaTransientError(f"Dida API request failed: {error}") from error
         elapsed_ms = (perf_counter() - started) * 1000
         print(f"[DIDA] {method} {url} status={status} elapsed_ms={elapsed_ms:.2f} bytes={len(text)}")
         if status not in (200, 201):
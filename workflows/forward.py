@@ -3,30 +3,37 @@
 from __future__ import annotations
 
 import asyncio
+from functools import lru_cache
 from time import perf_counter
 from typing import Any, TypedDict
 import json
-import os
 import re
 
 from ncatbot.core import GroupMessage
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
-from agent_pool import submit_agent_job
+from agent_pool import (
+    AgentRetryPolicy,
+    raise_if_agent_job_abandoned,
+    register_durable_job,
+    submit_agent_job,
+    trace_agent_node,
+)
 from bot import QQnumber, bot
 from .agent_observe import bind_agent_event, generate_run_id
 from .agent_config_loader import load_current_agent_config
-
-try:
-    from dotenv import load_dotenv
-except Exception:  # pragma: no cover
-    load_dotenv = None
+from .llm_cascade import acascade_invoke, llm_cascade_for
+from .llm_gateway import LLMCallSpec, llm_call_from_config, route_llm
+from .llm_circuit_breaker import TRANSIENT_LLM_ERRORS, LLMCircuitOpenError
+from .llm_response_cache import alookup_llm_response, astore_llm_response, llm_cache_scope
 
 
 FORWARD_AGENT_CONFIG = load_current_agent_config(__file__)
+# LLM 临时故障时由 Agent 池退避后重新入队（retry 段缺省时按默认策略重试）
+FORWARD_RETRY_POLICY = AgentRetryPolicy.from_config(FORWARD_AGENT_CONFIG.get("retry", {}), retry_on=TRANSIENT_LLM_ERRORS)
 
 
 class ForwardDecision(BaseModel):
@@ -172,7 +179,7 @@ async def _execute_forward(
 
     try:
         result = await submit_agent_job(
-            run_forward_graph,
+            arun_forward_graph,
             ts=ts,
             group_id=group_id,
             user_id=user_id,
@@ -180,7 +187,18 @@ async def _execute_forward(
             cleaned_message=cleaned_message,
             priority=5,
             timeout=120.0,
-            run_in_thread=True,
+            agent_name="forward",
+            lane="near_real_time",
+            retry=FORWARD_RETRY_POLICY,
+            job_run_id=run_id,
+            durable_job="forward",
+            durable_args={
+                "ts": ts,
+                "group_id": group_id,
+                "user_id": user_id,
+                "user_name": user_name,
+                "cleaned_message": cleaned_message,
+            },
         )
         if result.get("should_forward"):
             await bot.api.post_private_msg(QQnumber, text=str(result.get("forward_text", cleaned_message)))
@@ -206,80 +224,132 @@ async def _execute_forward(
     return True
 
 
-def run_forward_graph(
-    *,
-    ts: str,
-    group_id: str,
-    user_id: str,
-    user_name: str,
-    cleaned_message: str,
-) -> dict[str, Any]:
-    if load_dotenv is not None:
-        load_dotenv(override=False)
+register_durable_job("forward", _execute_forward)
+
 
-    api_key = os.getenv("LLM_API_KEY")
-    if not api_key:
-        raise ValueError("缺少 LLM_API_KEY，请在 .env 中配置")
+FORWARD_DECISION_PROMPT = str(
+    FORWARD_AGENT_CONFIG.get("forward_decision_prompt")
+    or "你是消息转发判定助手。仅返回 JSON：{\"should_forward\":true/false,\"reason\":\"...\"}"
+)
 
-    base_url = os.getenv("LLM_API_BASE_URL")
+
+def _forward_llm_call() -> LLMCallSpec:
+    """准备转发判定的 LLM 调用参数；后端由网关后端池选择，判定图本身只编译一次（_forward_graph）。"""
     model_name = str(FORWARD_AGENT_CONFIG.get("model") or "gpt-4o-mini")
     try:
         temperature = float(FORWARD_AGENT_CONFIG.get("temperature", 0.0))
     except (TypeError, ValueError):
         temperature = 0.0
 
-    llm_kwargs: dict[str, Any] = {
-        "model_name": model_name,
-        "temperature": temperature,
-        "openai_api_key": api_key,
+    route = route_llm(model_name)
+    llm = route.structured_model(ForwardDecision, temperature=temperature)
+    cascade = llm_cascade_for(agent_name="forward", schema=ForwardDecision, model=model_name, temperature=temperature)
+    cache = llm_cache_scope(
+        agent_name="forward",
+        schema=ForwardDecision,
+        model=cascade.cache_model if cascade is not None else model_name,
+        temperature=temperature,
+    )
+    return LLMCallSpec(
+        llm=llm,
+        budget_kwargs=route.budget_kwargs("forward"),
+        guard_kwargs=route.guard_kwargs("forward"),
+        cache=cache,
+        cascade=cascade,
+    )
+
+
+def _build_forward_messages(state: ForwardState) -> list[Any]:
+    llm_input = {
+        "ts": state["ts"],
+        "group_id": state["group_id"],
+        "user_id": state["user_id"],
+        "user_name": state["user_name"],
+        "cleaned_message": state["cleaned_message"],
     }
-    if base_url:
-        llm_kwargs["openai_api_base"] = base_url
+    return [
+        SystemMessage(content=FORWARD_DECISION_PROMPT),
+        HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
+    ]
 
-    llm = ChatOpenAI(**llm_kwargs).with_structured_output(ForwardDecision)
-    decision_prompt = str(
-        FORWARD_AGENT_CONFIG.get("forward_decision_prompt")
-        or "你是消息转发判定助手。仅返回 JSON：{\"should_forward\":true/false,\"reason\":\"...\"}"
-    )
 
-    def decide_node(state: ForwardState) -> ForwardState:
-        llm_input = {
-            "ts": state["ts"],
-            "group_id": state["group_id"],
-            "user_id": state["user_id"],
-            "user_name": state["user_name"],
-            "cleaned_message": state["cleaned_message"],
-        }
-        result = llm.invoke(
-            [
-                SystemMessage(content=decision_prompt),
-                HumanMessage(content=json.dumps(llm_input, ensure_ascii=False)),
-            ]
+def _forward_cache_messages(state: ForwardState) -> list[Any]:
+    """
+    缓存键只取判定提示词 + 归一化后的消息内容：实际请求里的 ts / 群号 / 发送者每条消息都不同，
+    按完整请求做键永远不会命中。相同内容在不同群、不同发送者之间共用判定结果。
+    """
+    return [
+        SystemMessage(content=FORWARD_DECISION_PROMPT),
+        HumanMessage(content=" ".join(state["cleaned_message"].split())),
+    ]
+
+
+def _apply_forward_decision(state: ForwardState, result: ForwardDecision) -> ForwardState:
+    return {
+        **state,
+        "should_forward": bool(result.should_forward),
+        "reason": (result.reason or "").strip(),
+    }
+
+
+def _skip_when_circuit_open(state: ForwardState, error: LLMCircuitOpenError) -> ForwardState:
+    # 熔断期间不转发（宁可漏转也不让每条消息都卡到超时）
+    return {**state, "should_forward": False, "reason": f"跳过转发（{error}）"}
+
+
+async def _aforward_decide_node(state: ForwardState, config: RunnableConfig) -> ForwardState:
+    call = llm_call_from_config(config)
+    messages = _build_forward_messages(state)
+    cache_messages = _forward_cache_messages(state)
+    raise_if_agent_job_abandoned("forward_decide")
+    result = await alookup_llm_response(call.cache, cache_messages)
+    if result is not None:
+        return _apply_forward_decision(state, result)
+    try:
+        result = await acascade_invoke(
+            call.llm,
+            messages,
+            guard_kwargs=call.guard_kwargs,
+            budget_kwargs=call.budget_kwargs,
+            cascade=call.cascade,
         )
-        return {
-            **state,
-            "should_forward": bool(result.should_forward),
-            "reason": (result.reason or "").strip(),
-        }
+    except LLMCircuitOpenError as error:
+        return _skip_when_circuit_open(state, error)
+    await astore_llm_response(call.cache, cache_messages, result)
+    return _apply_forward_decision(state, result)
 
+
+@lru_cache(maxsize=None)
+def _forward_graph() -> Any:
+    """转发判定图，进程内只编译一次；节点为异步实现，通过 ainvoke 执行。"""
     graph = StateGraph(ForwardState)
-    graph.add_node("decide", decide_node)
+    graph.add_node("decide", trace_agent_node("decide", _aforward_decide_node))
     graph.add_edge(START, "decide")
     graph.add_edge("decide", END)
-    app = graph.compile()
-
-    final_state = app.invoke(
-        {
-            "ts": ts,
-            "group_id": str(group_id),
-            "user_id": str(user_id),
-            "user_name": str(user_name),
-            "cleaned_message": cleaned_message,
-            "should_forward": False,
-            "reason": "",
-        }
-    )
+    return graph.compile()
+
+
+def _forward_initial_state(*, ts: str, group_id: str, user_id: str, user_name: str, cleaned_message: str) -> ForwardState:
+    return {
+        "ts": ts,
+        "group_id": str(group_id),
+        "user_id": str(user_id),
+        "user_name": str(user_name),
+        "cleaned_message": cleaned_message,
+        "should_forward": False,
+        "reason": "",
+    }
+
 
+def _forward_result(
+    final_state: dict[str, Any],
+    *,
+    ts: str,
+    group_id: str,
+    user_id: str,
+    user_name: str,
+    cleaned_message: str,
+) -> dict[str, Any]:
     should_forward = bool(final_state.get("should_forward", False))
     reason = str(final_state.get("reason", "")).strip()
     forward_text = (
@@ -295,3 +365,26 @@ def run_forward_graph(
         "reason": reason,
         "forward_text": forward_text,
     }
+
+
+async def arun_forward_graph(
+    *,
+    ts: str,
+    group_id: str,
+    user_id: str,
+    user_name: str,
+    cleaned_message: str,
+) -> dict[str, Any]:
+    """转发判定：LLM 调用走 ainvoke，不占用线程。"""
+    fields = {
+        "ts": ts,
+        "group_id": group_id,
+        "user_id": user_id,
+        "user_name": user_name,
+        "cleaned_message": cleaned_message,
+    }
+    final_state = await _forward_graph().ainvoke(
+        _forward_initial_state(**fields),
+        config=_forward_llm_call().as_config(),
+    )
+    return _forward_result(final_state, **fields)
@@ -0,0 +1,291 @@
+"""LLM 模型级联：判定节点先用便宜的小模型给出结论和置信度，置信度不足或小模型失败时才升级到配置的大模型。"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+from langchain_core.messages import SystemMessage
+from pydantic import Field, create_model
+
+from agent_pool import AgentJobAbandoned
+from .agent_config_loader import load_current_agent_config
+from .agent_observe import observe_agent_event
+from .llm_circuit_breaker import LLMCircuitOpenError
+from .llm_gateway import route_llm
+from .llm_hedging import LLMHedge, ahedged_invoke
+
+
+LLM_CASCADE_CONFIG = load_current_agent_config(__file__)
+
+DEFAULT_CONFIDENCE_PROMPT = (
+    "除判定结果外，另给出 confidence 字段：你对本次判定的把握，取值 0~1。"
+    "信息不足、语义含糊或需要更多上下文才能判断时给低分，不要为了显得确定而给高分。"
+)
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+@lru_cache(maxsize=None)
+def with_confidence(schema: Any) -> Any:
+    """便宜档使用的输出 schema：在原 schema 上加 confidence 字段（子类，节点按原 schema 读取结果即可）。"""
+    return create_model(
+        f"{schema.__name__}WithConfidence",
+        __base__=schema,
+        confidence=(float, Field(default=0.0, description="对本次判定的把握（0~1），拿不准时给低分")),
+    )
+
+
+@dataclass(frozen=True)
+class LLMCascade:
+    """一次判定调用的便宜档：客户端及其限流 / 熔断参数；key 为级联统计的分组（agent_name:cheap>strong）。"""
+
+    key: str
+    llm: Any
+    guard_kwargs: dict[str, Any]
+    budget_kwargs: dict[str, Any]
+    threshold: float
+    cheap_model: str
+    strong_model: str
+    prompt: str
+    agent_name: str
+    run_id: str = ""
+
+    @property
+    def cache_model(self) -> str:
+        """开启级联后响应缓存的模型键，与只用大模型时的缓存分开。"""
+        return f"{self.cheap_model}>{self.strong_model}"
+
+    def messages(self, messages: list[Any]) -> list[Any]:
+        """在首条系统提示之后插入置信度要求。"""
+        if not messages:
+            return [SystemMessage(content=self.prompt)]
+        return [messages[0], SystemMessage(content=self.prompt), *messages[1:]]
+
+
+class LLMCascadePolicy:
+    """按 key 统计级联结果（accepted / escalated / cheap_failed / strong_circuit_open）与各档调用耗时。"""
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.enabled = bool(self.config.get("enabled", False))
+        agents = self.config.get("agents")
+        self.agents: dict[str, Any] = agents if isinstance(agents, dict) else {}
+        self.threshold = min(_float_config(self.config, "confidence_threshold", 0.75), 1.0)
+        self.prompt = str(self.config.get("confidence_prompt") or DEFAULT_CONFIDENCE_PROMPT)
+        self._lock = Lock()
+        self._counters: dict[str, dict[str, int]] = {}
+        self._latencies: dict[str, dict[str, list[float]]] = {}
+
+    def agent_config(self, agent_name: str) -> dict[str, Any] | None:
+        """该工作流未开启级联时返回 None。"""
+        if not self.enabled:
+            return None
+        agent_config = self.agents.get(agent_name)
+        if not isinstance(agent_config, dict) or not bool(agent_config.get("enabled", False)):
+            return None
+        return agent_config
+
+    def cheap_model(self, agent_name: str) -> str:
+        """该工作流的便宜档模型（agents.<name>.cheap_model 优先，其次全局），未开启时返回空字符串。"""
+        agent_config = self.agent_config(agent_name)
+        if agent_config is None:
+            return ""
+        return str(agent_config.get("cheap_model") or self.config.get("cheap_model") or "").strip()
+
+    def agent_threshold(self, agent_name: str) -> float:
+        agent_config = self.agent_config(agent_name) or {}
+        return min(_float_config(agent_config, "confidence_threshold", self.threshold), 1.0)
+
+    def record(self, key: str, *, outcome: str, latencies: dict[str, float]) -> None:
+        with self._lock:
+            if outcome != "tier":
+                counter = self._counters.get(key)
+                if counter is None:
+                    counter = {"calls": 0, "accepted": 0, "escalated": 0, "cheap_failed": 0, "strong_circuit_open": 0}
+                    self._counters[key] = counter
+                counter["calls"] += 1
+                if outcome in counter:
+                    counter[outcome] += 1
+            tiers = self._latencies.setdefault(key, {})
+            for tier, seconds in latencies.items():
+                total = tiers.setdefault(tier, [0.0, 0.0])
+                total[0] += 1
+                total[1] += seconds
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats: dict[str, Any] = {}
+            for key in set(self._counters) | set(self._latencies):
+                counter = dict(self._counters.get(key, {}))
+                calls = counter.get("calls", 0)
+                if calls:
+                    # cheap_failed 同样升级到大模型
+                    counter["escalation_rate"] = round((counter["escalated"] + counter["cheap_failed"]) / calls, 3)
+                for tier, (count, total) in self._latencies.get(key, {}).items():
+                    counter[f"{tier}_calls"] = int(count)
+                    counter[f"{tier}_avg_ms"] = round(total / count * 1000, 1) if count else 0.0
+                stats[key] = counter
+            return stats
+
+
+_LLM_CASCADE_POLICY = LLMCascadePolicy(LLM_CASCADE_CONFIG)
+
+
+def get_llm_cascade_policy() -> LLMCascadePolicy:
+    return _LLM_CASCADE_POLICY
+
+
+def llm_cascade_for(*, agent_name: str, schema: Any, model: str, temperature: float, run_id: str = "") -> LLMCascade | None:
+    """
+    该工作流开启了级联且便宜档模型与 model 不同时返回便宜档，否则返回 None（节点只调用 model）。
+    便宜档同样经 LLM 网关后端池选择后端；没有后端可承接便宜档模型时不级联。
+    """
+    policy = get_llm_cascade_policy()
+    cheap_model = policy.cheap_model(agent_name)
+    if not cheap_model or cheap_model == model:
+        return None
+    try:
+        route = route_llm(cheap_model)
+    except ValueError as error:
+        print(f"[LLM-CASCADE] {agent_name} 便宜档不可用，本次只调用 {model}: {error}")
+        return None
+    return LLMCascade(
+        key=f"{agent_name}:{cheap_model}>{model}",
+        llm=route.structured_model(with_confidence(schema), temperature=temperature),
+        guard_kwargs=route.guard_kwargs(agent_name, run_id=run_id),
+        budget_kwargs=route.budget_kwargs(agent_name, run_id=run_id),
+        threshold=policy.agent_threshold(agent_name),
+        cheap_model=cheap_model,
+        strong_model=model,
+        prompt=policy.prompt,
+        agent_name=agent_name,
+        run_id=run_id,
+    )
+
+
+def llm_tier_model(agent_name: str) -> str:
+    """分档（不做置信度升级）的工作流取便宜档模型，例如 summary 的 map 分片；未开启时返回空字符串。"""
+    return get_llm_cascade_policy().cheap_model(agent_name)
+
+
+def _confidence(result: Any) -> float:
+    try:
+        return float(getattr(result, "confidence", 0.0) or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+async def acascade_invoke(
+    llm: Any,
+    messages: list[Any],
+    *,
+    guard_kwargs: dict[str, Any],
+    budget_kwargs: dict[str, Any],
+    cascade: LLMCascade | None = None,
+    hedge: LLMHedge | None = None,
+) -> Any:
+    """
+    判定节点的 LLM 调用入口（熔断 + 限流 + ainvoke）；cascade 为 None 时与直接调用 ahedged_invoke 完全相同。
+    - 便宜档置信度 >= threshold：直接采用
+    - 置信度不足、便宜档任何失败（解析失败、熔断打开、临时故障，以及超出小模型上下文 / 不支持结构化输出 /
+      模型名或密钥有误等 openai.APIError）：升级到 llm，开启级联不应比只用大模型更容易失败；
+      只有调用方已放弃（AgentJobAbandoned、CancelledError）时直接抛出，不再调用大模型
+    - 升级时大模型熔断打开而便宜档有结果：退回便宜档结果，否则照常抛出
+    - 升级到大模型的调用仍走 ahedged_invoke（开启了对冲时照常对冲）
+    """
+    if cascade is None:
+        return await ahedged_invoke(llm, messages, guard_kwargs=guard_kwargs, budget_kwargs=budget_kwargs, hedge=hedge)
+
+    started = monotonic()
+    cheap_result: Any = None
+    error = ""
+    try:
+        cheap_result = await ahedged_invoke(
+            cascade.llm,
+            cascade.messages(messages),
+            guard_kwargs=cascade.guard_kwargs,
+            budget_kwargs=cascade.budget_kwargs,
+        )
+    except AgentJobAbandoned:
+        raise
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    cheap_seconds = monotonic() - started
+    if cheap_result is not None and _confidence(cheap_result) >= cascade.threshold:
+        _observe_cascade(cascade, outcome="accepted", result=cheap_result, latencies={"cheap": cheap_seconds})
+        return cheap_result
+
+    strong_started = monotonic()
+    try:
+        result = await ahedged_invoke(llm, messages, guard_kwargs=guard_kwargs, budget_kwargs=budget_kwargs, hedge=hedge)
+    except LLMCircuitOpenError:
+        if cheap_result is None:
+            raise
+        _observe_cascade(cascade, outcome="strong_circuit_open", result=cheap_result, latencies={"cheap": cheap_seconds})
+        return cheap_result
+    _observe_cascade(
+        cascade,
+        outcome="escalated" if cheap_result is not None else "cheap_failed",
+        result=cheap_result,
+        latencies={"cheap": cheap_seconds, "strong": monotonic() - strong_started},
+        error=error,
+    )
+    return result
+
+
+def _observe_cascade(
+    cascade: LLMCascade,
+    *,
+    outcome: str,
+    result: Any,
+    latencies: dict[str, float],
+    error: str = "",
+) -> None:
+    policy = get_llm_cascade_policy()
+    policy.record(cascade.key, outcome=outcome, latencies=latencies)
+    observe_agent_event(
+        agent_name=cascade.agent_name,
+        task_type=cascade.agent_name.upper(),
+        run_id=cascade.run_id,
+        stage="llm_cascade",
+        latency_ms=sum(latencies.values()) * 1000,
+        error=error,
+        extra={
+            "outcome": outcome,
+            "key": cascade.key,
+            "confidence": round(_confidence(result), 3) if result is not None else None,
+            "threshold": cascade.threshold,
+            **{f"{tier}_latency_ms": round(seconds * 1000, 1) for tier, seconds in latencies.items()},
+            "stats": policy.stats().get(cascade.key, {}),
+        },
+    )
+
+
+def observe_llm_tier(*, agent_name: str, stage: str, tier: str, model: str, seconds: float, run_id: str = "") -> None:
+    """分档调用（如 summary 的 map 走便宜档、reduce / 全局总览走大模型）记录各档耗时，key 为 agent_name:stage。"""
+    policy = get_llm_cascade_policy()
+    key = f"{agent_name}:{stage}"
+    policy.record(key, outcome="tier", latencies={tier: seconds})
+    observe_agent_event(
+        agent_name=agent_name,
+        task_type=agent_name.upper(),
+        run_id=run_id,
+        stage="llm_cascade",
+        latency_ms=seconds * 1000,
+        extra={
+            "outcome": "tier",
+            "key": key,
+            "tier": tier,
+            "model": model,
+            "stats": policy.stats().get(key, {}),
+        },
+    )
@@ -0,0 +1,337 @@
+"""LLM 调用熔断：按 (base_url, model) 统计连续失败/超时，打开后快速失败，定时半开探测恢复。"""
+
+from __future__ import annotations
+
+from threading import Lock
+import asyncio
+from time import monotonic
+from typing import Any, Callable
+
+from .agent_config_loader import load_current_agent_config
+from .agent_observe import observe_agent_event
+
+try:
+    import openai
+except Exception:  # pragma: no cover
+    openai = None
+
+
+LLM_CIRCUIT_BREAKER_CONFIG = load_current_agent_config(__file__)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# 值得重试的 LLM 临时故障（连接失败 / 超时 / 429 / 5xx），供 AgentRetryPolicy.retry_on 使用
+TRANSIENT_LLM_ERRORS: tuple[type[BaseException], ...] = (TimeoutError, ConnectionError) + (
+    (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError) if openai is not None else ()
+)
+
+# 结构化输出解析失败说明后端已正常返回，不算后端故障
+_NON_BACKEND_ERROR_NAMES = {"OutputParserException", "ValidationError", "JSONDecodeError"}
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class LLMCircuitOpenError(RuntimeError):
+    """熔断打开（或半开探测名额已被占用）时快速失败，调用方应走本地兜底逻辑。"""
+
+    def __init__(self, key: tuple[str, str], retry_after: float):
+        self.key = key
+        self.retry_after = retry_after
+        base_url, model = key
+        super().__init__(f"LLM 熔断中: model={model} base_url={base_url or '(default)'} retry_after={retry_after:.1f}s")
+
+
+def _is_timeout_error(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    return "timeout" in type(error).__name__.lower()
+
+
+class CircuitBreaker:
+    """
+    单个 (base_url, model) 的熔断状态机（调用方负责加锁）：
+    - closed：连续失败（异常或慢调用）达到 failure_threshold 次后打开
+    - open：open_seconds 内所有调用直接抛 LLMCircuitOpenError
+    - half_open：放行最多 half_open_max_calls 个探测调用，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, *, failure_threshold: int, open_seconds: float, half_open_max_calls: int):
+        self.failure_threshold = max(failure_threshold, 1)
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(half_open_max_calls, 1)
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.last_error = ""
+        self.rejected_total = 0
+        self.opened_total = 0
+
+    def retry_after(self, now: float) -> float:
+        return max(self.opened_at + self.open_seconds - now, 0.0)
+
+
+class LLMCircuitBreakerRegistry:
+    """按 (base_url, model) 维护熔断器；状态变化写入 agent_events.jsonl（stage=llm_circuit_state）。"""
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.enabled = bool(self.config.get("enabled", True))
+        self.failure_threshold = int(_float_config(self.config, "failure_threshold", 5))
+        self.open_seconds = _float_config(self.config, "open_seconds", 30.0)
+        self.half_open_max_calls = int(_float_config(self.config, "half_open_max_calls", 1))
+        self.slow_call_seconds = _float_config(self.config, "slow_call_seconds", 60.0)
+        self._lock = Lock()
+        self._breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def _get(self, key: tuple[str, str]) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=self.failure_threshold,
+                open_seconds=self.open_seconds,
+                half_open_max_calls=self.half_open_max_calls,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    def _transition(
+        self,
+        key: tuple[str, str],
+        breaker: CircuitBreaker,
+        state: str,
+        now: float,
+        transitions: list[dict[str, Any]],
+    ) -> None:
+        previous = breaker.state
+        breaker.state = state
+        if state == CIRCUIT_OPEN:
+            breaker.opened_at = now
+            breaker.opened_total += 1
+        if state == CIRCUIT_CLOSED:
+            breaker.consecutive_failures = 0
+        transitions.append(
+            {
+                "base_url": key[0],
+                "model": key[1],
+                "from_state": previous,
+                "to_state": state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "last_error": breaker.last_error,
+            }
+        )
+
+    def admit(self, key: tuple[str, str], transitions: list[dict[str, Any]]) -> bool:
+        """放行返回是否为半开探测调用；不放行抛 LLMCircuitOpenError。"""
+        with self._lock:
+            breaker = self._get(key)
+            now = monotonic()
+            if breaker.state == CIRCUIT_OPEN and breaker.retry_after(now) <= 0:
+                self._transition(key, breaker, CIRCUIT_HALF_OPEN, now, transitions)
+            if breaker.state == CIRCUIT_CLOSED:
+                return False
+            if breaker.state == CIRCUIT_HALF_OPEN and breaker.probes_in_flight < breaker.half_open_max_calls:
+                breaker.probes_in_flight += 1
+                return True
+            breaker.rejected_total += 1
+            retry_after = breaker.retry_after(now) if breaker.state == CIRCUIT_OPEN else self.open_seconds
+            raise LLMCircuitOpenError(key, retry_after)
+
+    def record(
+        self,
+        key: tuple[str, str],
+        *,
+        probe: bool,
+        outcome: str,
+        error: str,
+        transitions: list[dict[str, Any]],
+    ) -> None:
+        """outcome：success / error / timeout / ignored（调用未真正发出或被取消，只归还探测名额）。"""
+        with self._lock:
+            breaker = self._get(key)
+            now = monotonic()
+            if probe:
+                breaker.probes_in_flight = max(breaker.probes_in_flight - 1, 0)
+            if outcome == "ignored":
+                return
+            if outcome == "success":
+                breaker.consecutive_failures = 0
+                if breaker.state == CIRCUIT_HALF_OPEN and probe:
+                    self._transition(key, breaker, CIRCUIT_CLOSED, now, transitions)
+                return
+            breaker.consecutive_failures += 1
+            breaker.last_error = f"{outcome}: {error}"[:300]
+            if breaker.state == CIRCUIT_HALF_OPEN and probe:
+                self._transition(key, breaker, CIRCUIT_OPEN, now, transitions)
+            elif breaker.state == CIRCUIT_CLOSED and breaker.consecutive_failures >= breaker.failure_threshold:
+                self._transition(key, breaker, CIRCUIT_OPEN, now, transitions)
+
+    def is_open(self, key: tuple[str, str]) -> bool:
+        """只读判断（不占用探测名额）：打开且未到探测时间时返回 True。"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                return False
+            return breaker.state == CIRCUIT_OPEN and breaker.retry_after(monotonic()) > 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            now = monotonic()
+            return {
+                f"{model}@{base_url}": {
+                    "state": breaker.state,
+                    "consecutive_failures": breaker.consecutive_failures,
+                    "retry_after_seconds": round(breaker.retry_after(now), 1) if breaker.state == CIRCUIT_OPEN else 0.0,
+                    "opened_total": breaker.opened_total,
+                    "rejected_total": breaker.rejected_total,
+                    "last_error": breaker.last_error,
+                }
+                for (base_url, model), breaker in self._breakers.items()
+            }
+
+
+_LLM_CIRCUIT_BREAKER = LLMCircuitBreakerRegistry(LLM_CIRCUIT_BREAKER_CONFIG)
+
+
+def get_llm_circuit_breaker() -> LLMCircuitBreakerRegistry:
+    return _LLM_CIRCUIT_BREAKER
+
+
+# llm_call_guard 的调用回调：listener(event, backend, outcome, elapsed)，event 为 start / finish（LLM 网关据此统计后端负载与耗时）
+_CALL_LISTENERS: list[Callable[[str, str, str, float], None]] = []
+
+
+def add_llm_call_listener(listener: Callable[[str, str, str, float], None]) -> None:
+    if listener not in _CALL_LISTENERS:
+        _CALL_LISTENERS.append(listener)
+
+
+def build_circuit_key(*, base_url: str | None, model: str, backend: str = "") -> tuple[str, str]:
+    """多后端时同一 base_url 下的不同 key 分别熔断（某个 key 被限流不影响其它 key）。"""
+    base = str(base_url or "")
+    return (f"{base}#{backend}" if backend else base), str(model)
+
+
+def is_llm_circuit_open(*, base_url: str | None, model: str, backend: str = "") -> bool:
+    return get_llm_circuit_breaker().is_open(build_circuit_key(base_url=base_url, model=model, backend=backend))
+
+
+class LLMCallGuard:
+    """
+    包住一次 LLM 调用（同步/异步节点都用普通 with）：
+    - 进入时检查熔断，打开则抛 LLMCircuitOpenError
+    - mark_sent() 之后抛出的异常才计为后端失败（限流等待、任务被放弃等不算），耗时也从 mark_sent() 开始计
+    - 耗时超过 slow_call_seconds 的调用即使成功也按超时计；异步调用被取消时同理
+    """
+
+    def __init__(
+        self,
+        *,
+        base_url: str | None,
+        model: str,
+        agent_name: str,
+        task_type: str = "",
+        run_id: str = "",
+        backend: str = "",
+    ):
+        self.key = build_circuit_key(base_url=base_url, model=model, backend=backend)
+        self.backend = backend
+        self.agent_name = agent_name
+        self.task_type = task_type
+        self.run_id = run_id
+        self._probe = False
+        self._sent_at: float | None = None
+        self._registry = get_llm_circuit_breaker()
+
+    def __enter__(self) -> "LLMCallGuard":
+        if self._registry.enabled:
+            transitions: list[dict[str, Any]] = []
+            try:
+                self._probe = self._registry.admit(self.key, transitions)
+            finally:
+                self._observe(transitions)
+        self._notify("start", "", 0.0)
+        return self
+
+    def mark_sent(self) -> None:
+        self._sent_at = monotonic()
+
+    def __exit__(self, exc_type: Any, exc: BaseException | None, tb: Any) -> bool:
+        outcome, error = self._classify(exc)
+        self._notify("finish", outcome, monotonic() - self._sent_at if self._sent_at is not None else 0.0)
+        if not self._registry.enabled:
+            return False
+        transitions: list[dict[str, Any]] = []
+        self._registry.record(self.key, probe=self._probe, outcome=outcome, error=error, transitions=transitions)
+        self._observe(transitions)
+        return False
+
+    def _classify(self, exc: BaseException | None) -> tuple[str, str]:
+        if self._sent_at is None:
+            return "ignored", ""
+        elapsed = monotonic() - self._sent_at
+        slow = self._registry.slow_call_seconds > 0 and elapsed >= self._registry.slow_call_seconds
+        if exc is None:
+            return ("timeout", f"slow call {elapsed:.1f}s") if slow else ("success", "")
+        if isinstance(exc, asyncio.CancelledError):
+            return ("timeout", f"cancelled after {elapsed:.1f}s") if slow else ("ignored", "")
+        if not isinstance(exc, Exception):
+            return "ignored", ""
+        if type(exc).__name__ in _NON_BACKEND_ERROR_NAMES:
+            return "success", ""
+        if _is_timeout_error(exc) or slow:
+            return "timeout", f"{type(exc).__name__}: {exc}"
+        return "error", f"{type(exc).__name__}: {exc}"
+
+    def _notify(self, event: str, outcome: str, elapsed: float) -> None:
+        for listener in _CALL_LISTENERS:
+            try:
+                listener(event, self.backend, outcome, elapsed)
+            except Exception as error:
+                print(f"[LLM-CIRCUIT] 调用回调失败: {error}")
+
+    def _observe(self, transitions: list[dict[str, Any]]) -> None:
+        for transition in transitions:
+            observe_agent_event(
+                agent_name=self.agent_name,
+                task_type=self.task_type or self.agent_name.upper(),
+                run_id=self.run_id,
+                stage="llm_circuit_state",
+                error=transition["last_error"] if transition["to_state"] == CIRCUIT_OPEN else "",
+                extra=transition,
+            )
+            print(
+                "[LLM-CIRCUIT] "
+                f"model={transition['model']} base_url={transition['base_url'] or '(default)'} "
+                f"{transition['from_state']} -> {transition['to_state']} "
+                f"failures={transition['consecutive_failures']}"
+            )
+
+
+def llm_call_guard(
+    *,
+    base_url: str | None,
+    model: str,
+    agent_name: str,
+    task_type: str = "",
+    run_id: str = "",
+    backend: str = "",
+) -> LLMCallGuard:
+    """用法：with llm_call_guard(...) as guard: acquire_llm_budget(...); guard.mark_sent(); llm.invoke(...)"""
+    return LLMCallGuard(
+        base_url=base_url,
+        model=model,
+        agent_name=agent_name,
+        task_type=task_type,
+        run_id=run_id,
+        backend=backend,
+    )
@@ -0,0 +1,575 @@
+"""LLM 网关：集中读取 LLM 环境变量，按 (model, temperature, base_url, api_key) 缓存 ChatOpenAI，共享 keep-alive 连接池。"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+from time import monotonic
+from typing import TYPE_CHECKING, Any, Mapping
+import asyncio
+import hashlib
+import math
+import os
+
+from langchain_openai import ChatOpenAI
+
+from .agent_config_loader import load_current_agent_config
+from .llm_circuit_breaker import add_llm_call_listener, is_llm_circuit_open
+from .llm_response_cache import LLMCacheScope
+
+if TYPE_CHECKING:
+    from .llm_cascade import LLMCascade
+    from .llm_hedging import LLMHedge
+
+try:
+    from dotenv import load_dotenv
+except Exception:  # pragma: no cover
+    load_dotenv = None
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None
+
+
+LLM_GATEWAY_CONFIG = load_current_agent_config(__file__)
+
+DEFAULT_LLM_MODEL = "gpt-4o-mini"
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class LLMSettings:
+    """进程内只读取一次的 LLM 环境变量（.env 中的 LLM_API_KEY / LLM_API_BASE_URL / LLM_MODEL）。"""
+
+    api_key: str
+    base_url: str | None
+    model: str
+
+
+def _read_llm_settings(*, override: bool) -> LLMSettings:
+    if load_dotenv is not None:
+        load_dotenv(override=override)
+    return LLMSettings(
+        api_key=os.getenv("LLM_API_KEY") or "",
+        base_url=os.getenv("LLM_API_BASE_URL") or None,
+        model=os.getenv("LLM_MODEL") or "",
+    )
+
+
+@dataclass(frozen=True)
+class LLMCallSpec:
+    """
+    一次图调用所需的 LLM 客户端与限流 / 熔断参数。
+    LangGraph 图只编译一次，这些按调用变化的对象经 config["configurable"]["llm_call"] 传入节点，不再捕获在闭包里。
+    """
+
+    llm: Any
+    budget_kwargs: dict[str, Any]
+    guard_kwargs: dict[str, Any]
+    raw_llm: Any = None
+    include_raw: bool = False
+    # 开启了 LLM 响应缓存的工作流才有，节点在 llm_call_guard 之前查缓存（见 llm_response_cache）
+    cache: LLMCacheScope | None = None
+    # 开启了对冲的交互式工作流才有，异步节点经 ahedged_invoke 发起调用（见 llm_hedging）
+    hedge: LLMHedge | None = None
+    # 开启了模型级联的判定节点才有，节点经 acascade_invoke 先调用便宜档（见 llm_cascade）
+    cascade: LLMCascade | None = None
+
+    def as_config(self) -> dict[str, Any]:
+        return {"configurable": {"llm_call": self}}
+
+
+def llm_call_from_config(config: Mapping[str, Any] | None) -> LLMCallSpec:
+    """节点内取出 LLMCallSpec；调用方忘记传 config 时直接报错，而不是静默使用别的模型。"""
+    configurable = (config or {}).get("configurable") or {}
+    call = configurable.get("llm_call")
+    if not isinstance(call, LLMCallSpec):
+        raise RuntimeError("图调用缺少 config['configurable']['llm_call']（LLMCallSpec）")
+    return call
+
+
+@dataclass(frozen=True)
+class LLMBackend:
+    """
+    后端池中的一个 (base_url, api_key) 组合：
+    - models：模型别名，工作流使用的模型名 -> 该后端实际的模型名（未列出的模型按原名调用）
+    - exclusive：为 true 时只承接 models 中列出的模型
+    """
+
+    name: str
+    base_url: str | None
+    api_key: str
+    weight: float = 1.0
+    models: dict[str, str] = field(default_factory=dict)
+    exclusive: bool = False
+
+    def serves(self, model: str) -> bool:
+        return not self.exclusive or model in self.models
+
+    def resolve(self, model: str) -> str:
+        return str(self.models.get(model) or model)
+
+
+@dataclass(frozen=True)
+class LLMRoute:
+    """一次调用选中的后端；客户端、限流与熔断参数都从同一个 route 取，保证三者落在同一个 key 上。"""
+
+    backend: str
+    base_url: str | None
+    api_key: str
+    model: str
+    requested_model: str
+
+    def chat_model(self, *, temperature: float = 0.0) -> ChatOpenAI:
+        return get_chat_model(model=self.model, temperature=temperature, base_url=self.base_url, api_key=self.api_key)
+
+    def structured_model(self, schema: Any, *, include_raw: bool = False, temperature: float = 0.0) -> Any:
+        return get_structured_chat_model(
+            schema,
+            include_raw=include_raw,
+            model=self.model,
+            temperature=temperature,
+            base_url=self.base_url,
+            api_key=self.api_key,
+        )
+
+    def budget_kwargs(self, agent_name: str, *, run_id: str = "") -> dict[str, Any]:
+        budget_kwargs: dict[str, Any] = {
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+            "model": self.model,
+            "agent_name": agent_name,
+        }
+        if run_id:
+            budget_kwargs["run_id"] = run_id
+        return budget_kwargs
+
+    def guard_kwargs(self, agent_name: str, *, run_id: str = "") -> dict[str, Any]:
+        guard_kwargs: dict[str, Any] = {
+            "base_url": self.base_url,
+            "model": self.model,
+            "agent_name": agent_name,
+            "backend": self.backend,
+        }
+        if run_id:
+            guard_kwargs["run_id"] = run_id
+        return guard_kwargs
+
+
+class _BackendState:
+    """单个后端的运行状态（调用方负责加锁）。"""
+
+    def __init__(self, backend: LLMBackend, latency_window: int):
+        self.backend = backend
+        self.in_flight = 0
+        self.current_weight = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejected_total = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.ewma_latency = 0.0
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+
+
+class LLMBackendPool:
+    """
+    多后端路由：
+    - least_outstanding：选 (进行中 + 1) / weight 最小的后端，相同时轮询；进行中从 llm_call_guard 进入时计入，
+      route() 本身不占负载（对冲目标、命中缓存等选了后端却没有发出的调用很常见）
+    - weighted：平滑加权轮询（按 weight 比例分配）
+    - 健康：连续失败 eject_after_failures 次的后端摘除 eject_seconds；该 (后端, 模型) 熔断打开时同样跳过；
+      全部不可用时仍在可承接该模型的后端中选择（调用会在 llm_call_guard 处快速失败，走工作流兜底）
+    - 进行中 / 耗时 / 失败由 llm_call_guard 回调（on_llm_call）统计
+    """
+
+    def __init__(
+        self,
+        backends: list[LLMBackend],
+        *,
+        strategy: str = "least_outstanding",
+        eject_after_failures: int = 3,
+        eject_seconds: float = 30.0,
+        latency_window: int = 200,
+    ):
+        self.strategy = strategy if strategy in {"least_outstanding", "weighted"} else "least_outstanding"
+        self.eject_after_failures = max(eject_after_failures, 0)
+        self.eject_seconds = eject_seconds
+        self._lock = Lock()
+        self._states = {backend.name: _BackendState(backend, latency_window) for backend in backends}
+        self._rotation = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _healthy(self, state: _BackendState, model: str, now: float) -> bool:
+        if state.ejected_until > now:
+            return False
+        backend = state.backend
+        return not is_llm_circuit_open(base_url=backend.base_url, model=backend.resolve(model), backend=backend.name)
+
+    def route(self, model: str, *, exclude: tuple[str, ...] = ()) -> LLMRoute:
+        with self._lock:
+            now = monotonic()
+            candidates = [state for state in self._states.values() if state.backend.serves(model)]
+            if not candidates:
+                raise ValueError(f"没有可承接模型 {model} 的 LLM 后端，请检查 llm_gateway_config.backends")
+            preferred = [state for state in candidates if state.backend.name not in exclude] or candidates
+            healthy = [state for state in preferred if self._healthy(state, model, now)] or preferred
+            if self.strategy == "weighted":
+                total = sum(state.backend.weight for state in healthy)
+                for state in healthy:
+                    state.current_weight += state.backend.weight
+                chosen = max(healthy, key=lambda state: state.current_weight)
+                chosen.current_weight -= total
+            else:
+                self._rotation += 1
+                offset = self._rotation % len(healthy)
+                rotated = healthy[offset:] + healthy[:offset]
+                chosen = min(
+                    rotated,
+                    key=lambda state: (state.in_flight + 1) / max(state.backend.weight, 1e-6),
+                )
+            backend = chosen.backend
+        return LLMRoute(
+            backend=backend.name,
+            base_url=backend.base_url,
+            api_key=backend.api_key,
+            model=backend.resolve(model),
+            requested_model=model,
+        )
+
+    def on_llm_call(self, event: str, backend: str, outcome: str, elapsed: float) -> None:
+        """llm_call_guard 的回调：start 在通过熔断检查后，finish 在调用结束（outcome 同熔断统计）。"""
+        with self._lock:
+            state = self._states.get(backend)
+            if state is None:
+                return
+            if event == "start":
+                state.in_flight += 1
+                return
+            state.in_flight = max(state.in_flight - 1, 0)
+            if outcome == "ignored":
+                return
+            state.calls += 1
+            if outcome == "success":
+                state.consecutive_failures = 0
+                state.latencies.append(elapsed)
+                state.ewma_latency = elapsed if state.calls == 1 else 0.8 * state.ewma_latency + 0.2 * elapsed
+                return
+            if outcome == "timeout":
+                state.timeouts += 1
+            else:
+                state.errors += 1
+            state.consecutive_failures += 1
+            if self.eject_after_failures and state.consecutive_failures >= self.eject_after_failures:
+                state.ejected_until = monotonic() + self.eject_seconds
+                state.ejected_total += 1
+                state.consecutive_failures = 0
+                print(f"[LLM-GATEWAY] 后端 {backend or '(default)'} 连续失败，摘除 {self.eject_seconds:.0f}s")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            now = monotonic()
+            stats: dict[str, Any] = {}
+            for name, state in self._states.items():
+                ordered = sorted(state.latencies)
+                p95 = ordered[min(max(math.ceil(len(ordered) * 0.95) - 1, 0), len(ordered) - 1)] if ordered else 0.0
+                stats[name or "(default)"] = {
+                    "base_url": state.backend.base_url or "(default)",
+                    "api_key_id": hashlib.sha256(state.backend.api_key.encode("utf-8")).hexdigest()[:8],
+                    "weight": state.backend.weight,
+                    "in_flight": state.in_flight,
+                    "calls": state.calls,
+                    "errors": state.errors,
+                    "timeouts": state.timeouts,
+                    "ewma_latency_ms": round(state.ewma_latency * 1000, 1),
+                    "p95_latency_ms": round(p95 * 1000, 1),
+                    "ejected_seconds_left": round(max(state.ejected_until - now, 0.0), 1),
+                    "ejected_total": state.ejected_total,
+                }
+            return stats
+
+
+def _build_backend_pool(config: dict[str, Any], settings: LLMSettings) -> LLMBackendPool:
+    """backends 留空时只有一个由 .env 构成的默认后端（名称为空，熔断键与单 key 部署保持一致）。"""
+    backends: list[LLMBackend] = []
+    raw_backends = config.get("backends")
+    for index, raw in enumerate(raw_backends if isinstance(raw_backends, list) else []):
+        if not isinstance(raw, dict):
+            continue
+        api_key_env = str(raw.get("api_key_env") or "LLM_API_KEY")
+        api_key = os.getenv(api_key_env) or ""
+        name = str(raw.get("name") or f"backend{index + 1}")
+        if not api_key:
+            print(f"[LLM-GATEWAY] 后端 {name} 缺少环境变量 {api_key_env}，已跳过")
+            continue
+        base_url_env = str(raw.get("base_url_env") or "")
+        base_url = str(raw.get("base_url") or (os.getenv(base_url_env) if base_url_env else "") or "") or None
+        models = raw.get("models")
+        backends.append(
+            LLMBackend(
+                name=name,
+                base_url=base_url,
+                api_key=api_key,
+                weight=_float_config(raw, "weight", 1.0) or 1.0,
+                models={str(alias): str(target) for alias, target in models.items()} if isinstance(models, dict) else {},
+                exclusive=bool(raw.get("exclusive", False)),
+            )
+        )
+    if not backends and settings.api_key:
+        backends.append(LLMBackend(name="", base_url=settings.base_url, api_key=settings.api_key))
+    return LLMBackendPool(
+        backends,
+        strategy=str(config.get("routing") or "least_outstanding"),
+        eject_after_failures=int(_float_config(config, "eject_after_failures", 3)),
+        eject_seconds=_float_config(config, "eject_seconds", 30.0),
+    )
+
+
+# reload 时在事件循环上关闭旧异步客户端的任务（持有引用，避免任务被回收）
+_closing_tasks: set[asyncio.Task] = set()
+
+
+def _close_http_clients(client: Any, async_client: Any) -> None:
+    """关闭 reload 换下的共享连接池：同步客户端直接 close；异步客户端在运行中的事件循环上 aclose，没有循环时用 asyncio.run。"""
+    if client is not None:
+        try:
+            client.close()
+        except Exception as error:
+            print(f"[LLM-GATEWAY] 关闭旧 HTTP 客户端失败: {error!r}")
+    if async_client is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None:
+        try:
+            asyncio.run(async_client.aclose())
+        except Exception as error:
+            print(f"[LLM-GATEWAY] 关闭旧异步 HTTP 客户端失败: {error!r}")
+        return
+    task = loop.create_task(async_client.aclose())
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+class LLMGateway:
+    """
+    - settings：首次使用时读取一次环境变量，之后直接复用；修改 .env 后调用 reload() 生效
+    - 客户端缓存：同一 (model, temperature, base_url, api_key) 复用同一个 ChatOpenAI，
+      with_structured_output 的结果按 schema 再缓存一层，避免每条消息重新构造
+    - 所有客户端共享一对 httpx 同步 / 异步连接池（keep-alive），不再为每次请求重新握手
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.max_connections = int(_float_config(self.config, "max_connections", 50)) or None
+        self.max_keepalive_connections = int(_float_config(self.config, "max_keepalive_connections", 20)) or None
+        self.keepalive_expiry = _float_config(self.config, "keepalive_expiry_seconds", 30.0)
+        self.timeout = _float_config(self.config, "timeout_seconds", 60.0) or None
+        self._lock = Lock()
+        self._settings: LLMSettings | None = None
+        self._pool: LLMBackendPool | None = None
+        self._clients: dict[tuple[str, float, str, str], ChatOpenAI] = {}
+        self._structured: dict[tuple[Any, ...], Any] = {}
+        self._http_client: Any = None
+        self._http_async_client: Any = None
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+
+    @property
+    def settings(self) -> LLMSettings:
+        settings = self._settings
+        if settings is None:
+            with self._lock:
+                if self._settings is None:
+                    self._settings = _read_llm_settings(override=False)
+                settings = self._settings
+        return settings
+
+    def reload(self) -> LLMSettings:
+        """重新读取 .env（覆盖已加载的值）并清空客户端缓存；旧的共享连接池在锁外关闭。"""
+        settings = _read_llm_settings(override=True)
+        pool = _build_backend_pool(self.config, settings)
+        with self._lock:
+            self._settings = settings
+            self._pool = pool
+            self._clients.clear()
+            self._structured.clear()
+            old_clients = (self._http_client, self._http_async_client)
+            self._http_client = None
+            self._http_async_client = None
+            self._reloads += 1
+        _close_http_clients(*old_clients)
+        return settings
+
+    @property
+    def backend_pool(self) -> LLMBackendPool:
+        pool = self._pool
+        if pool is None:
+            settings = self.settings
+            with self._lock:
+                if self._pool is None:
+                    self._pool = _build_backend_pool(self.config, settings)
+                pool = self._pool
+        return pool
+
+    def route(self, model: str | None = None, *, exclude: tuple[str, ...] = ()) -> LLMRoute:
+        """为一次调用选择后端；后端池为空（未配置 backends 且缺少 LLM_API_KEY）时抛 ValueError。"""
+        pool = self.backend_pool
+        if not len(pool):
+            raise ValueError("缺少 LLM_API_KEY，请在 .env 中配置")
+        return pool.route(str(model or self.settings.model or DEFAULT_LLM_MODEL), exclude=exclude)
+
+    def on_llm_call(self, event: str, backend: str, outcome: str, elapsed: float) -> None:
+        pool = self._pool
+        if pool is not None:
+            pool.on_llm_call(event, backend, outcome, elapsed)
+
+    def _http_kwargs(self) -> dict[str, Any]:
+        """调用方已持有 self._lock。"""
+        if httpx is None:
+            return {}
+        if self._http_client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            self._http_client = httpx.Client(limits=limits, timeout=self.timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+        return {"http_client": self._http_client, "http_async_client": self._http_async_client}
+
+    def chat_model(
+        self,
+        *,
+        model: str | None = None,
+        temperature: float = 0.0,
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ) -> ChatOpenAI:
+        """返回缓存的 ChatOpenAI；base_url / api_key 缺省取环境变量，缺少 LLM_API_KEY 时抛 ValueError。"""
+        settings = self.settings
+        resolved_key = api_key or settings.api_key
+        if not resolved_key:
+            raise ValueError("缺少 LLM_API_KEY，请在 .env 中配置")
+        resolved_base_url = base_url if base_url is not None else settings.base_url
+        key = (str(model or settings.model or DEFAULT_LLM_MODEL), float(temperature), str(resolved_base_url or ""), resolved_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._hits += 1
+                return client
+            llm_kwargs: dict[str, Any] = {
+                "model_name": key[0],
+                "temperature": key[1],
+                "openai_api_key": resolved_key,
+                **self._http_kwargs(),
+            }
+            if resolved_base_url:
+                llm_kwargs["openai_api_base"] = resolved_base_url
+            client = ChatOpenAI(**llm_kwargs)
+            self._clients[key] = client
+            self._misses += 1
+            return client
+
+    def structured_model(
+        self,
+        schema: Any,
+        *,
+        include_raw: bool = False,
+        model: str | None = None,
+        temperature: float = 0.0,
+        base_url: str | None = None,
+        api_key: str | None = None,
+    ) -> Any:
+        """缓存的 chat_model(...).with_structured_output(schema, ...)；不支持 include_raw 的版本照常抛 TypeError。"""
+        client = self.chat_model(model=model, temperature=temperature, base_url=base_url, api_key=api_key)
+        key = (id(client), schema, include_raw)
+        with self._lock:
+            runnable = self._structured.get(key)
+        if runnable is not None:
+            return runnable
+        if include_raw:
+            runnable = client.with_structured_output(schema, include_raw=True)
+        else:
+            runnable = client.with_structured_output(schema)
+        with self._lock:
+            return self._structured.setdefault(key, runnable)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "clients": [
+                    f"{model}@{base_url or '(default)'}#{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]} t={temperature}"
+                    for model, temperature, base_url, api_key in self._clients
+                ],
+                "structured": len(self._structured),
+                "hits": self._hits,
+                "misses": self._misses,
+                "reloads": self._reloads,
+                "shared_http_pool": self._http_client is not None,
+                "backends": self._pool.stats() if self._pool is not None else {},
+            }
+
+
+_LLM_GATEWAY = LLMGateway(LLM_GATEWAY_CONFIG)
+add_llm_call_listener(_LLM_GATEWAY.on_llm_call)
+
+
+def get_llm_gateway() -> LLMGateway:
+    return _LLM_GATEWAY
+
+
+def get_llm_settings() -> LLMSettings:
+    return _LLM_GATEWAY.settings
+
+
+def reload_llm_settings() -> LLMSettings:
+    return _LLM_GATEWAY.reload()
+
+
+def route_llm(model: str | None = None, *, exclude: tuple[str, ...] = ()) -> LLMRoute:
+    """工作流取 LLM 的入口：选出后端后用 route.structured_model / budget_kwargs / guard_kwargs 组装调用。"""
+    return _LLM_GATEWAY.route(model, exclude=exclude)
+
+
+def get_chat_model(
+    *,
+    model: str | None = None,
+    temperature: float = 0.0,
+    base_url: str | None = None,
+    api_key: str | None = None,
+) -> ChatOpenAI:
+    return _LLM_GATEWAY.chat_model(model=model, temperature=temperature, base_url=base_url, api_key=api_key)
+
+
+def get_structured_chat_model(
+    schema: Any,
+    *,
+    include_raw: bool = False,
+    model: str | None = None,
+    temperature: float = 0.0,
+    base_url: str | None = None,
+    api_key: str | None = None,
+) -> Any:
+    return _LLM_GATEWAY.structured_model(
+        schema,
+        include_raw=include_raw,
+        model=model,
+        temperature=temperature,
+        base_url=base_url,
+        api_key=api_key,
+    )
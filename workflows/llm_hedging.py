@@ -0,0 +1,318 @@
+"""LLM 对冲请求：交互式工作流的调用超过延迟分位阈值仍未返回时，再发一份到同一或备用模型 / 端点，取先返回者并取消另一个。"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Any
+import asyncio
+import math
+import os
+
+from .agent_config_loader import load_current_agent_config
+from .agent_observe import observe_agent_event
+from .llm_circuit_breaker import llm_call_guard
+from .llm_gateway import LLMRoute, get_llm_settings, route_llm
+from .llm_rate_limiter import aacquire_llm_budget
+
+
+LLM_HEDGING_CONFIG = load_current_agent_config(__file__)
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class LLMHedge:
+    """一次调用的对冲目标：备用客户端及其限流 / 熔断参数；key 为延迟统计与对冲预算的分组（agent_name:model）。"""
+
+    key: str
+    llm: Any
+    guard_kwargs: dict[str, Any]
+    budget_kwargs: dict[str, Any]
+    target: str
+    agent_name: str
+    run_id: str = ""
+
+
+class HedgeBudget:
+    """
+    对冲预算（调用方负责加锁）：每次主调用积累 max_hedge_ratio 个令牌，上限 burst，每次对冲消耗 1 个。
+    长期来看对冲次数不超过主调用次数 * max_hedge_ratio，突发故障时也最多连续对冲 burst 次。
+    """
+
+    def __init__(self, *, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+
+    def deposit(self) -> None:
+        self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class LLMHedgingPolicy:
+    """
+    按 key 维护最近 window_size 次主调用的耗时，对冲阈值取其 delay_percentile 分位（限制在 [min, max] 之间），
+    样本不足 min_samples 时用 initial_delay_seconds。被对冲取消的主调用按已等待时长计入（真实耗时只会更长）。
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.enabled = bool(self.config.get("enabled", False))
+        agents = self.config.get("agents")
+        self.agents: dict[str, Any] = agents if isinstance(agents, dict) else {}
+        self.delay_percentile = min(_float_config(self.config, "delay_percentile", 95.0), 100.0)
+        self.window_size = max(int(_float_config(self.config, "window_size", 200)), 1)
+        self.min_samples = int(_float_config(self.config, "min_samples", 20))
+        self.initial_delay = _float_config(self.config, "initial_delay_seconds", 8.0)
+        self.min_delay = _float_config(self.config, "min_delay_seconds", 1.0)
+        self.max_delay = max(_float_config(self.config, "max_delay_seconds", 30.0), self.min_delay)
+        self.max_hedge_ratio = _float_config(self.config, "max_hedge_ratio", 0.1)
+        self.hedge_burst = _float_config(self.config, "hedge_burst", 3.0)
+        self._lock = Lock()
+        self._latencies: dict[str, deque[float]] = {}
+        self._budgets: dict[str, HedgeBudget] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+
+    def agent_config(self, agent_name: str) -> dict[str, Any] | None:
+        """该工作流未开启对冲时返回 None。"""
+        if not self.enabled:
+            return None
+        agent_config = self.agents.get(agent_name)
+        if not isinstance(agent_config, dict) or not bool(agent_config.get("enabled", False)):
+            return None
+        return agent_config
+
+    def _counter(self, key: str) -> dict[str, int]:
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
+            self._counters[key] = counter
+        return counter
+
+    def begin(self, key: str) -> float:
+        """登记一次主调用，返回本次的对冲延迟（秒）。"""
+        with self._lock:
+            self._counter(key)["calls"] += 1
+            budget = self._budgets.get(key)
+            if budget is None:
+                budget = HedgeBudget(ratio=self.max_hedge_ratio, burst=self.hedge_burst)
+                self._budgets[key] = budget
+            budget.deposit()
+            samples = self._latencies.get(key)
+            if samples is None or len(samples) < max(self.min_samples, 1):
+                delay = self.initial_delay
+            else:
+                ordered = sorted(samples)
+                index = min(max(math.ceil(len(ordered) * self.delay_percentile / 100.0) - 1, 0), len(ordered) - 1)
+                delay = ordered[index]
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def observe_latency(self, key: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = deque(maxlen=self.window_size)
+                self._latencies[key] = samples
+            samples.append(seconds)
+
+    def try_hedge(self, key: str) -> bool:
+        with self._lock:
+            counter = self._counter(key)
+            budget = self._budgets.get(key)
+            if budget is None or not budget.withdraw():
+                counter["budget_denied"] += 1
+                return False
+            counter["hedged"] += 1
+            return True
+
+    def record_winner(self, key: str, *, hedge_won: bool) -> None:
+        if hedge_won:
+            with self._lock:
+                self._counter(key)["hedge_wins"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                key: {
+                    **counter,
+                    "hedge_rate": round(counter["hedged"] / counter["calls"], 3) if counter["calls"] else 0.0,
+                    "budget_tokens": round(self._budgets[key].tokens, 2) if key in self._budgets else 0.0,
+                    "samples": len(self._latencies.get(key, ())),
+                }
+                for key, counter in self._counters.items()
+            }
+
+
+_LLM_HEDGING_POLICY = LLMHedgingPolicy(LLM_HEDGING_CONFIG)
+
+
+def get_llm_hedging_policy() -> LLMHedgingPolicy:
+    return _LLM_HEDGING_POLICY
+
+
+def llm_hedge_for(
+    *,
+    agent_name: str,
+    schema: Any,
+    model: str,
+    temperature: float,
+    include_raw: bool = False,
+    run_id: str = "",
+    route: LLMRoute | None = None,
+) -> LLMHedge | None:
+    """
+    该工作流开启了对冲时返回对冲目标，否则返回 None。
+    - 配置了 hedge_base_url（agents.<name> 优先，其次全局）：对冲发往该端点，API Key 取 hedge_api_key_env 指向的环境变量，留空沿用 LLM_API_KEY
+    - 否则经 LLM 网关后端池选择，优先避开主调用所在的后端（route.backend）；只有一个后端时与主调用相同
+    hedge_model 留空时与主调用使用同一模型。
+    """
+    policy = get_llm_hedging_policy()
+    agent_config = policy.agent_config(agent_name)
+    if agent_config is None:
+        return None
+
+    def pick(name: str) -> str:
+        return str(agent_config.get(name) or policy.config.get(name) or "").strip()
+
+    hedge_model = pick("hedge_model") or model
+    hedge_base_url = pick("hedge_base_url")
+    if hedge_base_url:
+        api_key_env = pick("hedge_api_key_env")
+        hedge_route = LLMRoute(
+            backend="",
+            base_url=hedge_base_url,
+            api_key=(os.getenv(api_key_env) if api_key_env else "") or get_llm_settings().api_key,
+            model=hedge_model,
+            requested_model=hedge_model,
+        )
+    else:
+        hedge_route = route_llm(hedge_model, exclude=(route.backend,) if route is not None else ())
+    return LLMHedge(
+        key=f"{agent_name}:{model}",
+        llm=hedge_route.structured_model(schema, include_raw=include_raw, temperature=temperature),
+        guard_kwargs=hedge_route.guard_kwargs(agent_name, run_id=run_id),
+        budget_kwargs=hedge_route.budget_kwargs(agent_name, run_id=run_id),
+        target=f"{hedge_route.model}@{hedge_route.base_url or '(default)'}#{hedge_route.backend or '(default)'}",
+        agent_name=agent_name,
+        run_id=run_id,
+    )
+
+
+async def _aguarded_invoke(
+    llm: Any,
+    messages: list[Any],
+    *,
+    guard_kwargs: dict[str, Any],
+    budget_kwargs: dict[str, Any],
+    sent: asyncio.Event | None = None,
+) -> Any:
+    """sent 非空时在取得限流预算、请求真正发出时置位（对冲计时从这里开始）。"""
+    with llm_call_guard(**guard_kwargs) as guard:
+        await aacquire_llm_budget(messages, **budget_kwargs)
+        guard.mark_sent()
+        if sent is not None:
+            sent.set()
+        return await llm.ainvoke(messages)
+
+
+async def ahedged_invoke(
+    llm: Any,
+    messages: list[Any],
+    *,
+    guard_kwargs: dict[str, Any],
+    budget_kwargs: dict[str, Any],
+    hedge: LLMHedge | None = None,
+) -> Any:
+    """
+    异步节点的 LLM 调用入口（熔断 + 限流 + ainvoke）；hedge 为 None 时与直接调用完全相同。
+    - 主调用发出后超过对冲延迟仍未返回、且对冲预算充足时，发出对冲调用；两者先成功者胜出，另一个立即取消
+    - 对冲计时与延迟样本都从主调用取得限流预算、真正发出时开始：在本地限流排队的时间不触发对冲，
+      也不计入分位统计（限流时再发对冲只会从同一个桶里多取预算）
+    - 主调用在延迟内失败直接抛出（对冲只处理慢调用，失败重试交给 AgentRetryPolicy）
+    - 两者都失败时抛出主调用的异常；被取消的一方按 llm_call_guard 的规则不计入熔断失败
+    """
+    if hedge is None:
+        return await _aguarded_invoke(llm, messages, guard_kwargs=guard_kwargs, budget_kwargs=budget_kwargs)
+
+    policy = get_llm_hedging_policy()
+    delay = policy.begin(hedge.key)
+    sent = asyncio.Event()
+    primary = asyncio.create_task(
+        _aguarded_invoke(llm, messages, guard_kwargs=guard_kwargs, budget_kwargs=budget_kwargs, sent=sent)
+    )
+    sent_waiter = asyncio.create_task(sent.wait())
+    backup: asyncio.Task | None = None
+    try:
+        # 先等主调用发出（熔断打开、取预算时失败等情况下主调用会先结束）
+        await asyncio.wait({primary, sent_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if not sent.is_set():
+            return await primary
+        started = monotonic()
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not policy.try_hedge(hedge.key):
+            if not done:
+                _observe_hedge(hedge, outcome="budget_denied", delay=delay, elapsed=monotonic() - started)
+            result = await primary
+            policy.observe_latency(hedge.key, monotonic() - started)
+            return result
+
+        backup = asyncio.create_task(
+            _aguarded_invoke(hedge.llm, messages, guard_kwargs=hedge.guard_kwargs, budget_kwargs=hedge.budget_kwargs)
+        )
+        pending: set[asyncio.Task] = {primary, backup}
+        winner: asyncio.Task | None = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and winner is None:
+                    winner = task
+        elapsed = monotonic() - started
+        # 主调用被取消时按已等待时长计入分位统计（下限）
+        policy.observe_latency(hedge.key, elapsed)
+        if winner is None:
+            _observe_hedge(hedge, outcome="both_failed", delay=delay, elapsed=elapsed, error=str(primary.exception()))
+            raise primary.exception()
+        hedge_won = winner is backup
+        policy.record_winner(hedge.key, hedge_won=hedge_won)
+        _observe_hedge(hedge, outcome="hedge_won" if hedge_won else "primary_won", delay=delay, elapsed=elapsed)
+        return winner.result()
+    finally:
+        # 输家（以及调用方被取消时的两个调用）立即取消，并等待其退出 llm_call_guard
+        sent_waiter.cancel()
+        losers = [task for task in (primary, backup) if task is not None and not task.done()]
+        for task in losers:
+            task.cancel()
+        if losers:
+            await asyncio.gather(*losers, return_exceptions=True)
+
+
+def _observe_hedge(hedge: LLMHedge, *, outcome: str, delay: float, elapsed: float, error: str = "") -> None:
+    stats = get_llm_hedging_policy().stats().get(hedge.key, {})
+    observe_agent_event(
+        agent_name=hedge.agent_name,
+        task_type=hedge.agent_name.upper(),
+        run_id=hedge.run_id,
+        stage="llm_hedge",
+        latency_ms=elapsed * 1000,
+        error=error,
+        extra={
+            "outcome": outcome,
+            "key": hedge.key,
+            "hedge_target": hedge.target,
+            "hedge_delay_ms": round(delay * 1000, 1),
+            "stats": stats,
+        },
+    )
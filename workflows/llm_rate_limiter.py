@@ -0,0 +1,256 @@
+"""LLM 调用令牌桶限流：按 (base_url, api_key, model) 同时限制 RPM 与估算 TPM。"""
+
+from __future__ import annotations
+
+from threading import Lock
+import asyncio
+from time import monotonic, sleep
+from typing import Any
+import hashlib
+
+from agent_pool import raise_if_agent_job_abandoned
+from .agent_config_loader import load_current_agent_config
+from .agent_observe import observe_agent_event
+
+
+LLM_RATE_LIMIT_CONFIG = load_current_agent_config(__file__)
+
+_MAX_SLEEP_SECONDS = 1.0
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """容量为 capacity、每秒补充 refill_per_second 的令牌桶（调用方负责加锁）。"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = monotonic()
+
+    def refill(self, now: float) -> None:
+        elapsed = max(now - self.updated_at, 0.0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_seconds(self, amount: float) -> float:
+        if self.tokens >= amount:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return _MAX_SLEEP_SECONDS
+        return (amount - self.tokens) / self.refill_per_second
+
+
+class LLMRateLimiter:
+    """
+    每个 (base_url, api_key, model) 一组 RPM/TPM 令牌桶：
+    - 限额按 model 读取 `models.<model>.rpm/tpm`，缺省使用 default_rpm/default_tpm（0 表示不限制）
+    - acquire 在预算不足时阻塞等待（工作流运行在 Agent 池线程内），不抛限流错误
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.enabled = bool(self.config.get("enabled", True))
+        self._lock = Lock()
+        self._buckets: dict[tuple[str, str, str], dict[str, TokenBucket | None]] = {}
+        self._waited_seconds: dict[tuple[str, str, str], float] = {}
+
+    def _limits_for(self, model: str) -> tuple[float, float]:
+        models = self.config.get("models")
+        model_config = models.get(model) if isinstance(models, dict) else None
+        if not isinstance(model_config, dict):
+            model_config = {}
+        default_rpm = _float_config(self.config, "default_rpm", 0.0)
+        default_tpm = _float_config(self.config, "default_tpm", 0.0)
+        return (
+            _float_config(model_config, "rpm", default_rpm),
+            _float_config(model_config, "tpm", default_tpm),
+        )
+
+    def _get_buckets(self, key: tuple[str, str, str]) -> dict[str, TokenBucket | None]:
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            rpm, tpm = self._limits_for(key[2])
+            buckets = {
+                "rpm": TokenBucket(rpm, rpm / 60.0) if rpm > 0 else None,
+                "tpm": TokenBucket(tpm, tpm / 60.0) if tpm > 0 else None,
+            }
+            self._buckets[key] = buckets
+        return buckets
+
+    def _try_take(self, key: tuple[str, str, str], tokens: float) -> float:
+        with self._lock:
+            buckets = self._get_buckets(key)
+            now = monotonic()
+            wait = 0.0
+            for name, amount in (("rpm", 1.0), ("tpm", tokens)):
+                bucket = buckets[name]
+                if bucket is None:
+                    continue
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_seconds(min(amount, bucket.capacity)))
+            if wait > 0:
+                return wait
+            for name, amount in (("rpm", 1.0), ("tpm", tokens)):
+                bucket = buckets[name]
+                if bucket is not None:
+                    bucket.tokens -= min(amount, bucket.capacity)
+            return 0.0
+
+    def acquire(self, key: tuple[str, str, str], tokens: float) -> float:
+        """阻塞直到 RPM 与 TPM 预算都足够，返回等待秒数。"""
+        if not self.enabled:
+            return 0.0
+        started = monotonic()
+        while True:
+            wait = self._try_take(key, tokens)
+            if wait <= 0:
+                break
+            raise_if_agent_job_abandoned("llm_rate_limit")
+            sleep(min(wait, _MAX_SLEEP_SECONDS))
+        waited = monotonic() - started
+        if waited > 0:
+            with self._lock:
+                self._waited_seconds[key] = self._waited_seconds.get(key, 0.0) + waited
+        return waited
+
+    async def aacquire(self, key: tuple[str, str, str], tokens: float) -> float:
+        """acquire 的协程版本：等待期间让出事件循环，供原生异步工作流使用。"""
+        if not self.enabled:
+            return 0.0
+        started = monotonic()
+        while True:
+            wait = self._try_take(key, tokens)
+            if wait <= 0:
+                break
+            raise_if_agent_job_abandoned("llm_rate_limit")
+            await asyncio.sleep(min(wait, _MAX_SLEEP_SECONDS))
+        waited = monotonic() - started
+        if waited > 0:
+            with self._lock:
+                self._waited_seconds[key] = self._waited_seconds.get(key, 0.0) + waited
+        return waited
+
+    def usage(self, key: tuple[str, str, str]) -> dict[str, Any]:
+        with self._lock:
+            buckets = self._get_buckets(key)
+            now = monotonic()
+            usage: dict[str, Any] = {"waited_seconds_total": round(self._waited_seconds.get(key, 0.0), 3)}
+            for name, bucket in buckets.items():
+                if bucket is None:
+                    usage[name] = None
+                    continue
+                bucket.refill(now)
+                usage[name] = {
+                    "limit": bucket.capacity,
+                    "available": round(bucket.tokens, 1),
+                    "used_ratio": round(1 - bucket.tokens / bucket.capacity, 3) if bucket.capacity else 0.0,
+                }
+            return usage
+
+    def stats(self) -> dict[str, Any]:
+        return {f"{model}@{base_url}#{key_id}": self.usage((base_url, key_id, model)) for base_url, key_id, model in list(self._buckets)}
+
+
+_LLM_RATE_LIMITER = LLMRateLimiter(LLM_RATE_LIMIT_CONFIG)
+
+
+def get_llm_rate_limiter() -> LLMRateLimiter:
+    return _LLM_RATE_LIMITER
+
+
+def build_rate_limit_key(*, base_url: str | None, api_key: str | None, model: str) -> tuple[str, str, str]:
+    """限流键：api_key 只保留摘要，避免出现在日志里。"""
+    key_id = hashlib.sha256(str(api_key or "").encode("utf-8")).hexdigest()[:8]
+    return str(base_url or ""), key_id, str(model)
+
+
+def estimate_message_tokens(messages: list[Any], *, completion_tokens: int | None = None) -> int:
+    """粗略估算一次调用的 token 数：CJK 字符按 1 token、其余字符按 4 字符 1 token，再加预留的输出 token。"""
+    cjk_chars = 0
+    other_chars = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        text = content if isinstance(content, str) else str(content)
+        for char in text:
+            if "一" <= char <= "鿿":
+                cjk_chars += 1
+            else:
+                other_chars += 1
+    if completion_tokens is None:
+        completion_tokens = int(_float_config(LLM_RATE_LIMIT_CONFIG, "completion_tokens_estimate", 512))
+    return cjk_chars + other_chars // 4 + max(completion_tokens, 0)
+
+
+def acquire_llm_budget(
+    messages: list[Any],
+    *,
+    base_url: str | None,
+    api_key: str | None,
+    model: str,
+    agent_name: str,
+    task_type: str = "",
+    run_id: str = "",
+) -> float:
+    """在 LLM 调用前申请 RPM/TPM 预算（不足时等待），并把当前预算占用写入观测日志。"""
+    limiter = get_llm_rate_limiter()
+    if not limiter.enabled:
+        return 0.0
+    key = build_rate_limit_key(base_url=base_url, api_key=api_key, model=model)
+    estimated_tokens = estimate_message_tokens(messages)
+    waited = limiter.acquire(key, estimated_tokens)
+    _observe_budget(limiter, key, estimated_tokens, waited, agent_name=agent_name, task_type=task_type, run_id=run_id)
+    return waited
+
+
+async def aacquire_llm_budget(
+    messages: list[Any],
+    *,
+    base_url: str | None,
+    api_key: str | None,
+    model: str,
+    agent_name: str,
+    task_type: str = "",
+    run_id: str = "",
+) -> float:
+    """acquire_llm_budget 的协程版本（预算不足时 asyncio.sleep 等待）。"""
+    limiter = get_llm_rate_limiter()
+    if not limiter.enabled:
+        return 0.0
+    key = build_rate_limit_key(base_url=base_url, api_key=api_key, model=model)
+    estimated_tokens = estimate_message_tokens(messages)
+    waited = await limiter.aacquire(key, estimated_tokens)
+    _observe_budget(limiter, key, estimated_tokens, waited, agent_name=agent_name, task_type=task_type, run_id=run_id)
+    return waited
+
+
+def _observe_budget(
+    limiter: LLMRateLimiter,
+    key: tuple[str, str, str],
+    estimated_tokens: int,
+    waited: float,
+    *,
+    agent_name: str,
+    task_type: str,
+    run_id: str,
+) -> None:
+    observe_agent_event(
+        agent_name=agent_name,
+        task_type=task_type or agent_name.upper(),
+        run_id=run_id,
+        stage="llm_rate_limit",
+        latency_ms=waited * 1000,
+        extra={
+            "model": key[2],
+            "base_url": key[0],
+            "api_key_id": key[1],
+            "estimated_tokens": estimated_tokens,
+            "budget": limiter.usage(key),
+        },
+    )
@@ -0,0 +1,403 @@
+"""LLM 响应缓存：按 (model, temperature, 消息内容, schema) 的哈希缓存结构化输出，内存 LRU + SQLite 磁盘层，带 TTL。"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter, time
+from typing import Any
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+
+from .agent_config_loader import load_current_agent_config
+from .agent_observe import observe_agent_event
+from .llm_rate_limiter import estimate_message_tokens
+
+
+LLM_RESPONSE_CACHE_CONFIG = load_current_agent_config(__file__)
+
+# 每写入多少次磁盘缓存做一次过期 / 超量清理
+_EVICT_EVERY_PUTS = 64
+
+
+def _float_config(config: dict[str, Any], name: str, default: float) -> float:
+    try:
+        return max(float(config.get(name, default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+@lru_cache(maxsize=None)
+def _schema_fingerprint(schema: Any) -> str:
+    """schema 字段变化后旧缓存自动失效：pydantic 模型取 JSON Schema，其它类型取限定名。"""
+    name = f"{getattr(schema, '__module__', '')}.{getattr(schema, '__qualname__', repr(schema))}"
+    model_json_schema = getattr(schema, "model_json_schema", None)
+    if callable(model_json_schema):
+        return name + json.dumps(model_json_schema(), ensure_ascii=False, sort_keys=True)
+    return name
+
+
+def _message_parts(messages: list[Any]) -> list[list[str]]:
+    parts: list[list[str]] = []
+    for message in messages:
+        content = getattr(message, "content", message)
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, default=str)
+        parts.append([str(getattr(message, "type", "")), content])
+    return parts
+
+
+@dataclass(frozen=True)
+class LLMCacheScope:
+    """一次调用的缓存范围；只有在 llm_response_cache_config 中开启了该工作流时才会创建。"""
+
+    agent_name: str
+    model: str
+    temperature: float
+    schema: Any
+    ttl_seconds: float
+    include_raw: bool = False
+    run_id: str = ""
+
+    def key(self, messages: list[Any]) -> str:
+        # include_raw 只影响返回形态（缓存里只存 parsed），不进入键，两种调用方式共享缓存
+        payload = json.dumps(
+            [self.model, round(float(self.temperature), 4), _schema_fingerprint(self.schema), _message_parts(messages)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseStore:
+    """
+    磁盘层（SQLite WAL），结构同 agent_job_store：
+    - payload 为结构化结果的 JSON，expires_at 到期后视为未命中并在清理时删除
+    - 总大小超过 max_bytes 时按 last_used_at 从旧到新删除
+    """
+
+    def __init__(self, path: str, *, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT PRIMARY KEY,
+                agent_name TEXT NOT NULL,
+                model TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self.evict()
+
+    def get(self, cache_key: str) -> tuple[str, float] | None:
+        """返回 (payload, expires_at)；已过期返回 None。"""
+        now = time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM llm_responses WHERE cache_key = ?",
+                (cache_key,),
+            ).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_used_at = ? WHERE cache_key = ?", (now, cache_key))
+        return row[0], row[1]
+
+    def put(self, cache_key: str, payload: str, *, agent_name: str, model: str, expires_at: float) -> None:
+        now = time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses "
+                "(cache_key, agent_name, model, payload, size_bytes, created_at, expires_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, agent_name, model, payload, len(payload.encode("utf-8")), now, expires_at, now),
+            )
+            self._puts += 1
+            due = self._puts % _EVICT_EVERY_PUTS == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期记录，再把总大小压回 max_bytes 以内；返回删除条数。"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (time(),)).rowcount
+            if self.max_bytes <= 0:
+                return removed
+            total = int(self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()[0])
+            if total <= self.max_bytes:
+                return removed
+            victims: list[tuple[str]] = []
+            for cache_key, size_bytes in self._conn.execute(
+                "SELECT cache_key, size_bytes FROM llm_responses ORDER BY last_used_at"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                victims.append((cache_key,))
+                total -= int(size_bytes)
+            self._conn.executemany("DELETE FROM llm_responses WHERE cache_key = ?", victims)
+            return removed + len(victims)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_responses").fetchone()
+        return {"path": self.path, "entries": int(count), "bytes": int(total), "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """
+    - 只缓存结构化输出（pydantic 模型）的成功结果；解析失败、原始文本兜底的结果不缓存
+    - 内存层 OrderedDict LRU（max_memory_entries），未命中再查磁盘层，磁盘命中回填内存
+    - 按工作流开启：agents.<agent_name>.enabled，TTL 取 agents.<agent_name>.ttl_seconds，缺省用 ttl_seconds
+    - 命中 / 未命中与节省的 token 估算写入 agent_events.jsonl（stage=llm_cache）
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config = config if isinstance(config, dict) else {}
+        self.enabled = bool(self.config.get("enabled", False))
+        self.ttl_seconds = _float_config(self.config, "ttl_seconds", 86400.0)
+        self.max_memory_entries = int(_float_config(self.config, "max_memory_entries", 1024))
+        self.path = str(self.config.get("path") or "")
+        self.max_disk_bytes = int(_float_config(self.config, "max_disk_mb", 64.0) * 1024 * 1024)
+        agents = self.config.get("agents")
+        self.agents: dict[str, Any] = agents if isinstance(agents, dict) else {}
+        self._lock = Lock()
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._store: LLMResponseStore | None = None
+        self._store_failed = False
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._saved_tokens = 0
+
+    def agent_ttl(self, agent_name: str) -> float | None:
+        """该工作流未开启缓存时返回 None。"""
+        if not self.enabled:
+            return None
+        agent_config = self.agents.get(agent_name)
+        if not isinstance(agent_config, dict) or not bool(agent_config.get("enabled", False)):
+            return None
+        return _float_config(agent_config, "ttl_seconds", self.ttl_seconds)
+
+    def _disk(self) -> LLMResponseStore | None:
+        if self._store is None and self.path and not self._store_failed:
+            with self._lock:
+                if self._store is None and not self._store_failed:
+                    try:
+                        self._store = LLMResponseStore(self.path, max_bytes=self.max_disk_bytes)
+                    except (OSError, sqlite3.Error) as error:
+                        # 磁盘层不可用时只用内存层，不影响 LLM 调用
+                        self._store_failed = True
+                        print(f"[LLM-CACHE] 磁盘缓存不可用，仅使用内存缓存: {error}")
+        return self._store
+
+    def _remember(self, cache_key: str, payload: str, expires_at: float) -> None:
+        """调用方已持有 self._lock。"""
+        self._memory[cache_key] = (payload, expires_at)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, cache_key: str) -> tuple[str, str] | None:
+        """返回 (payload, 命中层 memory/disk)。"""
+        now = time()
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(cache_key)
+                    return entry[0], "memory"
+                del self._memory[cache_key]
+        store = self._disk()
+        if store is None:
+            return None
+        try:
+            row = store.get(cache_key)
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        with self._lock:
+            self._remember(cache_key, row[0], row[1])
+        return row[0], "disk"
+
+    def put(self, cache_key: str, payload: str, *, agent_name: str, model: str, ttl_seconds: float) -> None:
+        expires_at = time() + ttl_seconds
+        with self._lock:
+            self._remember(cache_key, payload, expires_at)
+        store = self._disk()
+        if store is not None:
+            try:
+                store.put(cache_key, payload, agent_name=agent_name, model=model, expires_at=expires_at)
+            except sqlite3.Error:
+                pass
+
+    def record(self, *, hit: bool, layer: str, saved_tokens: int) -> None:
+        with self._lock:
+            if hit:
+                self._hits += 1
+                self._saved_tokens += saved_tokens
+                if layer == "disk":
+                    self._disk_hits += 1
+            else:
+                self._misses += 1
+
+    def counters(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "saved_tokens": self._saved_tokens,
+                "memory_entries": len(self._memory),
+            }
+
+    def stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = {
+            "enabled": self.enabled,
+            "agents": sorted(name for name in self.agents if self.agent_ttl(name) is not None),
+            **self.counters(),
+        }
+        store = self._store
+        if store is not None:
+            try:
+                stats["disk"] = store.stats()
+            except sqlite3.Error:
+                stats["disk"] = None
+        return stats
+
+
+_LLM_RESPONSE_CACHE = LLMResponseCache(LLM_RESPONSE_CACHE_CONFIG)
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    return _LLM_RESPONSE_CACHE
+
+
+def llm_cache_scope(
+    *,
+    agent_name: str,
+    schema: Any,
+    model: str,
+    temperature: float,
+    include_raw: bool = False,
+    run_id: str = "",
+) -> LLMCacheScope | None:
+    """该工作流开启了缓存时返回缓存范围，否则返回 None（lookup / store 对 None 直接跳过）。"""
+    ttl_seconds = get_llm_response_cache().agent_ttl(agent_name)
+    if ttl_seconds is None or ttl_seconds <= 0:
+        return None
+    return LLMCacheScope(
+        agent_name=agent_name,
+        model=str(model),
+        temperature=float(temperature),
+        schema=schema,
+        ttl_seconds=ttl_seconds,
+        include_raw=include_raw,
+        run_id=run_id,
+    )
+
+
+def lookup_llm_response(scope: LLMCacheScope | None, messages: list[Any]) -> Any | None:
+    """
+    在 llm_call_guard / 限流之前调用：命中时直接返回结构化结果（include_raw 调用返回 {"raw", "parsed", "parsing_error"}），
+    不占 RPM/TPM 预算，也不计入熔断统计。
+    """
+    if scope is None:
+        return None
+    cache = get_llm_response_cache()
+    started = perf_counter()
+    cache_key = scope.key(messages)
+    entry = cache.get(cache_key)
+    result: Any = None
+    if entry is not None:
+        try:
+            result = scope.schema.model_validate_json(entry[0])
+        except Exception:
+            # schema 定义不兼容的旧记录按未命中处理，随后会被新结果覆盖
+            result = None
+    layer = entry[1] if result is not None else ""
+    saved_tokens = estimate_message_tokens(messages) if result is not None else 0
+    cache.record(hit=result is not None, layer=layer, saved_tokens=saved_tokens)
+    observe_agent_event(
+        agent_name=scope.agent_name,
+        task_type=scope.agent_name.upper(),
+        run_id=scope.run_id,
+        stage="llm_cache",
+        latency_ms=(perf_counter() - started) * 1000,
+        extra={
+            "result": "hit" if result is not None else "miss",
+            "layer": layer,
+            "cache_key": cache_key[:16],
+            "model": scope.model,
+            "schema": getattr(scope.schema, "__name__", str(scope.schema)),
+            "saved_tokens": saved_tokens,
+            "stats": cache.counters(),
+        },
+    )
+    if result is None:
+        return None
+    if scope.include_raw:
+        return {"raw": None, "parsed": result, "parsing_error": None}
+    return result
+
+
+def store_llm_response(scope: LLMCacheScope | None, messages: list[Any], result: Any) -> None:
+    """LLM 调用成功后写入缓存；include_raw 结果只取 parsed，非 schema 实例（解析失败）不缓存。"""
+    if scope is None:
+        return
+    if scope.include_raw and isinstance(result, dict):
+        result = result.get("parsed")
+    if not isinstance(scope.schema, type) or not isinstance(result, scope.schema):
+        return
+    try:
+        payload = result.model_dump_json()
+    except Exception:
+        return
+    get_llm_response_cache().put(
+        scope.key(messages),
+        payload,
+        agent_name=scope.agent_name,
+        model=scope.model,
+        ttl_seconds=scope.ttl_seconds,
+    )
+
+
+async def alookup_llm_response(scope: LLMCacheScope | None, messages: list[Any]) -> Any | None:
+    """lookup_llm_response 的异步版本：开启磁盘层时查询放到线程中执行，SQLite I/O 不阻塞事件循环。"""
+    if scope is None:
+        return None
+    if not get_llm_response_cache().path:
+        return lookup_llm_response(scope, messages)
+    return await asyncio.to_thread(lookup_llm_response, scope, messages)
+
+
+async def astore_llm_response(scope: LLMCacheScope | None, messages: list[Any], result: Any) -> None:
+    """store_llm_response 的异步版本：开启磁盘层时写入放到线程中执行。"""
+    if scope is None:
+        return
+    if not get_llm_response_cache().path:
+        store_llm_response(scope, messages, result)
+        return
+    await asyncio.to_thread(store_llm_response, scope, messages, result)
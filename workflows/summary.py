@@ -20,7 +20,7 @@ raw_message
     -> _collect_normalized_lines
   -> prepare_summary_payload
     -> SummaryWorkflowPayload
-  -> run_summary_graph
+  -> arun_summary_graph
     -> map_node (LLM with structured output)
     -> finalize_node (组装最终结果)
 """
@@ -30,33 +30,39 @@ from __future__ import annotations
 import asyncio
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from functools import lru_cache
 from time import perf_counter
 from typing import Any, TypedDict
 import json
-import os
 import re
 
 from ncatbot.core import GroupMessage, PrivateMessage
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, START, StateGraph
 from pydantic import BaseModel, Field
 
-from agent_pool import submit_agent_job
+from agent_pool import (
+    forget_durable_job,
+    persist_durable_job,
+    raise_if_agent_job_abandoned,
+    register_durable_job,
+    submit_agent_job,
+    submit_agent_jobs,
+    trace_agent_node,
+)
 from bot import QQnumber, bot
 from .agent_observe import bind_agent_event, generate_run_id
 from .agent_config_loader import load_current_agent_config
-
-try:
-    from dotenv import load_dotenv
-except Exception:  # pragma: no cover
-    load_dotenv = None
+from .llm_cascade import llm_tier_model, observe_llm_tier
+from .llm_gateway import LLMCallSpec, LLMRoute, get_llm_settings, llm_call_from_config, route_llm
+from .llm_circuit_breaker import LLMCallGuard, llm_call_guard
+from .llm_rate_limiter import aacquire_llm_budget
+from .llm_response_cache import LLMCacheScope, alookup_llm_response, astore_llm_response, llm_cache_scope
+from .summary_chunking import UNKNOWN_GROUP, UNKNOWN_USER, build_summary_chunks_from_log_lines, normalize_chat_type
 
 
-UNKNOWN_GROUP = "unknown_group"
-UNKNOWN_USER = "unknown_user"
 UNKNOWN_CHAT = "group"
-SUMMARY_CURSOR_PATH = "data/summary_cursor.json"
 LOG_FILE_PATH = "message.jsonl"
 _FILE_LOCK = asyncio.Lock()
 
@@ -82,6 +88,10 @@ except (TypeError, ValueError):
 DEFAULT_SUMMARY_GLOBAL_OVERVIEW = bool(SUMMARY_AGENT_CONFIG.get("summary_global_overview", False))
 DEFAULT_SUMMARY_SEND_MODE = str(SUMMARY_AGENT_CONFIG.get("summary_send_mode") or "single_message").strip().lower()
 DEFAULT_SUMMARY_GROUP_REDUCE_ENABLED = bool(SUMMARY_AGENT_CONFIG.get("summary_group_reduce_enabled", True))
+try:
+    DEFAULT_SUMMARY_GROUP_CONCURRENCY = max(int(SUMMARY_AGENT_CONFIG.get("summary_group_concurrency", 4)), 0)
+except (TypeError, ValueError):
+    DEFAULT_SUMMARY_GROUP_CONCURRENCY = 4
 
 
 HEADER_RE = re.compile(
@@ -293,220 +303,6 @@ class SummaryGraphState(TypedDict):
     final_result: SummaryFinalResult | None
 
 
-def build_summary_chunks_from_log_lines(
-    lines: list[str],
-    *,
-    chunk_size: int,
-    run_mode: str,
-) -> tuple[list[dict[str, Any]], dict[str, str]]:
-    """从日志原始行构建 summary chunks（解析+筛选+分块）。"""
-    records: list[dict[str, str]] = []
-    for line in lines:
-        group_id, user_id, user_name, ts, message, chat_type = parse_summary_log_line(line)
-        records.append(
-            {
-                "group_id": group_id,
-                "user_id": user_id,
-                "user_name": user_name,
-                "ts": ts,
-                "message": message,
-                "chat_type": chat_type,
-            }
-        )
-
-    filtered_records, meta = filter_records_for_summary(records, run_mode=run_mode)
-    if not filtered_records:
-        return [], meta
-
-    grouped_messages: dict[tuple[str, str, str, str], list[tuple[str, str]]] = {}
-    for record in filtered_records:
-        chat_type = _normalize_chat_type(record.get("chat_type", "group"))
-        group_id = str(record.get("group_id", UNKNOWN_GROUP))
-        user_id = str(record.get("user_id", UNKNOWN_USER))
-        user_name = str(record.get("user_name", UNKNOWN_USER))
-        ts = str(record.get("ts", ""))
-        message = str(record.get("message", "")).strip()
-        if not message:
-            continue
-        key = (chat_type, group_id, user_id, user_name)
-        if key not in grouped_messages:
-            grouped_messages[key] = []
-        grouped_messages[key].append((ts, message))
-
-    grouped_chunks_by_group: dict[tuple[str, str], list[str]] = {}
-    for (chat_type, group_id, user_id, user_name), messages in grouped_messages.items():
-        source_chunks = _split_source_messages(
-            chat_type=chat_type,
-            group_id=group_id,
-            user_id=user_id,
-            user_name=user_name,
-            messages=messages,
-            chunk_size=chunk_size,
-        )
-        group_key = (chat_type, group_id)
-        if group_key not in grouped_chunks_by_group:
-            grouped_chunks_by_group[group_key] = []
-        grouped_chunks_by_group[group_key].extend(source_chunks)
-
-    group_jobs: list[dict[str, Any]] = []
-    merged_chunk_total = 0
-    for chat_type, group_id in sorted(grouped_chunks_by_group.keys()):
-        merged_chunks = _merge_small_chunks(grouped_chunks_by_group[(chat_type, group_id)], chunk_size)
-        if not merged_chunks:
-            continue
-        group_jobs.append(
-            {
-                "chat_type": chat_type,
-                "group_id": group_id,
-                "chunks": merged_chunks,
-            }
-        )
-        merged_chunk_total += len(merged_chunks)
-
-    if meta.get("run_mode") == "manual" and meta.get("cursor_key") and meta.get("cursor_after"):
-        save_summary_cursor(str(meta["cursor_key"]), str(meta["cursor_after"]))
-
-    meta["group_count"] = str(len(group_jobs))
-    meta["group_chunks"] = str(sum(len(chunks) for chunks in grouped_chunks_by_group.values()))
-    meta["final_chunks"] = str(merged_chunk_total)
-    return group_jobs, meta
-
-
-def filter_records_for_summary(
-    records: list[dict[str, str]],
-    *,
-    run_mode: str,
-) -> tuple[list[dict[str, str]], dict[str, str]]:
-    """按 chat scope + cursor 筛选日志记录。"""
-    scope = _normalize_scope(str(SUMMARY_AGENT_CONFIG.get("summary_chat_scope") or "group"))
-    group_filter_mode = _normalize_group_filter_mode(
-        str(SUMMARY_AGENT_CONFIG.get("summary_group_filter_mode") or "all")
-    )
-    configured_group_ids = SUMMARY_AGENT_CONFIG.get("summary_group_ids")
-    group_id_set = {
-        str(item).strip()
-        for item in (configured_group_ids if isinstance(configured_group_ids, list) else [])
-        if str(item).strip()
-    }
-    cursor_key = f"manual_{scope}"
-    cursor_before = ""
-    normalized_run_mode = str(run_mode or "manual").strip().lower()
-    if normalized_run_mode not in {"manual", "auto"}:
-        normalized_run_mode = "manual"
-
-    use_cursor = normalized_run_mode == "manual"
-    today_str = datetime.now().astimezone().strftime("%Y-%m-%d")
-
-    if use_cursor:
-        cursor_before = load_summary_cursor(cursor_key)
-
-    cursor_dt = _parse_iso_dt(cursor_before) if cursor_before else None
-    filtered_records: list[dict[str, str]] = []
-    latest_dt = cursor_dt
-
-    for record in records:
-        chat_type = _normalize_chat_type(record.get("chat_type", "group"))
-        if scope != "all" and chat_type != scope:
-            continue
-
-        group_id = str(record.get("group_id", UNKNOWN_GROUP)).strip() or UNKNOWN_GROUP
-        if chat_type == "group" and group_id_set:
-            if group_filter_mode == "include" and group_id not in group_id_set:
-                continue
-            if group_filter_mode == "exclude" and group_id in group_id_set:
-                continue
-
-        ts = str(record.get("ts", "")).strip()
-        current_dt = _parse_iso_dt(ts)
-        if normalized_run_mode == "auto":
-            if current_dt is None or current_dt.astimezone().strftime("%Y-%m-%d") != today_str:
-                continue
-
-        if use_cursor and cursor_dt is not None:
-            if current_dt is None or current_dt <= cursor_dt:
-                continue
-
-        if current_dt is not None and (latest_dt is None or current_dt > latest_dt):
-            latest_dt = current_dt
-
-        normalized = dict(record)
-        normalized["chat_type"] = chat_type
-        normalized["group_id"] = group_id
-        normalized["message"] = str(record.get("message", "")).strip()
-        filtered_records.append(normalized)
-
-    cursor_after = ""
-    if latest_dt is not None:
-        cursor_after = latest_dt.isoformat(timespec="seconds")
-    elif cursor_before:
-        cursor_after = cursor_before
-
-    return filtered_records, {
-        "run_mode": normalized_run_mode,
-        "scope": scope,
-        "cursor_key": cursor_key,
-        "cursor_before": cursor_before,
-        "cursor_after": cursor_after,
-    }
-
-
-def parse_summary_log_line(line: str) -> tuple[str, str, str, str, str, str]:
-    """解析 summary 日志行，兼容 JSONL 与旧文本格式。"""
-    try:
-        record = json.loads(line)
-        if isinstance(record, dict):
-            return (
-                str(record.get("group_id", UNKNOWN_GROUP)),
-                str(record.get("user_id", UNKNOWN_USER)),
-                str(record.get("user_name", UNKNOWN_USER)),
-                str(record.get("ts", "")),
-                str(record.get("cleaned_message", record.get("raw_message", ""))).strip(),
-                _normalize_chat_type(record.get("chat_type", "group")),
-            )
-    except json.JSONDecodeError:
-        pass
-
-    if ":" not in line:
-        return UNKNOWN_GROUP, UNKNOWN_USER, UNKNOWN_USER, "", line.strip(), "group"
-
-    prefix, message = line.split(":", 1)
-    if "|" in prefix:
-        group_id, user_id = prefix.split("|", 1)
-        normalized_user_id = user_id.strip() or UNKNOWN_USER
-        return group_id.strip() or UNKNOWN_GROUP, normalized_user_id, normalized_user_id, "", message.strip(), "group"
-
-    return prefix.strip() or UNKNOWN_GROUP, UNKNOWN_USER, UNKNOWN_USER, "", message.strip(), "group"
-
-
-def load_summary_cursor(cursor_key: str) -> str:
-    if not os.path.exists(SUMMARY_CURSOR_PATH):
-        return ""
-    try:
-        with open(SUMMARY_CURSOR_PATH, "r", encoding="utf-8") as file:
-            payload = json.load(file)
-    except (OSError, json.JSONDecodeError):
-        return ""
-    if not isinstance(payload, dict):
-        return ""
-    return str(payload.get(cursor_key, "")).strip()
-
-
-def save_summary_cursor(cursor_key: str, ts: str) -> None:
-    os.makedirs(os.path.dirname(SUMMARY_CURSOR_PATH), exist_ok=True)
-    payload: dict[str, Any] = {}
-    if os.path.exists(SUMMARY_CURSOR_PATH):
-        try:
-            with open(SUMMARY_CURSOR_PATH, "r", encoding="utf-8") as file:
-                existing = json.load(file)
-            if isinstance(existing, dict):
-                payload.update(existing)
-        except (OSError, json.JSONDecodeError):
-            payload = {}
-    payload[cursor_key] = ts
-    with open(SUMMARY_CURSOR_PATH, "w", encoding="utf-8") as file:
-        json.dump(payload, file, ensure_ascii=False, indent=2)
-
-
 def preprocess_summary_chunk(
     raw_message: str,
     *,
@@ -568,7 +364,26 @@ def prepare_summary_payload(
     )
 
 
-def run_summary_graph(
+def _summary_initial_state(payload: SummaryWorkflowPayload, chunk_index: int) -> SummaryGraphState:
+    return {
+        "payload": payload,
+        "chunk_index": chunk_index,
+        "llm_calls": 0,
+        "map_result": None,
+        "final_result": None,
+    }
+
+
+def _summary_final_result(result: dict[str, Any], workflow_started_at: float) -> SummaryFinalResult:
+    final_result = result.get("final_result")
+    if not isinstance(final_result, SummaryFinalResult):
+        raise RuntimeError("Summary graph 执行失败：未生成 final_result")
+
+    final_result.elapsed_ms = (perf_counter() - workflow_started_at) * 1000
+    return final_result
+
+
+async def arun_summary_graph(
     raw_message: str,
     *,
     chunk_index: int = 1,
@@ -578,210 +393,292 @@ def run_summary_graph(
     """运行 summary 的 LangGraph 核心流程（当前为最少节点两步）。
 
     节点设计：
-    - map_node: 一次 LLM 调用，输出 SummaryMapResult
+    - map_node: 一次 LLM 调用（ainvoke），输出 SummaryMapResult
     - finalize_node: 无 LLM 调用，组装 SummaryFinalResult
     """
     workflow_started_at = perf_counter()
     payload = prepare_summary_payload(raw_message)
 
-    graph = _build_summary_graph(model_name=model_name, temperature=temperature)
-    result = graph.invoke(
-        {
-            "payload": payload,
-            "chunk_index": chunk_index,
-            "llm_calls": 0,
-            "map_result": None,
-            "final_result": None,
-        }
-    )
+    call = _summary_map_call(model_name=model_name, temperature=temperature)
+    result = await _summary_graph().ainvoke(_summary_initial_state(payload, chunk_index), config=call.as_config())
+    return _summary_final_result(result, workflow_started_at)
 
-    final_result = result.get("final_result")
-    if not isinstance(final_result, SummaryFinalResult):
-        raise RuntimeError("Summary graph 执行失败：未生成 final_result")
-
-    final_result.elapsed_ms = (perf_counter() - workflow_started_at) * 1000
-    return final_result
 
+def _parse_group_job(job: Any) -> tuple[str, str, list[str]] | None:
+    """解析单个群任务，返回 (chat_type, group_id, chunk_texts)；无可总结内容时返回 None。"""
+    if not isinstance(job, dict):
+        return None
 
-def run_grouped_summary_graph(
-    group_jobs: list[dict[str, Any]],
-    *,
-    model_name: str | None = None,
-    temperature: float = DEFAULT_LLM_TEMPERATURE,
-) -> GroupedSummaryResult:
-    """按群执行 summary（每群可含多个 chunk），并聚合为单次输出结果。"""
-    started_at = perf_counter()
-    today_text = datetime.now().strftime("%Y-%m-%d")
-    group_results: list[GroupSummaryResult] = []
-    total_chunks = 0
-    total_messages = 0
-    llm = _build_llm(model_name=model_name, temperature=temperature)
-    structured_chunk_reducer = (
-        llm.with_structured_output(ChunkSummarySchema)
-        if DEFAULT_SUMMARY_GROUP_REDUCE_ENABLED
-        else None
-    )
+    chat_type = normalize_chat_type(job.get("chat_type", "group"))
+    group_id = str(job.get("group_id", UNKNOWN_GROUP)).strip() or UNKNOWN_GROUP
+    raw_chunks = job.get("chunks")
+    chunk_texts = [str(item) for item in raw_chunks] if isinstance(raw_chunks, list) else []
+    chunk_texts = [item for item in chunk_texts if item.strip()]
+    if not chunk_texts:
+        return None
+    return chat_type, group_id, chunk_texts
 
-    for job in group_jobs:
-        if not isinstance(job, dict):
-            continue
 
-        chat_type = _normalize_chat_type(job.get("chat_type", "group"))
-        group_id = str(job.get("group_id", UNKNOWN_GROUP)).strip() or UNKNOWN_GROUP
-        raw_chunks = job.get("chunks")
-        chunk_texts = [str(item) for item in raw_chunks] if isinstance(raw_chunks, list) else []
-        chunk_texts = [item for item in chunk_texts if item.strip()]
-        if not chunk_texts:
-            continue
+@dataclass
+class _GroupChunkMerge:
+    """同一群多个 chunk 的合并结果，供 group reduce 与兜底使用。"""
 
-        chunk_results: list[SummaryFinalResult] = []
-        for chunk_index, chunk_text in enumerate(chunk_texts, start=1):
-            chunk_results.append(
-                run_summary_graph(
-                    chunk_text,
-                    chunk_index=chunk_index,
-                    model_name=model_name,
-                    temperature=temperature,
-                )
+    sources: list[str] = field(default_factory=list)
+    trace_lines: list[str] = field(default_factory=list)
+    map_results: list[SummaryMapResult] = field(default_factory=list)
+    highlights: list[str] = field(default_factory=list)
+    risks: list[str] = field(default_factory=list)
+    todos: list[str] = field(default_factory=list)
+    chunk_summary_lines: list[str] = field(default_factory=list)
+    fallback_overview: str = ""
+
+
+def _merge_chunk_results(chunk_results: list[SummaryFinalResult]) -> _GroupChunkMerge:
+    merged = _GroupChunkMerge()
+    overview_candidates: list[str] = []
+    for idx, chunk_result in enumerate(chunk_results, start=1):
+        merged.sources.extend(chunk_result.sources)
+        merged.trace_lines.extend(chunk_result.trace_lines)
+        merged.map_results.extend(chunk_result.map_results)
+        merged.highlights.extend(chunk_result.highlights)
+        merged.risks.extend(chunk_result.risks)
+        merged.todos.extend(chunk_result.todos)
+        if chunk_result.overview.strip():
+            overview_candidates.append(chunk_result.overview.strip())
+        merged.chunk_summary_lines.append(
+            "\n".join(
+                [
+                    f"chunk#{idx}",
+                    f"overview: {chunk_result.overview or '（无）'}",
+                    "highlights:",
+                    *[f"- {item}" for item in _safe_list(chunk_result.highlights, max_items=10)],
+                    "risks:",
+                    *[f"- {item}" for item in _safe_list(chunk_result.risks, max_items=10)],
+                    "todos:",
+                    *[f"- {item}" for item in _safe_list(chunk_result.todos, max_items=10)],
+                ]
             )
+        )
 
-        merged_sources: list[str] = []
-        merged_trace_lines: list[str] = []
-        merged_map_results: list[SummaryMapResult] = []
-        merged_highlights: list[str] = []
-        merged_risks: list[str] = []
-        merged_todos: list[str] = []
-        overview_candidates: list[str] = []
-        chunk_summary_lines: list[str] = []
-        for idx, chunk_result in enumerate(chunk_results, start=1):
-            merged_sources.extend(chunk_result.sources)
-            merged_trace_lines.extend(chunk_result.trace_lines)
-            merged_map_results.extend(chunk_result.map_results)
-            merged_highlights.extend(chunk_result.highlights)
-            merged_risks.extend(chunk_result.risks)
-            merged_todos.extend(chunk_result.todos)
-            if chunk_result.overview.strip():
-                overview_candidates.append(chunk_result.overview.strip())
-            chunk_summary_lines.append(
-                "\n".join(
-                    [
-                        f"chunk#{idx}",
-                        f"overview: {chunk_result.overview or '（无）'}",
-                        "highlights:",
-                        *[f"- {item}" for item in _safe_list(chunk_result.highlights, max_items=10)],
-                        "risks:",
-                        *[f"- {item}" for item in _safe_list(chunk_result.risks, max_items=10)],
-                        "todos:",
-                        *[f"- {item}" for item in _safe_list(chunk_result.todos, max_items=10)],
-                    ]
-                )
-            )
+    if not overview_candidates:
+        merged.fallback_overview = "今日暂无可总结内容。"
+    elif len(overview_candidates) == 1:
+        merged.fallback_overview = overview_candidates[0]
+    elif len(overview_candidates) == 2:
+        merged.fallback_overview = f"{overview_candidates[0]}；{overview_candidates[1]}"
+    else:
+        merged.fallback_overview = f"{overview_candidates[0]}；{overview_candidates[1]}；另有{len(overview_candidates) - 2}个分块补充信息。"
+    return merged
 
-        if not overview_candidates:
-            fallback_overview = "今日暂无可总结内容。"
-        elif len(overview_candidates) == 1:
-            fallback_overview = overview_candidates[0]
-        elif len(overview_candidates) == 2:
-            fallback_overview = f"{overview_candidates[0]}；{overview_candidates[1]}"
-        else:
-            fallback_overview = f"{overview_candidates[0]}；{overview_candidates[1]}；另有{len(overview_candidates) - 2}个分块补充信息。"
-
-        if len(chunk_results) == 1:
-            reduced_overview = chunk_results[0].overview
-            reduced_highlights = chunk_results[0].highlights
-            reduced_risks = chunk_results[0].risks
-            reduced_todos = chunk_results[0].todos
-        elif DEFAULT_SUMMARY_GROUP_REDUCE_ENABLED and structured_chunk_reducer is not None:
-            try:
-                reduce_messages = [
-                    SystemMessage(content=GROUP_REDUCE_SYSTEM_PROMPT),
-                    HumanMessage(
-                        content=GROUP_REDUCE_USER_PROMPT_TEMPLATE.format(
-                            chat_type=chat_type,
-                            group_id=group_id,
-                            chunk_count=len(chunk_results),
-                            chunk_summaries="\n\n".join(chunk_summary_lines),
-                        )
-                    ),
-                ]
-                reduce_result = structured_chunk_reducer.invoke(reduce_messages)
-                reduced_overview = (reduce_result.overview or "").strip() or "今日暂无可总结内容。"
-                reduced_highlights = _safe_list(reduce_result.highlights, max_items=6)
-                reduced_risks = _safe_list(reduce_result.risks, max_items=5)
-                reduced_todos = _safe_list(reduce_result.todos, max_items=5)
-            except Exception:
-                reduced_overview = fallback_overview
-                reduced_highlights = _safe_list(merged_highlights, max_items=6)
-                reduced_risks = _safe_list(merged_risks, max_items=5)
-                reduced_todos = _safe_list(merged_todos, max_items=5)
-        else:
-            reduced_overview = fallback_overview
-            reduced_highlights = _safe_list(merged_highlights, max_items=6)
-            reduced_risks = _safe_list(merged_risks, max_items=5)
-            reduced_todos = _safe_list(merged_todos, max_items=5)
-
-        group_summary = SummaryFinalResult(
-            date=today_text,
-            overview=reduced_overview,
-            highlights=_safe_list(reduced_highlights, max_items=6),
-            risks=_safe_list(reduced_risks, max_items=5),
-            todos=_safe_list(reduced_todos, max_items=5),
-            chunk_count=len(chunk_results),
-            message_count=sum(item.message_count for item in chunk_results),
-            sources=_safe_list(merged_sources, max_items=200),
-            trace_lines=_safe_list(merged_trace_lines, max_items=20),
-            map_results=merged_map_results,
-        )
-        group_results.append(
-            GroupSummaryResult(
+
+def _group_reduce_messages(
+    *,
+    chat_type: str,
+    group_id: str,
+    chunk_results: list[SummaryFinalResult],
+    merged: _GroupChunkMerge,
+) -> list[Any]:
+    return [
+        SystemMessage(content=GROUP_REDUCE_SYSTEM_PROMPT),
+        HumanMessage(
+            content=GROUP_REDUCE_USER_PROMPT_TEMPLATE.format(
                 chat_type=chat_type,
                 group_id=group_id,
-                summary=group_summary,
+                chunk_count=len(chunk_results),
+                chunk_summaries="\n\n".join(merged.chunk_summary_lines),
             )
-        )
-        total_chunks += group_summary.chunk_count
-        total_messages += group_summary.message_count
+        ),
+    ]
 
-    global_overview = ""
-    if DEFAULT_SUMMARY_GLOBAL_OVERVIEW and group_results:
-        try:
-            structured_overview_llm = llm.with_structured_output(GlobalOverviewSchema)
-            group_summary_text = "\n\n".join(
+
+def _reduced_from_llm(reduce_result: Any) -> tuple[str, list[str], list[str], list[str]]:
+    return (
+        (reduce_result.overview or "").strip() or "今日暂无可总结内容。",
+        _safe_list(reduce_result.highlights, max_items=6),
+        _safe_list(reduce_result.risks, max_items=5),
+        _safe_list(reduce_result.todos, max_items=5),
+    )
+
+
+def _reduced_fallback(merged: _GroupChunkMerge) -> tuple[str, list[str], list[str], list[str]]:
+    return (
+        merged.fallback_overview,
+        _safe_list(merged.highlights, max_items=6),
+        _safe_list(merged.risks, max_items=5),
+        _safe_list(merged.todos, max_items=5),
+    )
+
+
+def _build_group_result(
+    *,
+    chat_type: str,
+    group_id: str,
+    today_text: str,
+    chunk_results: list[SummaryFinalResult],
+    merged: _GroupChunkMerge,
+    reduced: tuple[str, list[str], list[str], list[str]],
+) -> GroupSummaryResult:
+    reduced_overview, reduced_highlights, reduced_risks, reduced_todos = reduced
+    group_summary = SummaryFinalResult(
+        date=today_text,
+        overview=reduced_overview,
+        highlights=_safe_list(reduced_highlights, max_items=6),
+        risks=_safe_list(reduced_risks, max_items=5),
+        todos=_safe_list(reduced_todos, max_items=5),
+        chunk_count=len(chunk_results),
+        message_count=sum(item.message_count for item in chunk_results),
+        sources=_safe_list(merged.sources, max_items=200),
+        trace_lines=_safe_list(merged.trace_lines, max_items=20),
+        map_results=merged.map_results,
+    )
+    return GroupSummaryResult(
+        chat_type=chat_type,
+        group_id=group_id,
+        summary=group_summary,
+    )
+
+
+def _global_overview_messages(group_results: list[GroupSummaryResult]) -> list[Any]:
+    group_summary_text = "\n\n".join(
+        [
+            "\n".join(
                 [
-                    "\n".join(
-                        [
-                            f"group={item.group_id}, chat_type={item.chat_type}",
-                            f"overview: {item.summary.overview or '（无）'}",
-                            "highlights:",
-                            *[f"- {h}" for h in _safe_list(item.summary.highlights, max_items=8)],
-                            "risks:",
-                            *[f"- {r}" for r in _safe_list(item.summary.risks, max_items=8)],
-                            "todos:",
-                            *[f"- {t}" for t in _safe_list(item.summary.todos, max_items=8)],
-                        ]
-                    )
-                    for item in group_results
+                    f"group={item.group_id}, chat_type={item.chat_type}",
+                    f"overview: {item.summary.overview or '（无）'}",
+                    "highlights:",
+                    *[f"- {h}" for h in _safe_list(item.summary.highlights, max_items=8)],
+                    "risks:",
+                    *[f"- {r}" for r in _safe_list(item.summary.risks, max_items=8)],
+                    "todos:",
+                    *[f"- {t}" for t in _safe_list(item.summary.todos, max_items=8)],
                 ]
             )
-            global_messages = [
-                SystemMessage(content=GLOBAL_OVERVIEW_SYSTEM_PROMPT),
-                HumanMessage(content=GLOBAL_OVERVIEW_USER_PROMPT_TEMPLATE.format(group_summaries=group_summary_text)),
-            ]
-            overview_result = structured_overview_llm.invoke(global_messages)
-            global_overview = (overview_result.overview or "").strip()
-        except Exception:
-            global_overview = ""
+            for item in group_results
+        ]
+    )
+    return [
+        SystemMessage(content=GLOBAL_OVERVIEW_SYSTEM_PROMPT),
+        HumanMessage(content=GLOBAL_OVERVIEW_USER_PROMPT_TEMPLATE.format(group_summaries=group_summary_text)),
+    ]
+
 
+def _grouped_summary_result(
+    *,
+    today_text: str,
+    group_results: list[GroupSummaryResult],
+    global_overview: str,
+    started_at: float,
+) -> GroupedSummaryResult:
     return GroupedSummaryResult(
         date=today_text,
         group_results=group_results,
         global_overview=global_overview,
-        chunk_count=total_chunks,
-        message_count=total_messages,
+        chunk_count=sum(item.summary.chunk_count for item in group_results),
+        message_count=sum(item.summary.message_count for item in group_results),
         elapsed_ms=(perf_counter() - started_at) * 1000,
     )
 
 
+async def arun_group_summary(
+    job: dict[str, Any],
+    *,
+    model_name: str | None = None,
+    temperature: float = DEFAULT_LLM_TEMPERATURE,
+) -> GroupSummaryResult | None:
+    """
+    单个群的异步 summary：多个 chunk 并发执行 map（总并发仍受 LLM 限流约束），reduce 走 ainvoke。
+    无可总结内容时返回 None。
+    """
+    parsed_job = _parse_group_job(job)
+    if parsed_job is None:
+        return None
+    chat_type, group_id, chunk_texts = parsed_job
+    today_text = datetime.now().strftime("%Y-%m-%d")
+
+    chunk_results: list[SummaryFinalResult] = list(
+        await asyncio.gather(
+            *[
+                arun_summary_graph(
+                    chunk_text,
+                    chunk_index=chunk_index,
+                    model_name=model_name,
+                    temperature=temperature,
+                )
+                for chunk_index, chunk_text in enumerate(chunk_texts, start=1)
+            ]
+        )
+    )
+
+    merged = _merge_chunk_results(chunk_results)
+    if len(chunk_results) == 1:
+        only = chunk_results[0]
+        reduced = (only.overview, only.highlights, only.risks, only.todos)
+    elif DEFAULT_SUMMARY_GROUP_REDUCE_ENABLED:
+        raise_if_agent_job_abandoned("summary_group_reduce")
+        try:
+            route = _summary_route(model_name)
+            structured_chunk_reducer = route.structured_model(ChunkSummarySchema, temperature=temperature)
+            reduce_messages = _group_reduce_messages(
+                chat_type=chat_type,
+                group_id=group_id,
+                chunk_results=chunk_results,
+                merged=merged,
+            )
+            reduce_cache = _summary_cache_scope(ChunkSummarySchema, route=route, temperature=temperature)
+            reduce_result = await alookup_llm_response(reduce_cache, reduce_messages)
+            if reduce_result is None:
+                started = perf_counter()
+                with _summary_llm_guard(route) as guard:
+                    await _aacquire_summary_llm_budget(reduce_messages, route=route)
+                    guard.mark_sent()
+                    reduce_result = await structured_chunk_reducer.ainvoke(reduce_messages)
+                _observe_summary_tier("reduce", model=route.model, started=started)
+                await astore_llm_response(reduce_cache, reduce_messages, reduce_result)
+            reduced = _reduced_from_llm(reduce_result)
+        except Exception:
+            reduced = _reduced_fallback(merged)
+    else:
+        reduced = _reduced_fallback(merged)
+
+    return _build_group_result(
+        chat_type=chat_type,
+        group_id=group_id,
+        today_text=today_text,
+        chunk_results=chunk_results,
+        merged=merged,
+        reduced=reduced,
+    )
+
+
+async def arun_global_overview(
+    group_results: list[GroupSummaryResult],
+    *,
+    model_name: str | None = None,
+    temperature: float = DEFAULT_LLM_TEMPERATURE,
+) -> str:
+    """在各群摘要之上生成全局总览；未开启 summary_global_overview 或调用失败时返回空串。"""
+    if not DEFAULT_SUMMARY_GLOBAL_OVERVIEW or not group_results:
+        return ""
+    raise_if_agent_job_abandoned("summary_global_overview")
+    try:
+        route = _summary_route(model_name)
+        structured_overview_llm = route.structured_model(GlobalOverviewSchema, temperature=temperature)
+        global_messages = _global_overview_messages(group_results)
+        overview_cache = _summary_cache_scope(GlobalOverviewSchema, route=route, temperature=temperature)
+        overview_result = await alookup_llm_response(overview_cache, global_messages)
+        if overview_result is None:
+            started = perf_counter()
+            with _summary_llm_guard(route) as guard:
+                await _aacquire_summary_llm_budget(global_messages, route=route)
+                guard.mark_sent()
+                overview_result = await structured_overview_llm.ainvoke(global_messages)
+            _observe_summary_tier("overview", model=route.model, started=started)
+            await astore_llm_response(overview_cache, global_messages, overview_result)
+        return (overview_result.overview or "").strip()
+    except Exception:
+        return ""
+
+
 def format_summary_message(result: SummaryFinalResult) -> str:
     """将最终结果格式化为可直接发送给 QQ 的文本。"""
     date_text = result.date or datetime.now().strftime("%Y-%m-%d")
@@ -1012,6 +909,118 @@ async def process_private_message(msg: PrivateMessage) -> None:
         )
 
 
+async def _summarize_and_send(group_jobs: list[dict[str, Any]], *, run_mode: str) -> None:
+    """
+    分组总结并私聊发送；group_jobs 为 build_summary_chunks_from_log_lines 的输出（可 JSON 序列化）。
+    manual 模式的游标在分块时已经保存，因此作为 durable 任务登记这一步，重启后按原 group_jobs 重放，避免漏发。
+    """
+    run_id = generate_run_id()
+    started = perf_counter()
+    log_event = bind_agent_event(
+        agent_name="summary",
+        task_type="SUMMARY",
+        run_id=run_id,
+        chat_type="group",
+        group_id="",
+        user_id=str(QQnumber),
+        user_name="owner",
+        ts="",
+    )
+    log_event(
+        stage="start",
+        extra={
+            "grouped": True,
+            "group_jobs": len(group_jobs),
+            "mode": run_mode,
+        },
+    )
+
+    # 按群拆成多个池任务并发执行（每批最多 summary_group_concurrency 个在排队/执行），单群失败不影响其它群；
+    # 整个分组总结步骤登记为 durable 任务，发送前删除记录（重启后最多重发一次未发送的日报）；
+    # 参数里是一整天的日志分块，JSON 编码放到线程中（SQLite 写入本身由持久化存储的写线程完成），不阻塞事件循环
+    durable_key = f"summary:{run_id}"
+    await asyncio.to_thread(
+        persist_durable_job,
+        durable_key,
+        "summary",
+        {"group_jobs": group_jobs, "run_mode": run_mode},
+        priority=6,
+        agent_name="summary",
+    )
+    group_results_by_index: dict[int, GroupSummaryResult] = {}
+    async for item in submit_agent_jobs(
+        [(arun_group_summary, (job,)) for job in group_jobs],
+        priority=6,
+        timeout=180.0,
+        agent_name="summary",
+        lane="batch",
+        max_concurrency=DEFAULT_SUMMARY_GROUP_CONCURRENCY,
+        job_run_id=run_id,
+    ):
+        if not item.ok:
+            log_event(stage="group_error", error=str(item.error), extra={"group_index": item.index})
+            print(f"[SUMMARY-GROUP-ERROR] index={item.index} error={item.error!r}")
+            continue
+        if item.result is not None:
+            group_results_by_index[item.index] = item.result
+    group_results = [group_results_by_index[index] for index in sorted(group_results_by_index)]
+    global_overview = ""
+    if DEFAULT_SUMMARY_GLOBAL_OVERVIEW and group_results:
+        global_overview = await submit_agent_job(
+            arun_global_overview,
+            group_results,
+            priority=6,
+            timeout=120.0,
+            agent_name="summary",
+            lane="batch",
+            job_run_id=run_id,
+        )
+    grouped_result = _grouped_summary_result(
+        today_text=datetime.now().strftime("%Y-%m-%d"),
+        group_results=group_results,
+        global_overview=global_overview,
+        started_at=started,
+    )
+    forget_durable_job(durable_key)
+
+    send_mode = get_summary_send_mode()
+    if send_mode == "multi_message":
+        sent_count = 0
+        for message_text in format_grouped_summary_messages(grouped_result):
+            await bot.api.post_private_msg(QQnumber, text=message_text)
+            sent_count += 1
+    else:
+        text = format_grouped_summary_message(grouped_result)
+        sent_count = 0
+        if text:
+            await bot.api.post_private_msg(QQnumber, text=text)
+            sent_count = 1
+
+    elapsed_ms = (perf_counter() - started) * 1000
+    log_event(
+        stage="end",
+        latency_ms=elapsed_ms,
+        decision={
+            "grouped": True,
+            "send_mode": send_mode,
+            "groups": len(grouped_result.group_results),
+            "chunks": grouped_result.chunk_count,
+            "messages": grouped_result.message_count,
+            "sent_count": sent_count,
+        },
+    )
+    print(
+        "[SUMMARY] "
+        f"groups={len(grouped_result.group_results)} | "
+        f"chunks={grouped_result.chunk_count} | "
+        f"messages={grouped_result.message_count} | "
+        f"elapsed_ms={grouped_result.elapsed_ms:.2f}"
+    )
+
+
+register_durable_job("summary", _summarize_and_send)
+
+
 async def _execute_daily_summary(run_mode: str = "manual") -> None:
     file_path = LOG_FILE_PATH
     chunk_size = 10000
@@ -1026,10 +1035,17 @@ async def _execute_daily_summary(run_mode: str = "manual") -> None:
                 print("没有日志需要处理")
                 return
 
-        group_jobs, meta = build_summary_chunks_from_log_lines(
+        # 解析 + 分块是纯 Python CPU 计算，放到进程池执行，避免大日志时卡住事件循环
+        group_jobs, meta = await submit_agent_job(
+            build_summary_chunks_from_log_lines,
             raw_lines,
             chunk_size=chunk_size,
             run_mode=run_mode,
+            priority=6,
+            timeout=180.0,
+            run_in_process=True,
+            agent_name="summary",
+            lane="batch",
         )
         if not group_jobs:
             print(
@@ -1040,68 +1056,7 @@ async def _execute_daily_summary(run_mode: str = "manual") -> None:
             )
             return
 
-        run_id = generate_run_id()
-        started = perf_counter()
-        log_event = bind_agent_event(
-            agent_name="summary",
-            task_type="SUMMARY",
-            run_id=run_id,
-            chat_type="group",
-            group_id="",
-            user_id=str(QQnumber),
-            user_name="owner",
-            ts="",
-        )
-        log_event(
-            stage="start",
-            extra={
-                "grouped": True,
-                "group_jobs": len(group_jobs),
-                "mode": run_mode,
-            },
-        )
-
-        grouped_result = await submit_agent_job(
-            run_grouped_summary_graph,
-            group_jobs,
-            priority=6,
-            timeout=180.0,
-            run_in_thread=True,
-        )
-
-        send_mode = get_summary_send_mode()
-        if send_mode == "multi_message":
-            sent_count = 0
-            for message_text in format_grouped_summary_messages(grouped_result):
-                await bot.api.post_private_msg(QQnumber, text=message_text)
-                sent_count += 1
-        else:
-            text = format_grouped_summary_message(grouped_result)
-            sent_count = 0
-            if text:
-                await bot.api.post_private_msg(QQnumber, text=text)
-                sent_count = 1
-
-        elapsed_ms = (perf_counter() - started) * 1000
-        log_event(
-            stage="end",
-            latency_ms=elapsed_ms,
-            decision={
-                "grouped": True,
-                "send_mode": send_mode,
-                "groups": len(grouped_result.group_results),
-                "chunks": grouped_result.chunk_count,
-                "messages": grouped_result.message_count,
-                "sent_count": sent_count,
-            },
-        )
-        print(
-            "[SUMMARY] "
-            f"groups={len(grouped_result.group_results)} | "
-            f"chunks={grouped_result.chunk_count} | "
-            f"messages={grouped_result.message_count} | "
-            f"elapsed_ms={grouped_result.elapsed_ms:.2f}"
-        )
+        await _summarize_and_send(group_jobs, run_mode=run_mode)
         print(
             f"日志分组完成: groups={meta.get('group_count', '0')}, "
             f"group_chunks={meta.get('group_chunks', '0')}, final_chunks={meta.get('final_chunks', '0')}, "
@@ -1125,116 +1080,156 @@ async def daily_summary(run_mode: str = "manual") -> None:
     task.add_done_callback(_on_done)
 
 
-def _build_summary_graph(*, model_name: str | None, temperature: float):
+def _summary_map_call(*, model_name: str | None, temperature: float) -> LLMCallSpec:
     """
-    Agent核心流程Graph构建
+    准备 map 节点的 LLM 调用参数（结构化输出客户端 + 限流 / 熔断参数），经 config 传给只编译一次的图；每个 chunk 单独选后端。
+    llm_cascade_config 开启 summary 时 map 分片走便宜档模型，reduce / 全局总览仍用 model_name。
     """
+    route = _summary_route(llm_tier_model("summary") or model_name)
+    return LLMCallSpec(
+        llm=route.structured_model(ChunkSummarySchema, temperature=temperature),
+        budget_kwargs=route.budget_kwargs("summary"),
+        guard_kwargs=route.guard_kwargs("summary"),
+        cache=_summary_cache_scope(ChunkSummarySchema, route=route, temperature=temperature),
+    )
 
-    llm = _build_llm(model_name=model_name, temperature=temperature)
-
-    def map_node(state: SummaryGraphState) -> dict[str, Any]:
-        payload = state["payload"]
-        chunk_index = state["chunk_index"]
-
-        if not payload.lines:
-            empty_result = SummaryMapResult(
-                chunk_index=chunk_index,
-                blocks=payload.blocks,
-                overview="今日暂无可总结内容。",
-                highlights=[],
-                risks=[],
-                todos=[],
-                evidence=[],
+
+def _summary_empty_map(state: SummaryGraphState) -> dict[str, Any]:
+    payload = state["payload"]
+    empty_result = SummaryMapResult(
+        chunk_index=state["chunk_index"],
+        blocks=payload.blocks,
+        overview="今日暂无可总结内容。",
+        highlights=[],
+        risks=[],
+        todos=[],
+        evidence=[],
+    )
+    return {"map_result": empty_result, "llm_calls": state["llm_calls"]}
+
+
+def _summary_map_messages(state: SummaryGraphState) -> list[Any]:
+    payload = state["payload"]
+    source_refs, source_details, _trace_lines = _analyze_blocks(payload.blocks)
+    return [
+        SystemMessage(
+            content=SYSTEM_SUMMARY_PROMPT
+        ),
+        HumanMessage(
+            content=USER_SUMMARY_PROMPT_TEMPLATE.format(
+                chunk_index=state["chunk_index"],
+                source_count=len(source_refs),
+                sources=", ".join(source_refs) if source_refs else "(none)",
+                source_details="\n".join(source_details) if source_details else "(none)",
+                unique_lines=payload.stats.get("unique_lines", 0),
+                payload_text=payload.text,
             )
-            return {"map_result": empty_result, "llm_calls": state["llm_calls"]}
-
-        structured_llm = llm.with_structured_output(ChunkSummarySchema)
-        source_refs, source_details, _trace_lines = _analyze_blocks(payload.blocks)
-        messages = [
-            SystemMessage(
-                content=SYSTEM_SUMMARY_PROMPT
-            ),
-            HumanMessage(
-                content=USER_SUMMARY_PROMPT_TEMPLATE.format(
-                    chunk_index=chunk_index,
-                    source_count=len(source_refs),
-                    sources=", ".join(source_refs) if source_refs else "(none)",
-                    source_details="\n".join(source_details) if source_details else "(none)",
-                    unique_lines=payload.stats.get("unique_lines", 0),
-                    payload_text=payload.text,
-                )
-            ),
-        ]
+        ),
+    ]
 
-        llm_result = structured_llm.invoke(messages)
+
+def _summary_apply_map(state: SummaryGraphState, llm_result: Any) -> dict[str, Any]:
+    map_result = SummaryMapResult(
+        chunk_index=state["chunk_index"],
+        blocks=state["payload"].blocks,
+        overview=(llm_result.overview or "").strip(),
+        highlights=_safe_list(llm_result.highlights, min_items=3, max_items=6),
+        risks=_safe_list(llm_result.risks, max_items=5),
+        todos=_safe_list(llm_result.todos, max_items=5),
+        evidence=_safe_list(llm_result.evidence, max_items=6),
+    )
+    return {"map_result": map_result, "llm_calls": state["llm_calls"] + 1}
+
+
+async def _asummary_map_node(state: SummaryGraphState, config: RunnableConfig) -> dict[str, Any]:
+    if not state["payload"].lines:
+        return _summary_empty_map(state)
+
+    call = llm_call_from_config(config)
+    raise_if_agent_job_abandoned("summary_map")
+    messages = _summary_map_messages(state)
+    result = await alookup_llm_response(call.cache, messages)
+    if result is None:
+        started = perf_counter()
+        with llm_call_guard(**call.guard_kwargs) as guard:
+            await aacquire_llm_budget(messages, **call.budget_kwargs)
+            guard.mark_sent()
+            result = await call.llm.ainvoke(messages)
+        _observe_summary_tier("map", model=str(call.guard_kwargs.get("model") or ""), started=started)
+        await astore_llm_response(call.cache, messages, result)
+    return _summary_apply_map(state, result)
+
+
+def _summary_finalize_node(state: SummaryGraphState) -> dict[str, Any]:
+    payload = state["payload"]
+    map_result = state.get("map_result")
+    if map_result is None:
         map_result = SummaryMapResult(
-            chunk_index=chunk_index,
+            chunk_index=state["chunk_index"],
             blocks=payload.blocks,
-            overview=(llm_result.overview or "").strip(),
-            highlights=_safe_list(llm_result.highlights, min_items=3, max_items=6),
-            risks=_safe_list(llm_result.risks, max_items=5),
-            todos=_safe_list(llm_result.todos, max_items=5),
-            evidence=_safe_list(llm_result.evidence, max_items=6),
+            overview="今日暂无可总结内容。",
         )
-        return {"map_result": map_result, "llm_calls": state["llm_calls"] + 1}
 
-    def finalize_node(state: SummaryGraphState) -> dict[str, Any]:
-        payload = state["payload"]
-        map_result = state.get("map_result")
-        if map_result is None:
-            map_result = SummaryMapResult(
-                chunk_index=state["chunk_index"],
-                blocks=payload.blocks,
-                overview="今日暂无可总结内容。",
-            )
+    source_refs, _source_details, trace_lines = _analyze_blocks(payload.blocks)
+    final_result = SummaryFinalResult(
+        date=datetime.now().strftime("%Y-%m-%d"),
+        overview=map_result.overview,
+        highlights=map_result.highlights,
+        risks=map_result.risks,
+        todos=map_result.todos,
+        chunk_count=1,
+        message_count=int(payload.stats.get("unique_lines", 0)),
+        sources=source_refs,
+        trace_lines=trace_lines,
+        map_results=[map_result],
+    )
+    return {"final_result": final_result}
 
-        source_refs, _source_details, trace_lines = _analyze_blocks(payload.blocks)
-        final_result = SummaryFinalResult(
-            date=datetime.now().strftime("%Y-%m-%d"),
-            overview=map_result.overview,
-            highlights=map_result.highlights,
-            risks=map_result.risks,
-            todos=map_result.todos,
-            chunk_count=1,
-            message_count=int(payload.stats.get("unique_lines", 0)),
-            sources=source_refs,
-            trace_lines=trace_lines,
-            map_results=[map_result],
-        )
-        return {"final_result": final_result}
 
+@lru_cache(maxsize=None)
+def _summary_graph():
+    """
+    Agent核心流程Graph构建（进程内只编译一次，模型参数经 config 传入 map 节点）
+    """
     graph = StateGraph(SummaryGraphState)
-    graph.add_node("map_node", map_node)
-    graph.add_node("finalize_node", finalize_node)
+    graph.add_node("map_node", trace_agent_node("map_node", _asummary_map_node))
+    graph.add_node("finalize_node", trace_agent_node("finalize_node", _summary_finalize_node))
     graph.add_edge(START, "map_node")
     graph.add_edge("map_node", "finalize_node")
     graph.add_edge("finalize_node", END)
     return graph.compile()
 
 
-def _build_llm(*, model_name: str | None, temperature: float) -> ChatOpenAI:
-    """
-    给Agent接入LLM
-    """
-    if load_dotenv is not None:
-        load_dotenv(override=False)
+def _summary_route(model_name: str | None) -> LLMRoute:
+    """经 LLM 网关后端池选择后端（模型缺省取 LLM_MODEL，再缺省取 summary 配置）；客户端、限流与熔断都使用同一个 route。"""
+    return route_llm(model_name or get_llm_settings().model or DEFAULT_LLM_MODEL)
 
-    api_key = os.getenv("LLM_API_KEY")
-    if not api_key:
-        raise ValueError("缺少 LLM_API_KEY，请在 .env 中配置")
 
-    base_url = os.getenv("LLM_API_BASE_URL")
-    resolved_model = model_name or os.getenv("LLM_MODEL") or DEFAULT_LLM_MODEL
+async def _aacquire_summary_llm_budget(messages: list[Any], *, route: LLMRoute) -> None:
+    await aacquire_llm_budget(messages, **route.budget_kwargs("summary"))
+
+
+def _summary_llm_guard(route: LLMRoute) -> LLMCallGuard:
+    """熔断打开时 map 直接失败（该群跳过），reduce / 全局总览走本地兜底。"""
+    return llm_call_guard(**route.guard_kwargs("summary"))
 
-    llm_kwargs: dict[str, Any] = {
-        "model_name": resolved_model,
-        "temperature": temperature,
-        "openai_api_key": api_key,
-    }
-    if base_url:
-        llm_kwargs["openai_api_base"] = base_url
 
-    return ChatOpenAI(**llm_kwargs)
+def _summary_cache_scope(schema: Any, *, route: LLMRoute, temperature: float) -> LLMCacheScope | None:
+    """重复执行 /summary 时，内容未变的 chunk / reduce / 全局总览直接命中缓存（需在 llm_response_cache_config 中开启 summary）。"""
+    return llm_cache_scope(agent_name="summary", schema=schema, model=route.requested_model, temperature=temperature)
+
+
+def _observe_summary_tier(stage: str, *, model: str, started: float) -> None:
+    """开启分档时记录各档耗时（map 为便宜档，reduce / 全局总览为大模型档），写入 stage=llm_cascade 事件。"""
+    if not llm_tier_model("summary"):
+        return
+    observe_llm_tier(
+        agent_name="summary",
+        stage=stage,
+        tier="cheap" if stage == "map" else "strong",
+        model=model,
+        seconds=perf_counter() - started,
+    )
 
 
 def _collect_normalized_lines(
@@ -1298,7 +1293,7 @@ def _parse_blocks(lines: list[str]) -> list[SummaryBlock]:
             if saw_content:
                 flush()
             parsed_chat = (header.group("chat_type") or "").strip().lower()
-            current_chat = _normalize_chat_type(parsed_chat)
+            current_chat = normalize_chat_type(parsed_chat)
             current_group = header.group("group_id").strip() or UNKNOWN_GROUP
             current_user = header.group("user_id").strip() or UNKNOWN_USER
             parsed_user_name = (header.group("user_name") or "").strip()
@@ -1330,7 +1325,7 @@ def _analyze_blocks(blocks: list[SummaryBlock]) -> tuple[list[str], list[str], l
     group_summary: dict[str, dict[str, Any]] = {}
 
     for block in blocks:
-        chat_type = _normalize_chat_type(block.chat_type)
+        chat_type = normalize_chat_type(block.chat_type)
         group_id = block.group_id or UNKNOWN_GROUP
         user_id = block.user_id or UNKNOWN_USER
         user_name = (block.user_name or "").strip() or user_id
@@ -1406,100 +1401,3 @@ def _safe_list(items: list[str], *, min_items: int = 0, max_items: int = 999) ->
     if len(deduped) < min_items:
         return deduped
     return deduped[:max_items]
-
-
-def _split_source_messages(
-    *,
-    chat_type: str,
-    group_id: str,
-    user_id: str,
-    user_name: str,
-    messages: list[tuple[str, str]],
-    chunk_size: int,
-) -> list[str]:
-    safe_name = (user_name or UNKNOWN_USER).replace("]", "）")
-    header = (
-        f"[chat:{_normalize_chat_type(chat_type)}]"
-        f"[group:{group_id}][user:{user_id}][name:{safe_name}]"
-    )
-    max_body_chars = max(1, chunk_size - len(header) - 1)
-    chunks: list[str] = []
-    current_body = ""
-
-    for ts, message in messages:
-        dt = _parse_iso_dt(ts)
-        time_prefix = dt.strftime("%H:%M") if dt is not None else ""
-        normalized_message = f"[{time_prefix}] {message}" if time_prefix else message
-        remaining = normalized_message
-        while remaining:
-            room = max_body_chars if not current_body else max_body_chars - len(current_body) - 1
-            if room <= 0:
-                chunks.append(f"{header}\n{current_body}")
-                current_body = ""
-                continue
-
-            part = remaining[:room]
-            remaining = remaining[room:]
-            current_body = part if not current_body else f"{current_body}\n{part}"
-
-            if remaining:
-                chunks.append(f"{header}\n{current_body}")
-                current_body = ""
-
-    if current_body:
-        chunks.append(f"{header}\n{current_body}")
-    if not chunks:
-        chunks.append(header)
-    return chunks
-
-
-def _merge_small_chunks(grouped_chunks: list[str], chunk_size: int) -> list[str]:
-    merged: list[str] = []
-    current = ""
-    for block in grouped_chunks:
-        if not current:
-            current = block
-            continue
-        candidate = f"{current}\n\n{block}"
-        if len(candidate) <= chunk_size:
-            current = candidate
-        else:
-            merged.append(current)
-            current = block
-    if current:
-        merged.append(current)
-    return merged
-
-
-def _normalize_chat_type(chat_type: Any) -> str:
-    text = str(chat_type or "").strip().lower()
-    if text in {"group", "private"}:
-        return text
-    return "group"
-
-
-def _normalize_scope(scope: str) -> str:
-    value = str(scope or "").strip().lower()
-    if value in {"group", "private", "all"}:
-        return value
-    return "group"
-
-
-def _normalize_group_filter_mode(mode: str) -> str:
-    value = str(mode or "").strip().lower()
-    if value in {"all", "include", "exclude"}:
-        return value
-    return "all"
-
-
-def _parse_iso_dt(ts: str | None) -> datetime | None:
-    if not ts:
-        return None
-    try:
-        normalized = str(ts).replace("Z", "+00:00")
-        dt = datetime.fromisoformat(normalized)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
-        return dt
-    except ValueError:
-        return None
@@ -0,0 +1,334 @@
+"""
+Summary 日志的解析 / 筛选 / 分块（纯 Python，结果可 pickle）。
+
+`build_summary_chunks_from_log_lines` 以 run_in_process=True 提交到 Agent 池进程池；spawn 启动的子进程
+按函数所在模块导入，本模块因此只依赖标准库与 agent_config_loader，不导入 bot / agent_pool / LangChain。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+import json
+import os
+
+from .agent_config_loader import load_agent_config_from_dir
+
+
+UNKNOWN_GROUP = "unknown_group"
+UNKNOWN_USER = "unknown_user"
+SUMMARY_CURSOR_PATH = "data/summary_cursor.json"
+
+# 读取 summary.py 的配置节（summary_chat_scope / summary_group_filter_mode / summary_group_ids），与 summary 工作流共用
+SUMMARY_AGENT_CONFIG = load_agent_config_from_dir("summary.py", config_dir=os.path.dirname(__file__))
+
+
+def build_summary_chunks_from_log_lines(
+    lines: list[str],
+    *,
+    chunk_size: int,
+    run_mode: str,
+) -> tuple[list[dict[str, Any]], dict[str, str]]:
+    """从日志原始行构建 summary chunks（解析+筛选+分块）。"""
+    records: list[dict[str, str]] = []
+    for line in lines:
+        group_id, user_id, user_name, ts, message, chat_type = parse_summary_log_line(line)
+        records.append(
+            {
+                "group_id": group_id,
+                "user_id": user_id,
+                "user_name": user_name,
+                "ts": ts,
+                "message": message,
+                "chat_type": chat_type,
+            }
+        )
+
+    filtered_records, meta = filter_records_for_summary(records, run_mode=run_mode)
+    if not filtered_records:
+        return [], meta
+
+    grouped_messages: dict[tuple[str, str, str, str], list[tuple[str, str]]] = {}
+    for record in filtered_records:
+        chat_type = normalize_chat_type(record.get("chat_type", "group"))
+        group_id = str(record.get("group_id", UNKNOWN_GROUP))
+        user_id = str(record.get("user_id", UNKNOWN_USER))
+        user_name = str(record.get("user_name", UNKNOWN_USER))
+        ts = str(record.get("ts", ""))
+        message = str(record.get("message", "")).strip()
+        if not message:
+            continue
+        key = (chat_type, group_id, user_id, user_name)
+        if key not in grouped_messages:
+            grouped_messages[key] = []
+        grouped_messages[key].append((ts, message))
+
+    grouped_chunks_by_group: dict[tuple[str, str], list[str]] = {}
+    for (chat_type, group_id, user_id, user_name), messages in grouped_messages.items():
+        source_chunks = _split_source_messages(
+            chat_type=chat_type,
+            group_id=group_id,
+            user_id=user_id,
+            user_name=user_name,
+            messages=messages,
+            chunk_size=chunk_size,
+        )
+        group_key = (chat_type, group_id)
+        if group_key not in grouped_chunks_by_group:
+            grouped_chunks_by_group[group_key] = []
+        grouped_chunks_by_group[group_key].extend(source_chunks)
+
+    group_jobs: list[dict[str, Any]] = []
+    merged_chunk_total = 0
+    for chat_type, group_id in sorted(grouped_chunks_by_group.keys()):
+        merged_chunks = _merge_small_chunks(grouped_chunks_by_group[(chat_type, group_id)], chunk_size)
+        if not merged_chunks:
+            continue
+        group_jobs.append(
+            {
+                "chat_type": chat_type,
+                "group_id": group_id,
+                "chunks": merged_chunks,
+            }
+        )
+        merged_chunk_total += len(merged_chunks)
+
+    if meta.get("run_mode") == "manual" and meta.get("cursor_key") and meta.get("cursor_after"):
+        save_summary_cursor(str(meta["cursor_key"]), str(meta["cursor_after"]))
+
+    meta["group_count"] = str(len(group_jobs))
+    meta["group_chunks"] = str(sum(len(chunks) for chunks in grouped_chunks_by_group.values()))
+    meta["final_chunks"] = str(merged_chunk_total)
+    return group_jobs, meta
+
+
+def filter_records_for_summary(
+    records: list[dict[str, str]],
+    *,
+    run_mode: str,
+) -> tuple[list[dict[str, str]], dict[str, str]]:
+    """按 chat scope + cursor 筛选日志记录。"""
+    scope = _normalize_scope(str(SUMMARY_AGENT_CONFIG.get("summary_chat_scope") or "group"))
+    group_filter_mode = _normalize_group_filter_mode(
+        str(SUMMARY_AGENT_CONFIG.get("summary_group_filter_mode") or "all")
+    )
+    configured_group_ids = SUMMARY_AGENT_CONFIG.get("summary_group_ids")
+    group_id_set = {
+        str(item).strip()
+        for item in (configured_group_ids if isinstance(configured_group_ids, list) else [])
+        if str(item).strip()
+    }
+    cursor_key = f"manual_{scope}"
+    cursor_before = ""
+    normalized_run_mode = str(run_mode or "manual").strip().lower()
+    if normalized_run_mode not in {"manual", "auto"}:
+        normalized_run_mode = "manual"
+
+    use_cursor = normalized_run_mode == "manual"
+    today_str = datetime.now().astimezone().strftime("%Y-%m-%d")
+
+    if use_cursor:
+        cursor_before = load_summary_cursor(cursor_key)
+
+    cursor_dt = _parse_iso_dt(cursor_before) if cursor_before else None
+    filtered_records: list[dict[str, str]] = []
+    latest_dt = cursor_dt
+
+    for record in records:
+        chat_type = normalize_chat_type(record.get("chat_type", "group"))
+        if scope != "all" and chat_type != scope:
+            continue
+
+        group_id = str(record.get("group_id", UNKNOWN_GROUP)).strip() or UNKNOWN_GROUP
+        if chat_type == "group" and group_id_set:
+            if group_filter_mode == "include" and group_id not in group_id_set:
+                continue
+            if group_filter_mode == "exclude" and group_id in group_id_set:
+                continue
+
+        ts = str(record.get("ts", "")).strip()
+        current_dt = _parse_iso_dt(ts)
+        if normalized_run_mode == "auto":
+            if current_dt is None or current_dt.astimezone().strftime("%Y-%m-%d") != today_str:
+                continue
+
+        if use_cursor and cursor_dt is not None:
+            if current_dt is None or current_dt <= cursor_dt:
+                continue
+
+        if current_dt is not None and (latest_dt is None or current_dt > latest_dt):
+            latest_dt = current_dt
+
+        normalized = dict(record)
+        normalized["chat_type"] = chat_type
+        normalized["group_id"] = group_id
+        normalized["message"] = str(record.get("message", "")).strip()
+        filtered_records.append(normalized)
+
+    cursor_after = ""
+    if latest_dt is not None:
+        cursor_after = latest_dt.isoformat(timespec="seconds")
+    elif cursor_before:
+        cursor_after = cursor_before
+
+    return filtered_records, {
+        "run_mode": normalized_run_mode,
+        "scope": scope,
+        "cursor_key": cursor_key,
+        "cursor_before": cursor_before,
+        "cursor_after": cursor_after,
+    }
+
+
+def parse_summary_log_line(line: str) -> tuple[str, str, str, str, str, str]:
+    """解析 summary 日志行，兼容 JSONL 与旧文本格式。"""
+    try:
+        record = json.loads(line)
+        if isinstance(record, dict):
+            return (
+                str(record.get("group_id", UNKNOWN_GROUP)),
+                str(record.get("user_id", UNKNOWN_USER)),
+                str(record.get("user_name", UNKNOWN_USER)),
+                str(record.get("ts", "")),
+                str(record.get("cleaned_message", record.get("raw_message", ""))).strip(),
+                normalize_chat_type(record.get("chat_type", "group")),
+            )
+    except json.JSONDecodeError:
+        pass
+
+    if ":" not in line:
+        return UNKNOWN_GROUP, UNKNOWN_USER, UNKNOWN_USER, "", line.strip(), "group"
+
+    prefix, message = line.split(":", 1)
+    if "|" in prefix:
+        group_id, user_id = prefix.split("|", 1)
+        normalized_user_id = user_id.strip() or UNKNOWN_USER
+        return group_id.strip() or UNKNOWN_GROUP, normalized_user_id, normalized_user_id, "", message.strip(), "group"
+
+    return prefix.strip() or UNKNOWN_GROUP, UNKNOWN_USER, UNKNOWN_USER, "", message.strip(), "group"
+
+
+def load_summary_cursor(cursor_key: str) -> str:
+    if not os.path.exists(SUMMARY_CURSOR_PATH):
+        return ""
+    try:
+        with open(SUMMARY_CURSOR_PATH, "r", encoding="utf-8") as file:
+            payload = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return ""
+    if not isinstance(payload, dict):
+        return ""
+    return str(payload.get(cursor_key, "")).strip()
+
+
+def save_summary_cursor(cursor_key: str, ts: str) -> None:
+    os.makedirs(os.path.dirname(SUMMARY_CURSOR_PATH), exist_ok=True)
+    payload: dict[str, Any] = {}
+    if os.path.exists(SUMMARY_CURSOR_PATH):
+        try:
+            with open(SUMMARY_CURSOR_PATH, "r", encoding="utf-8") as file:
+                existing = json.load(file)
+            if isinstance(existing, dict):
+                payload.update(existing)
+        except (OSError, json.JSONDecodeError):
+            payload = {}
+    payload[cursor_key] = ts
+    with open(SUMMARY_CURSOR_PATH, "w", encoding="utf-8") as file:
+        json.dump(payload, file, ensure_ascii=False, indent=2)
+
+
+def _split_source_messages(
+    *,
+    chat_type: str,
+    group_id: str,
+    user_id: str,
+    user_name: str,
+    messages: list[tuple[str, str]],
+    chunk_size: int,
+) -> list[str]:
+    safe_name = (user_name or UNKNOWN_USER).replace("]", "）")
+    header = (
+        f"[chat:{normalize_chat_type(chat_type)}]"
+        f"[group:{group_id}][user:{user_id}][name:{safe_name}]"
+    )
+    max_body_chars = max(1, chunk_size - len(header) - 1)
+    chunks: list[str] = []
+    current_body = ""
+
+    for ts, message in messages:
+        dt = _parse_iso_dt(ts)
+        time_prefix = dt.strftime("%H:%M") if dt is not None else ""
+        normalized_message = f"[{time_prefix}] {message}" if time_prefix else message
+        remaining = normalized_message
+        while remaining:
+            room = max_body_chars if not current_body else max_body_chars - len(current_body) - 1
+            if room <= 0:
+                chunks.append(f"{header}\n{current_body}")
+                current_body = ""
+                continue
+
+            part = remaining[:room]
+            remaining = remaining[room:]
+            current_body = part if not current_body else f"{current_body}\n{part}"
+
+            if remaining:
+                chunks.append(f"{header}\n{current_body}")
+                current_body = ""
+
+    if current_body:
+        chunks.append(f"{header}\n{current_body}")
+    if not chunks:
+        chunks.append(header)
+    return chunks
+
+
+def _merge_small_chunks(grouped_chunks: list[str], chunk_size: int) -> list[str]:
+    merged: list[str] = []
+    current = ""
+    for block in grouped_chunks:
+        if not current:
+            current = block
+            continue
+        candidate = f"{current}\n\n{block}"
+        if len(candidate) <= chunk_size:
+            current = candidate
+        else:
+            merged.append(current)
+            current = block
+    if current:
+        merged.append(current)
+    return merged
+
+
+def normalize_chat_type(chat_type: Any) -> str:
+    text = str(chat_type or "").strip().lower()
+    if text in {"group", "private"}:
+        return text
+    return "group"
+
+
+def _normalize_scope(scope: str) -> str:
+    value = str(scope or "").strip().lower()
+    if value in {"group", "private", "all"}:
+        return value
+    return "group"
+
+
+def _normalize_group_filter_mode(mode: str) -> str:
+    value = str(mode or "").strip().lower()
+    if value in {"all", "include", "exclude"}:
+        return value
+    return "all"
+
+
+def _parse_iso_dt(ts: str | None) -> datetime | None:
+    if not ts:
+        return None
+    try:
+        normalized = str(ts).replace("Z", "+00:00")
+        dt = datetime.fromisoformat(normalized)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
+        return dt
+    except ValueError:
+        return None
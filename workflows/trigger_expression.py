@@ -0,0 +1,203 @@
+"""触发表达式（trigger_mode）编译：解析为 AST 后按表达式缓存，求值时短路，且同一层的条件按开销从低到高排列。"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Union
+import re
+
+
+# 原子条件的相对开销：同一个 && / || 内先算便宜的条件，ai_decide（LLM 调用）最后
+TRIGGER_CONDITION_COSTS: dict[str, int] = {"always": 0, "keyword": 1, "at_bot": 2, "ai_decide": 100}
+
+_TOKEN_PATTERN = re.compile(r"\s*(?:(&&|\|\||!|\(|\))|([A-Za-z_][A-Za-z0-9_]*))")
+
+
+@dataclass(frozen=True)
+class TriggerCondition:
+    name: str
+
+
+@dataclass(frozen=True)
+class TriggerNot:
+    operand: TriggerNode
+
+
+@dataclass(frozen=True)
+class TriggerAnd:
+    operands: tuple[TriggerNode, ...]
+
+
+@dataclass(frozen=True)
+class TriggerOr:
+    operands: tuple[TriggerNode, ...]
+
+
+TriggerNode = Union[TriggerCondition, TriggerNot, TriggerAnd, TriggerOr]
+
+# await resolve(name) -> (是否满足, 原因)
+AsyncConditionResolver = Callable[[str], Awaitable[tuple[bool, str]]]
+
+
+def _tokenize(expression: str) -> list[str]:
+    tokens: list[str] = []
+    position = 0
+    text = expression.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise ValueError(f"无法识别的字符 {text[position:].lstrip()[:1]!r}")
+        tokens.append(match.group(1) or match.group(2))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降：|| 优先级最低，其次 &&，! 最高；同类运算符连续出现时展平为一个节点。"""
+
+    def __init__(self, tokens: list[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> str | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise ValueError("表达式不完整")
+        self.position += 1
+        return token
+
+    def parse(self) -> TriggerNode:
+        if not self.tokens:
+            raise ValueError("表达式为空")
+        node = self._or()
+        if self._peek() is not None:
+            raise ValueError(f"多余的 {self._peek()!r}")
+        return node
+
+    def _or(self) -> TriggerNode:
+        operands = [self._and()]
+        while self._peek() == "||":
+            self._take()
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else TriggerOr(tuple(operands))
+
+    def _and(self) -> TriggerNode:
+        operands = [self._unary()]
+        while self._peek() == "&&":
+            self._take()
+            operands.append(self._unary())
+        return operands[0] if len(operands) == 1 else TriggerAnd(tuple(operands))
+
+    def _unary(self) -> TriggerNode:
+        if self._peek() == "!":
+            self._take()
+            return TriggerNot(self._unary())
+        token = self._take()
+        if token == "(":
+            node = self._or()
+            if self._take() != ")":
+                raise ValueError("括号不匹配")
+            return node
+        if token in {"&&", "||", ")"}:
+            raise ValueError(f"意外的 {token!r}")
+        return TriggerCondition(token)
+
+
+def _cost(node: TriggerNode) -> int:
+    if isinstance(node, TriggerCondition):
+        return TRIGGER_CONDITION_COSTS.get(node.name, max(TRIGGER_CONDITION_COSTS.values()))
+    if isinstance(node, TriggerNot):
+        return _cost(node.operand)
+    return sum(_cost(operand) for operand in node.operands)
+
+
+def _cheapest_first(node: TriggerNode) -> TriggerNode:
+    """&& / || 满足交换律（条件判定没有副作用），按开销稳定排序，开销相同保持原顺序。"""
+    if isinstance(node, TriggerNot):
+        return TriggerNot(_cheapest_first(node.operand))
+    if isinstance(node, (TriggerAnd, TriggerOr)):
+        operands: list[TriggerNode] = []
+        for operand in (_cheapest_first(operand) for operand in node.operands):
+            # (a || b) || c 这类同类嵌套展平，让排序覆盖整层
+            if type(operand) is type(node):
+                operands.extend(operand.operands)
+            else:
+                operands.append(operand)
+        return type(node)(tuple(sorted(operands, key=_cost)))
+    return node
+
+
+async def _aevaluate(node: TriggerNode, lookup: Callable[[str], Awaitable[bool]]) -> bool:
+    if isinstance(node, TriggerCondition):
+        return await lookup(node.name)
+    if isinstance(node, TriggerNot):
+        return not await _aevaluate(node.operand, lookup)
+    if isinstance(node, TriggerAnd):
+        for operand in node.operands:
+            if not await _aevaluate(operand, lookup):
+                return False
+        return True
+    for operand in node.operands:
+        if await _aevaluate(operand, lookup):
+            return True
+    return False
+
+
+@dataclass(frozen=True)
+class CompiledTrigger:
+    """编译后的 trigger_mode；error 非空时表示表达式无效，求值直接返回 (False, error)。"""
+
+    expression: str
+    root: TriggerNode | None
+    error: str = ""
+
+    def _result(self, matched: bool, values: dict[str, bool], reasons: dict[str, str]) -> tuple[bool, str]:
+        if matched:
+            return True, f"命中表达式: {self.expression}"
+        # 只列出实际求值过的条件，被短路跳过的条件不出现
+        reason_text = ", ".join([f"{name}={values[name]}" for name in sorted(values)])
+        detail_text = "; ".join([f"{name}:{reasons[name]}" for name in sorted(reasons)])
+        return False, f"表达式未命中: {reason_text}; {detail_text}"
+
+    async def aevaluate(self, resolve: AsyncConditionResolver) -> tuple[bool, str]:
+        """按短路语义求值，每个条件最多调用一次 resolve（ai_decide 走 ainvoke）。"""
+        if self.root is None:
+            return False, self.error
+        values: dict[str, bool] = {}
+        reasons: dict[str, str] = {}
+
+        async def lookup(name: str) -> bool:
+            if name not in values:
+                value, reason = await resolve(name)
+                values[name] = bool(value)
+                reasons[name] = reason
+            return values[name]
+
+        return self._result(await _aevaluate(self.root, lookup), values, reasons)
+
+
+@lru_cache(maxsize=256)
+def compile_trigger_expression(expression: str, conditions: frozenset[str]) -> CompiledTrigger:
+    """解析 trigger_mode 并缓存结果（规则配置不变时每个表达式只解析一次）；conditions 为允许的原子条件。"""
+    try:
+        tokens = _tokenize(expression)
+    except ValueError as error:
+        return CompiledTrigger(expression=expression, root=None, error=f"trigger_mode 解析失败: {error}")
+    invalid_tokens = sorted(
+        {token for token in tokens if token not in {"&&", "||", "!", "(", ")"} and token not in conditions}
+    )
+    if invalid_tokens:
+        return CompiledTrigger(
+            expression=expression,
+            root=None,
+            error="trigger_mode 包含未知条件: " + ",".join(invalid_tokens),
+        )
+    try:
+        root = _Parser(tokens).parse()
+    except ValueError as error:
+        return CompiledTrigger(expression=expression, root=None, error=f"trigger_mode 解析失败: {error}")
+    return CompiledTrigger(expression=expression, root=_cheapest_first(root))